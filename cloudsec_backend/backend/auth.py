@@ -1,32 +1,70 @@
+import base64
+import hashlib
+import json
 import os
+import time
 import requests
 from fastapi import HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from fastapi import Depends
 
+from .metrics import track_call, set_tenant
+from .resilience import FALLBACK_MAX_AGE, DependencyUnavailable, FallbackCache, breaker, time_left
+
 load_dotenv()  # Loads variables from .env
 
 auth_scheme = HTTPBearer()
 
 SUPABASE_PROJECT_REF = os.getenv("SUPABASE_PROJECT_REF")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
+# Defaults to the project's hosted auth API; point it at a stand-in for load tests
+SUPABASE_AUTH_URL = os.getenv("SUPABASE_AUTH_URL") or f"https://{SUPABASE_PROJECT_REF}.supabase.co/auth/v1"
+SUPABASE_AUTH_TIMEOUT = float(os.getenv("SUPABASE_AUTH_TIMEOUT", "5"))
+# Seconds a verified token is still accepted while the auth API is unavailable (0: never)
+AUTH_FALLBACK_MAX_AGE = float(os.getenv("AUTH_FALLBACK_MAX_AGE", str(min(FALLBACK_MAX_AGE, 60))))
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
-    if credentials is None:
-        raise HTTPException(status_code=401, detail="Missing credentials")
+# Tokens verified recently are still accepted while the auth API is unavailable,
+# unless their own expiry (the JWT exp claim) has passed since
+_verified_users = FallbackCache("supabase_auth", max_age=AUTH_FALLBACK_MAX_AGE)
 
-    token = credentials.credentials
+
+def _unavailable(error):
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def _token_expired(token):
+    """True unless the token is a JWT whose exp claim is still in the future (the signature is not checked)."""
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+        return float(claims["exp"]) <= time.time()
+    except (IndexError, KeyError, TypeError, ValueError):
+        return True
+
+
+def _get_user(token):
     headers = {
         "Authorization": f"Bearer {token}",
         "apikey": SUPABASE_ANON_KEY
     }
 
-    response = requests.get(
-        f"https://{SUPABASE_PROJECT_REF}.supabase.co/auth/v1/user",
-        headers=headers
-    )
+    timeout = time_left(SUPABASE_AUTH_TIMEOUT, "supabase_auth")
+    try:
+        with breaker("supabase_auth").guard(_unavailable) as call:
+            with track_call("supabase_auth", "get_user"):
+                response = requests.get(
+                    f"{SUPABASE_AUTH_URL}/user",
+                    headers=headers,
+                    timeout=timeout
+                )
+            if response.status_code >= 500:
+                call.failed()
+    except requests.exceptions.RequestException as e:
+        raise DependencyUnavailable("supabase_auth", f"Auth service unavailable: {e}") from e
 
+    if response.status_code >= 500:
+        raise DependencyUnavailable("supabase_auth", f"Auth service error {response.status_code}")
     if response.status_code != 200:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
@@ -34,5 +72,23 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme
 
     if "id" not in user_info:
         raise HTTPException(status_code=400, detail="User ID not found in token")
+    return user_info
+
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+    if credentials is None:
+        raise HTTPException(status_code=401, detail="Missing credentials")
+
+    token = credentials.credentials
+    key = hashlib.sha256(token.encode()).hexdigest()
+    if _token_expired(token):
+        # Only the auth API may accept it now: never from the fallback
+        _verified_users.discard(key)
+    try:
+        user_info, _ = _verified_users.call(key, lambda: _get_user(token))
+    except HTTPException:
+        _verified_users.discard(key)
+        raise
 
+    set_tenant(user_info["id"])
     return user_info
\ No newline at end of file
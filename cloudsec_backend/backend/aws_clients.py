@@ -0,0 +1,237 @@
+"""
+Reusable boto3 sessions and clients.
+
+Creating a boto3 client loads the service model and costs tens of
+milliseconds and a few MB each time, so sessions are cached per credential
+set (default chain, static keys, or an assumed role) and clients per service,
+region and pool size. Assumed-role sessions are evicted shortly before their
+credentials expire and re-assumed on next use.
+
+    factory = get_client_factory()
+    session = factory.assume_role(role_arn)          # cached until expiry
+    ec2 = session.client("ec2")                      # cached per region
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from .metrics import instrument_boto3_session
+from .resilience import breaker, time_left
+
+AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
+# Match the widest concurrent fan-out over one client (S3 posture collection)
+AWS_MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", os.getenv("S3_COLLECTOR_WORKERS", "32")))
+AWS_SESSION_CACHE_SIZE = int(os.getenv("AWS_SESSION_CACHE_SIZE", "256"))
+# Re-assume roles this many seconds before their credentials expire
+AWS_CREDENTIAL_REFRESH_MARGIN = int(os.getenv("AWS_CREDENTIAL_REFRESH_MARGIN", "300"))
+# Static keys passed with a session token are temporary but carry no expiry; cap their lifetime
+AWS_STATIC_SESSION_TTL = int(os.getenv("AWS_STATIC_SESSION_TTL", "3600"))
+# botocore defaults both to 60 s
+AWS_CONNECT_TIMEOUT = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+AWS_READ_TIMEOUT = float(os.getenv("AWS_READ_TIMEOUT", "30"))
+
+
+def _check_deadline(model, **kwargs):
+    # before-call hook: no AWS call starts once the request's deadline has passed
+    time_left(None, model.service_model.endpoint_prefix)
+
+
+def _sts_unavailable(error):
+    """Outages and throttling count against the STS breaker; AccessDenied and friends do not."""
+    from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+
+    if isinstance(error, (ConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return status >= 500 or error.response.get("Error", {}).get("Code") in ("Throttling", "ThrottlingException")
+    return False
+
+
+class CachedSession:
+    """
+    Wraps a boto3.Session: same client() call, but clients are created once
+    per (service, region, pool size, client options) and shared. Client
+    creation is serialized because boto3 sessions are not thread-safe; the
+    clients themselves are.
+    """
+
+    def __init__(self, session, expires_at=None, identity_arn=None):
+        self.cache_key = None
+        self.session = session
+        self.expires_at = expires_at
+        self.identity_arn = identity_arn
+        self.region_name = session.region_name
+        self.events = session.events
+        self.events.register("before-call", _check_deadline, unique_id="cloudsec-deadline")
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def expired(self, now=None):
+        return self.expires_at is not None and (now or time.time()) >= self.expires_at
+
+    def client(self, service_name, region_name=None, config=None, **kwargs):
+        from botocore.config import Config
+
+        region = region_name or self.region_name
+        pool_size = getattr(config, "max_pool_connections", None) or AWS_MAX_POOL_CONNECTIONS
+        # endpoint_url and friends select a different endpoint; keep those clients apart
+        key = (service_name, region, pool_size, tuple(sorted(kwargs.items())))
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    base = Config(
+                        max_pool_connections=pool_size, retries={"mode": "adaptive"},
+                        connect_timeout=AWS_CONNECT_TIMEOUT, read_timeout=AWS_READ_TIMEOUT,
+                    )
+                    client = self.session.client(
+                        service_name, region_name=region, config=base.merge(config) if config else base, **kwargs
+                    )
+                    self._clients[key] = client
+        return client
+
+    def client_count(self):
+        return len(self._clients)
+
+
+class ClientFactory:
+    def __init__(self, max_sessions=AWS_SESSION_CACHE_SIZE):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key so concurrent callers assume a role only once
+        self._key_locks = {}
+
+    # -------------------------
+    # Cache plumbing
+    # -------------------------
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return None
+            if entry.expired():
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return entry
+
+    def _store(self, key, entry):
+        entry.cache_key = key
+        with self._lock:
+            self._sessions[key] = entry
+            self._sessions.move_to_end(key)
+            now = time.time()
+            for stale in [k for k, e in self._sessions.items() if e.expired(now)]:
+                del self._sessions[stale]
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def _get_or_create(self, key, create, fresh=False):
+        entry = None if fresh else self._lookup(key)
+        if entry is not None:
+            return entry
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = None if fresh else self._lookup(key)
+            if entry is None:
+                entry = create()
+                self._store(key, entry)
+            with self._lock:
+                self._key_locks.pop(key, None)
+        return entry
+
+    def evict_expired(self):
+        with self._lock:
+            now = time.time()
+            for stale in [k for k, e in self._sessions.items() if e.expired(now)]:
+                del self._sessions[stale]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # -------------------------
+    # Sessions
+    # -------------------------
+    def _new_session(self, **kwargs):
+        import boto3
+
+        return instrument_boto3_session(boto3.Session(region_name=AWS_REGION, **kwargs))
+
+    def default(self):
+        """The default credential chain (env, profile, instance role); botocore refreshes it itself."""
+        return self._get_or_create(("default",), lambda: CachedSession(self._new_session()))
+
+    def from_credentials(self, credentials):
+        """credentials: {"aws_access_key_id", "aws_secret_access_key", "aws_session_token"?}"""
+        token = credentials.get("aws_session_token")
+        fingerprint = hashlib.sha256(
+            "\0".join([credentials["aws_access_key_id"], credentials["aws_secret_access_key"], token or ""]).encode()
+        ).hexdigest()
+
+        def create():
+            return CachedSession(
+                self._new_session(
+                    aws_access_key_id=credentials["aws_access_key_id"],
+                    aws_secret_access_key=credentials["aws_secret_access_key"],
+                    aws_session_token=token,
+                ),
+                expires_at=time.time() + AWS_STATIC_SESSION_TTL if token else None,
+            )
+
+        return self._get_or_create(("static", fingerprint), create)
+
+    def assume_role(self, role_arn, session_name="CloudSecSession", parent=None, fresh=False):
+        """
+        Session for `role_arn` named `session_name`, assumed from `parent`
+        (default credentials if None) and reused until shortly before its
+        credentials expire. fresh=True always calls STS and replaces the
+        cached session, for checks that must see the role's current trust policy.
+        """
+        parent = parent or self.default()
+        key = ("role", role_arn, session_name, getattr(parent, "cache_key", None) or id(parent))
+
+        def create():
+            # Timed by the botocore hooks on the parent session; fails fast while STS is unavailable
+            with breaker("sts").guard(_sts_unavailable):
+                response = parent.client("sts").assume_role(RoleArn=role_arn, RoleSessionName=session_name)
+            creds = response["Credentials"]
+            expiration = creds.get("Expiration")
+            if isinstance(expiration, datetime):
+                expires_at = expiration.replace(tzinfo=expiration.tzinfo or timezone.utc).timestamp()
+            else:
+                expires_at = time.time() + 3600
+            return CachedSession(
+                self._new_session(
+                    aws_access_key_id=creds["AccessKeyId"],
+                    aws_secret_access_key=creds["SecretAccessKey"],
+                    aws_session_token=creds["SessionToken"],
+                ),
+                expires_at=expires_at - AWS_CREDENTIAL_REFRESH_MARGIN,
+                identity_arn=response.get("AssumedRoleUser", {}).get("Arn"),
+            )
+
+        return self._get_or_create(key, create, fresh=fresh)
+
+
+_factory = None
+_factory_lock = threading.Lock()
+
+
+def get_client_factory():
+    global _factory
+    if _factory is None:
+        with _factory_lock:
+            if _factory is None:
+                _factory = ClientFactory()
+    return _factory
@@ -1,71 +1,102 @@
-import boto3
 from botocore.exceptions import ClientError
 import os
 from dotenv import load_dotenv
 
+from .aws_clients import get_client_factory
+from .ec2_exposure import SecurityGroupIndex, fetch_security_groups
+from .iam_graph import IAM_ANALYSIS, analyze_account
+from .s3_collector import collect_s3_posture
+from .resource_model import Inventory
+from .log import get_logger
+
 load_dotenv()
 
+logger = get_logger(__name__)
+
 AWS_REGION = os.getenv("AWS_REGION", "us-east-1")
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY = os.getenv("AWS_SECRET_ACCESS_KEY")
 
+# Keep only the fields policies and dashboards use (see resource_model.py)
+COMPACT_INVENTORY = os.getenv("CLOUDSEC_COMPACT_INVENTORY", "true").lower() == "true"
+# Also keep a compressed, lossless copy of the raw API responses
+RAW_ARCHIVE = os.getenv("CLOUDSEC_RAW_ARCHIVE", "false").lower() == "true"
 
-def assume_role(role_arn, session_name="CloudSecSession"):
+
+def assume_role(role_arn, session_name="CloudSecSession", session=None, fresh=False):
     """
-    Assume a role and return a boto3.Session locked to that role.
+    Assume a role and return a session locked to that role.
+    Pass `session` to assume it from another role (e.g. org management -> member).
+    Sessions and their clients are reused until the role credentials near expiry;
+    pass fresh=True to call STS regardless (validation).
     """
-    sts = boto3.client("sts", region_name=AWS_REGION)
-    response = sts.assume_role(
-        RoleArn=role_arn,
-        RoleSessionName=session_name
-    )
-
-    creds = response["Credentials"]
-
-    # Create a session pinned to assumed role creds
-    return boto3.Session(
-        aws_access_key_id=creds["AccessKeyId"],
-        aws_secret_access_key=creds["SecretAccessKey"],
-        aws_session_token=creds["SessionToken"],
-        region_name=AWS_REGION,
-    )
+    return get_client_factory().assume_role(role_arn, session_name=session_name, parent=session, fresh=fresh)
 
 
 def get_session(credentials: dict = None):
     """
-    Returns a boto3 session (either from credentials or default env vars).
+    Returns a cached session (either from credentials or default env vars).
     """
+    factory = get_client_factory()
     if credentials:
-        return boto3.Session(
-            aws_access_key_id=credentials["aws_access_key_id"],
-            aws_secret_access_key=credentials["aws_secret_access_key"],
-            aws_session_token=credentials.get("aws_session_token"),
-            region_name=AWS_REGION,
-        )
+        return factory.from_credentials(credentials)
+
+    # Keys read at import still apply after clear_default_aws_creds() empties the environment
+    if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY:
+        return factory.from_credentials({
+            "aws_access_key_id": AWS_ACCESS_KEY_ID,
+            "aws_secret_access_key": AWS_SECRET_ACCESS_KEY,
+        })
+    return factory.default()
+
 
-    return boto3.Session(
-        aws_access_key_id=AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=AWS_SECRET_ACCESS_KEY,
-        region_name=AWS_REGION,
-    )
+def new_inventory():
+    return Inventory(keep_raw=RAW_ARCHIVE) if COMPACT_INVENTORY else None
 
 
-def scan_ec2(session):
+def scan_ec2(session, inventory=None):
     ec2 = session.client("ec2")
-    instances = ec2.describe_instances()
-    return instances
+    # Security groups first, so each instance page is joined as it arrives (ec2_exposure.py)
+    try:
+        groups = fetch_security_groups(ec2, inventory)
+    except ClientError as e:
+        logger.warning("security_groups_unavailable", error=str(e))
+        groups = SecurityGroupIndex()
+
+    if inventory is None:
+        instances = ec2.describe_instances()
+        instances["Exposure"] = groups.page_exposure(instances)
+        return instances
+
+    # Convert page by page so the full raw response is never held at once
+    exposure = []
+    for page in ec2.get_paginator("describe_instances").paginate():
+        inventory.add_ec2_page(page)
+        exposure.extend(groups.page_exposure(page))
+    return {**inventory.ec2_document(), "Exposure": exposure}
 
 
-def scan_s3(session):
+def scan_s3(session, inventory=None):
     s3 = session.client("s3")
     buckets = s3.list_buckets()
-    return buckets
+    # Per-bucket posture (region, public access, encryption, versioning)
+    posture = collect_s3_posture(session, buckets.get("Buckets", []))
+    if inventory is None:
+        buckets["s3_buckets"] = posture
+        return buckets
 
+    inventory.add_buckets(posture)
+    return inventory.s3_document()
 
-def scan_iam(session):
+
+def scan_iam(session, inventory=None):
     iam = session.client("iam")
-    users_response = iam.list_users()
-    users = users_response.get("Users", [])
+    if inventory is None:
+        users_response = iam.list_users()
+        users = users_response.get("Users", [])
+    else:
+        users_response = {}
+        users = [u for page in iam.get_paginator("list_users").paginate() for u in page.get("Users", [])]
 
     findings = []
 
@@ -74,6 +105,7 @@ def scan_iam(session):
 
         # Check MFA devices
         mfa_devices = iam.list_mfa_devices(UserName=username).get("MFADevices", [])
+        user["MFA"] = bool(mfa_devices)
         if not mfa_devices:
             findings.append({
                 "resource": username,
@@ -81,10 +113,24 @@ def scan_iam(session):
                 "severity": "Medium"
             })
 
+    # Effective permissions of every user and role (iam_graph.py)
+    permissions = {}
+    if IAM_ANALYSIS:
+        try:
+            permission_findings, summary = analyze_account(iam)
+            permissions = {"permission_findings": permission_findings, "permission_summary": summary}
+        except ClientError as e:
+            permissions = {"permission_findings": [], "permission_summary": {"error": str(e)}}
+
+    if inventory is not None:
+        inventory.add_users(users)
+        return {**inventory.iam_document(), "findings": findings, **permissions}
+
     # Return both IAM users + findings
     return {
         "Users": users,
         "findings": findings,
+        **permissions,
         "ResponseMetadata": users_response.get("ResponseMetadata", {})
     }
 
@@ -95,22 +141,53 @@ def scan_all(credentials=None):
     Scans AWS using provided credentials or default session.
     """
     session = get_session(credentials)
+    inventory = new_inventory()
 
     # Run individual scans
-    ec2 = scan_ec2(session)
-    s3 = scan_s3(session)
-    iam = scan_iam(session)
+    ec2 = scan_ec2(session, inventory)
+    s3 = scan_s3(session, inventory)
+    iam = scan_iam(session, inventory)
 
     # Collect findings
     findings = []
     findings.extend(iam.get("findings", []))  # ✅ pulls IAM findings up
+    findings.extend(iam.get("permission_findings", []))
 
-    return {
+    results = {
         "ec2": ec2,
         "s3": s3,
         "iam": iam,
         "findings": findings  # ✅ now populated
     }
+    if inventory is not None and inventory.raw is not None:
+        results["raw_archive"] = inventory.raw
+    return results
+
+
+def scan_session(session, identity=None):
+    """
+    Runs every scanner against an already authenticated session.
+    """
+    inventory = new_inventory()
+    ec2 = scan_ec2(session, inventory)
+    s3 = scan_s3(session, inventory)
+    iam = scan_iam(session, inventory)
+
+    # Collect findings
+    findings = []
+    findings.extend(iam.get("findings", []))
+    findings.extend(iam.get("permission_findings", []))
+    results = {
+        "ec2": ec2,
+        "s3": s3,
+        "iam": iam,
+        "findings": findings  # 🔥 bubble up findings here
+    }
+    if identity is not None:
+        results = {"account_identity": identity, **results}
+    if inventory is not None and inventory.raw is not None:
+        results["raw_archive"] = inventory.raw
+    return results
 
 
 def scan_all_with_assumed_role(role_arn):
@@ -123,23 +200,9 @@ def scan_all_with_assumed_role(role_arn):
         # Verify identity (no chance of falling back now)
         sts = session.client("sts")
         identity = sts.get_caller_identity()
-        print(f"🔑 Scanning as Account: {identity['Account']} | Arn: {identity['Arn']}")
-
-        # Run individual scans
-        ec2 = scan_ec2(session)
-        s3 = scan_s3(session)
-        iam = scan_iam(session)
-
-        # Collect findings
-        findings = []
-        findings.extend(iam.get("findings", []))
-        return {
-            "account_identity": identity,
-            "ec2": ec2,
-            "s3": s3,
-            "iam": iam,
-            "findings": findings  # 🔥 bubble up findings here
-        }
+        logger.info("scanning_as", account_id=identity["Account"], arn=identity["Arn"])
+
+        return scan_session(session, identity)
 
     except Exception as e:
         raise Exception(f"Failed to scan with assumed role: {str(e)}")
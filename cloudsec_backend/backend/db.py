@@ -1,30 +1,21 @@
-import os
 import json
-import psycopg2
 from datetime import datetime
 from decimal import Decimal
-from dotenv import load_dotenv
 from fastapi.encoders import jsonable_encoder
-from supabase import create_client
-import boto3
 from botocore.exceptions import ClientError
 
+from .metrics import instrumented, track_call
+# Clients are built on first use (see services.py); DB_CONFIG is re-exported for callers
+from .services import DB_CONFIG, db_connection, supabase_client
+from .aws_clients import get_client_factory
+from .ingest import ingest_scan
+from .inventory_index import INVENTORY_INDEX, refresh_after_scan
+from .lifecycle import FINDING_LIFECYCLE, open_counts
+from .log import get_logger
+from .resilience import DependencyUnavailable
+from .singleflight import forget
 
-# Load environment variables
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-DB_CONFIG = {
-    "dbname": os.getenv("SUPABASE_DB"),
-    "user": os.getenv("SUPABASE_USER"),
-    "password": os.getenv("SUPABASE_PASS"),
-    "host": os.getenv("SUPABASE_HOST"),
-    "port": "5432",
-    "sslmode": "require",
-}
+logger = get_logger(__name__)
 
 # -------------------------
 # Helper to make data serializable
@@ -46,13 +37,40 @@ def make_serializable(obj):
 # -------------------------
 # AWS Account Management
 # -------------------------
+_org_columns = None
+
+
+def has_org_columns():
+    """
+    Whether aws_accounts has management_account_id (the optional org-scan
+    migration); checked once per process, so restart after migrating.
+    """
+    global _org_columns
+    if _org_columns is None:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT EXISTS (
+                        SELECT 1 FROM pg_attribute
+                        WHERE attrelid = 'aws_accounts'::regclass
+                          AND attname = 'management_account_id' AND NOT attisdropped
+                    )
+                    """
+                )
+                _org_columns = cur.fetchone()[0]
+    return _org_columns
+
+
+@instrumented("postgres")
 def save_aws_account(user_id, account_id, role_arn):
     """
     Save the AWS account for a user. Ensures only one account exists per user.
     If an account already exists, it updates it with the new account_id and role_arn,
     and also refreshes created_at.
     """
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    org_columns = has_org_columns()
+    with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
@@ -62,110 +80,132 @@ def save_aws_account(user_id, account_id, role_arn):
                 DO UPDATE SET 
                     account_id = EXCLUDED.account_id,
                     role_arn = EXCLUDED.role_arn,
-                    created_at = NOW();
+                    created_at = NOW()
+                RETURNING id;
                 """,
                 [user_id, account_id, role_arn]
             )
+            row_id = cur.fetchone()[0]
+            if org_columns:
+                # Registering an account an org scan found makes it the user's own again
+                cur.execute("UPDATE aws_accounts SET management_account_id = NULL WHERE id = %s;", [row_id])
             conn.commit()
 
 
-def get_user_aws_account(user_id):
+@instrumented("postgres")
+def upsert_org_member_account(user_id, account_id, role_arn, management_account_id):
     """
-    Returns the latest AWS account info for a user, including validation status.
+    Record an organization member account discovered by an org scan and return
+    its row id. Member rows point at the registered management account, so they
+    never replace it as the user's account. An account the user registered
+    directly keeps its own role and stays a registered account.
     """
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 """
-                SELECT id, account_id, role_arn
-                FROM aws_accounts
-                WHERE user_id = %s
-                ORDER BY created_at DESC
-                LIMIT 1;
+                INSERT INTO aws_accounts (user_id, account_id, role_arn, management_account_id)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (user_id, account_id)
+                DO UPDATE SET
+                    role_arn = CASE WHEN aws_accounts.management_account_id IS NULL
+                                    THEN aws_accounts.role_arn ELSE EXCLUDED.role_arn END,
+                    management_account_id = CASE WHEN aws_accounts.management_account_id IS NULL
+                                                 THEN NULL ELSE EXCLUDED.management_account_id END
+                RETURNING id;
                 """,
-                [user_id]
+                [user_id, account_id, role_arn, management_account_id]
             )
-            row = cur.fetchone()
-            if not row:
-                return None
-
-            account_id, role_arn = row[1], row[2]
-            is_valid = False
-            validation_error = None
-
-            try:
-                sts_client = boto3.client("sts")
-                assumed_role = sts_client.assume_role(
-                    RoleArn=role_arn,
-                    RoleSessionName="validation-session"
-                )
-                returned_account_id = assumed_role['AssumedRoleUser']['Arn'].split(":")[4]
-                if returned_account_id == account_id:
-                    is_valid = True
-                else:
-                    validation_error = (
-                        f"Role ARN does not match account ID. Expected {account_id}, got {returned_account_id}"
-                    )
-            except ClientError as e:
-                validation_error = f"Failed to assume role: {e}"
-            except Exception as e:
-                validation_error = f"Unexpected validation error: {e}"
-
-            return {
-                "id": row[0],
-                "account_id": account_id,
-                "role_arn": role_arn,
-                "is_valid": is_valid,
-                "validation_error": validation_error
-            }
+            row_id = cur.fetchone()[0]
+            conn.commit()
+            return row_id
 
-# -------------------------
-# Scans
-# -------------------------
-def save_scan_result(user_id, data, aws_account_id=None, scan_type="unknown"):
-    try:
-        serializable_data = make_serializable(data)
-        json_string = json.dumps(serializable_data)
 
-        with psycopg2.connect(**DB_CONFIG) as conn:
+def get_user_aws_account(user_id):
+    """
+    Returns the latest AWS account info for a user, including validation status.
+    """
+    with track_call("postgres", "get_user_aws_account"):
+        # Org member rows (org-scan migration only) are never the user's account
+        member_filter = "AND management_account_id IS NULL" if has_org_columns() else ""
+        with db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(
-                    """
-                    INSERT INTO scans (user_id, aws_account_id, data, scan_type)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id;
+                    f"""
+                    SELECT id, account_id, role_arn
+                    FROM aws_accounts
+                    WHERE user_id = %s {member_filter}
+                    ORDER BY created_at DESC
+                    LIMIT 1;
                     """,
-                    [user_id, aws_account_id, json_string, scan_type]
+                    [user_id]
                 )
-                scan_id = cur.fetchone()[0]
-                conn.commit()
-                return scan_id
+                row = cur.fetchone()
+    if not row:
+        return None
+
+    account_id, role_arn = row[1], row[2]
+    is_valid = False
+    validation_error = None
+
+    try:
+        # Always a fresh STS call: a cached session would hide a trust policy removed since
+        assumed_role = get_client_factory().assume_role(role_arn, session_name="validation-session", fresh=True)
+        returned_account_id = assumed_role.identity_arn.split(":")[4]
+        if returned_account_id == account_id:
+            is_valid = True
+        else:
+            validation_error = (
+                f"Role ARN does not match account ID. Expected {account_id}, got {returned_account_id}"
+            )
+    except ClientError as e:
+        validation_error = f"Failed to assume role: {e}"
+    except DependencyUnavailable:
+        # STS unavailable says nothing about the account; don't report it as invalid
+        raise
     except Exception as e:
-        print(f"Error saving scan result: {e}")
+        validation_error = f"Unexpected validation error: {e}"
+
+    return {
+        "id": row[0],
+        "account_id": account_id,
+        "role_arn": role_arn,
+        "is_valid": is_valid,
+        "validation_error": validation_error
+    }
+
+# -------------------------
+# Scans
+# -------------------------
+def save_scan_result(user_id, data, aws_account_id=None, scan_type="unknown"):
+    try:
+        document = make_serializable(data)
+        payload = json.dumps(document)
+    except (TypeError, ValueError) as e:
+        logger.warning("scan_result_not_serializable", user_id=user_id, scan_type=scan_type, error=str(e))
         # Save minimal data if serialization fails
-        simplified_data = {
+        document = {
             "scan_type": data.get("scan_type", "unknown"),
             "timestamp": data.get("timestamp", ""),
             "error": f"Failed to serialize full data: {str(e)}"
         }
-        with psycopg2.connect(**DB_CONFIG) as conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    INSERT INTO scans (user_id, aws_account_id, data, scan_type)
-                    VALUES (%s, %s, %s, %s)
-                    RETURNING id;
-                    """,
-                    [user_id, aws_account_id, json.dumps(simplified_data), scan_type]
-                )
-                scan_id = cur.fetchone()[0]
-                conn.commit()
-                return scan_id
+        payload = json.dumps(document)
 
+    # Scan row plus (INGEST_NORMALIZED) findings and resources, in one transaction
+    scan_id = ingest_scan(user_id, document, aws_account_id, scan_type, payload=payload)["scan_id"]
+    if INVENTORY_INDEX and scan_type == "cspm":
+        # Local search index of the tenant's latest resources (inventory_index.py)
+        refresh_after_scan(user_id, aws_account_id, scan_id, document)
+    # This worker's validators and dashboard see the new scan at once (http_cache.py)
+    forget(("scan_version", user_id, "scans"))
+    forget(("dashboard_stats", user_id))
+    return scan_id
 
 
+
+@instrumented("postgres")
 def fetch_user_scan_history(user_id, scan_type=None):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with db_connection() as conn:
         with conn.cursor() as cur:
             query = "SELECT id, data, created_at FROM scans WHERE user_id = %s"
             params = [user_id]
@@ -178,8 +218,9 @@ def fetch_user_scan_history(user_id, scan_type=None):
             cur.execute(query, params)
             rows = cur.fetchall()
             return [{"id": r[0], "data": r[1], "timestamp": r[2].isoformat()} for r in rows]
+@instrumented("postgres")
 def get_dashboard_stats(user_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with db_connection() as conn:
         with conn.cursor() as cur:
             # Total scans
             cur.execute("SELECT COUNT(*) FROM scans WHERE user_id = %s;", [user_id])
@@ -206,15 +247,14 @@ def get_dashboard_stats(user_id):
             cur.execute("""
                 SELECT to_char(created_at::date, 'YYYY-MM-DD') AS date, COUNT(*) AS scans
                 FROM scans
-                WHERE user_id = %s
+                WHERE user_id = %s AND created_at >= current_date - 6
                 GROUP BY date
-                ORDER BY date ASC
-                LIMIT 7;
+                ORDER BY date ASC;
             """, [user_id])
             trend_rows = cur.fetchall()
             trend = [{"date": row[0], "scans": row[1]} for row in trend_rows]
 
-            return {
+            stats = {
                 "total_scans": total_scans,
                 "critical_findings": critical,
                 "medium_findings": medium,
@@ -222,16 +262,48 @@ def get_dashboard_stats(user_id):
                 "trend": trend
             }
 
+    if FINDING_LIFECYCLE:
+        # Unique open findings by severity, from the lifecycle store's open index
+        stats["open_findings"] = open_counts(user_id)
+    return stats
+
+
+# Newest and oldest row per tenant: two reads of the (user_id, created_at) index, no documents
+SCAN_VERSION_QUERIES = {
+    table: f"""
+        SELECT (SELECT id::text || '@' || created_at::text FROM {table}
+                WHERE user_id = %(user_id)s ORDER BY created_at DESC LIMIT 1),
+               (SELECT created_at::text FROM {table}
+                WHERE user_id = %(user_id)s ORDER BY created_at ASC LIMIT 1)
+    """
+    for table in ("scans", "scan_results")
+}
+
+
+@instrumented("postgres")
+def get_scan_version(user_id, table="scans"):
+    """
+    A string that changes whenever the user's rows in `table` do: a new scan
+    changes the newest row, retention the oldest.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(SCAN_VERSION_QUERIES[table], {"user_id": user_id})
+            newest, oldest = cur.fetchone()
+    return f"{newest}/{oldest}"
+
 
+@instrumented("supabase")
 def fetch_scan_history(user_id: str, scan_type: str = None):
-    query = supabase.table("scan_results").select("*").eq("user_id", user_id)
+    query = supabase_client().table("scan_results").select("*").eq("user_id", user_id)
     if scan_type:
         query = query.eq("scan_type", scan_type)
     return query.order("created_at", desc=True).execute()
 
+@instrumented("supabase")
 def update_scan_result_with_aws_account(scan_id: str, aws_account_id: str):
     return (
-        supabase.table("scan_results")
+        supabase_client().table("scan_results")
         .update({"aws_account_id": aws_account_id})
         .eq("id", scan_id)
         .execute()
@@ -239,20 +311,17 @@ def update_scan_result_with_aws_account(scan_id: str, aws_account_id: str):
 
 def validate_aws_account(account_id: str, role_arn: str) -> bool:
     try:
-        sts_client = boto3.client("sts")
-        assumed_role = sts_client.assume_role(
-            RoleArn=role_arn,
-            RoleSessionName="validation-session"
-        )
+        assumed_role = get_client_factory().assume_role(role_arn, session_name="validation-session", fresh=True)
         # Check the returned account matches the provided account_id
-        returned_account_id = assumed_role['AssumedRoleUser']['Arn'].split(":")[4]
+        returned_account_id = assumed_role.identity_arn.split(":")[4]
         return returned_account_id == account_id
     except Exception:
         return False
 
 
+@instrumented("postgres")
 def save_aws_account_clean(user_id, account_id, role_arn):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with db_connection() as conn:
         with conn.cursor() as cur:
             # Delete any old rows for this user
             cur.execute(
@@ -270,8 +339,9 @@ def save_aws_account_clean(user_id, account_id, role_arn):
             conn.commit()
 
 
+@instrumented("postgres")
 def cleanup_invalid_aws_accounts(user_id):
-    with psycopg2.connect(**DB_CONFIG) as conn:
+    with db_connection() as conn:
         with conn.cursor() as cur:
             cur.execute(
                 "DELETE FROM aws_accounts WHERE user_id = %s AND account_id IS NULL;",
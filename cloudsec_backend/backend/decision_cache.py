@@ -0,0 +1,209 @@
+"""
+Policy decision cache.
+
+OPA decisions are pure functions of the policy bundle and the input, so a
+rescan of an unchanged account can reuse the previous answer. Entries are
+keyed by sha256(bundle revision, policy path, canonical projected input).
+
+- Memory tier: size-bounded LRU shared by all requests in the process.
+- Postgres tier (DECISION_CACHE_PG=true): shared across workers and restarts.
+- The bundle revision is a hash of every .rego file; when any of them changes
+  the memory tier is dropped and Postgres rows of older revisions are deleted.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .log import get_logger
+from .metrics import POLICY_CACHE_LOOKUPS, POLICY_CACHE_SAVED_SECONDS, instrumented
+from .resilience import DependencyUnavailable
+from .services import db_connection
+
+logger = get_logger(__name__)
+
+DECISION_CACHE_SIZE = int(os.getenv("DECISION_CACHE_SIZE", "1024"))
+DECISION_CACHE_PG = os.getenv("DECISION_CACHE_PG", "false").lower() in ("1", "true", "yes")
+
+
+class CacheStats:
+    """Hits, misses and OPA time saved for one scan."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.saved_ms = 0.0
+
+    def hit(self, eval_ms, lookup_ms):
+        self.hits += 1
+        self.saved_ms += max(eval_ms - lookup_ms, 0.0)
+
+    def miss(self):
+        self.misses += 1
+
+    def to_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "time_saved_ms": round(self.saved_ms, 1),
+        }
+
+
+class DecisionCache:
+    def __init__(self, policy_dir, max_entries=DECISION_CACHE_SIZE, persistent=DECISION_CACHE_PG):
+        self.policy_dir = policy_dir
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self._entries = OrderedDict()  # key -> (result, eval_ms)
+        self._lock = threading.Lock()
+        self._fingerprint = None
+        self._revision = None
+
+    # -------------------------
+    # Bundle revision
+    # -------------------------
+    def revision(self):
+        """Hash of every .rego file; re-hashed only when a file's mtime or size changes."""
+        try:
+            entries = sorted(
+                (e.name, e.stat().st_mtime_ns, e.stat().st_size)
+                for e in os.scandir(self.policy_dir) if e.name.endswith(".rego")
+            )
+        except FileNotFoundError:
+            entries = []
+        fingerprint = tuple(entries)
+        if fingerprint == self._fingerprint:
+            return self._revision
+
+        digest = hashlib.sha256()
+        for name, _, _ in entries:
+            digest.update(name.encode())
+            with open(os.path.join(self.policy_dir, name), "rb") as f:
+                digest.update(f.read())
+        revision = digest.hexdigest()[:16]
+
+        with self._lock:
+            changed = self._revision is not None and revision != self._revision
+            self._fingerprint, self._revision = fingerprint, revision
+            if changed:
+                self._entries.clear()
+        if changed:
+            logger.info("policy_bundle_changed", revision=revision)
+            if self.persistent:
+                self._pg_purge(revision)
+        return revision
+
+    def key(self, policy_path, payload):
+        """payload: the canonical (sorted keys) JSON of the projected input."""
+        digest = hashlib.sha256()
+        digest.update(self.revision().encode())
+        digest.update(b"\0" + policy_path.encode() + b"\0")
+        digest.update(payload.encode() if isinstance(payload, str) else payload)
+        return digest.hexdigest()
+
+    # -------------------------
+    # Lookups
+    # -------------------------
+    def get(self, key, stats=None):
+        started = time.perf_counter()
+        tier = "memory"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None and self.persistent:
+            entry = self._pg_get(key)
+            tier = "postgres"
+            if entry is not None:
+                self._remember(key, *entry)
+
+        if entry is None:
+            POLICY_CACHE_LOOKUPS.inc(result="miss")
+            if stats is not None:
+                stats.miss()
+            return None
+
+        lookup_ms = (time.perf_counter() - started) * 1000
+        POLICY_CACHE_LOOKUPS.inc(result=f"hit_{tier}")
+        POLICY_CACHE_SAVED_SECONDS.inc(max(entry[1] - lookup_ms, 0.0) / 1000)
+        if stats is not None:
+            stats.hit(entry[1], lookup_ms)
+        return entry[0]
+
+    def put(self, key, policy_path, result, eval_ms):
+        self._remember(key, result, eval_ms)
+        if self.persistent:
+            self._pg_put(key, policy_path, result, eval_ms)
+
+    def _remember(self, key, result, eval_ms):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (result, eval_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -------------------------
+    # Postgres tier
+    # -------------------------
+    def _pg_call(self, operation, sql, params, fetch=False):
+        import psycopg2
+
+        try:
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql, params)
+                    return cur.fetchone() if fetch else None
+        except (psycopg2.Error, DependencyUnavailable) as e:
+            # A broken or unreachable persistent tier only costs hits; never fail the evaluation
+            logger.warning("decision_cache_pg_error", operation=operation, error=str(e))
+            return None
+
+    @instrumented("postgres", "decision_cache_get")
+    def _pg_get(self, key):
+        row = self._pg_call(
+            "get", "SELECT result, eval_ms FROM policy_decisions WHERE cache_key = %s", (key,), fetch=True
+        )
+        return (row[0], row[1]) if row else None
+
+    @instrumented("postgres", "decision_cache_put")
+    def _pg_put(self, key, policy_path, result, eval_ms):
+        self._pg_call(
+            "put",
+            """
+            INSERT INTO policy_decisions (cache_key, bundle_revision, policy, result, eval_ms)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (cache_key) DO NOTHING
+            """,
+            (key, self._revision, policy_path, json.dumps(result), eval_ms),
+        )
+
+    @instrumented("postgres", "decision_cache_purge")
+    def _pg_purge(self, revision):
+        self._pg_call("purge", "DELETE FROM policy_decisions WHERE bundle_revision <> %s", (revision,))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_decision_cache(policy_dir):
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DecisionCache(policy_dir)
+    return _cache
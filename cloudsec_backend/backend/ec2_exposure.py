@@ -0,0 +1,115 @@
+"""
+EC2 internet exposure.
+
+Security groups are fetched once per region (describe_security_groups,
+paginated) and indexed by GroupId. Each group's world-open ingress rules
+(0.0.0.0/0, ::/0) that reach a sensitive port are worked out once, however
+many instances use the group, so joining instances costs one lookup per
+attached group: linear in the instance count.
+
+An instance is exposed when it has a public address and one of its groups,
+on the instance or any of its network interfaces, has such a rule. Each
+exposure is one compact fact, stored as ec2.Exposure for policies/ec2.rego:
+
+    {"InstanceId": "i-...", "GroupId": "sg-...", "Protocol": "tcp", "Ports": "22", "Cidr": "0.0.0.0/0"}
+"""
+import os
+
+from .resource_model import SecurityGroup
+
+# SSH, RDP, databases, caches, search, Docker, Telnet, FTP, SMB, Jupyter
+SENSITIVE_PORTS = tuple(sorted(
+    int(p) for p in os.getenv(
+        "EXPOSURE_SENSITIVE_PORTS",
+        "22,3389,3306,5432,1433,1521,27017,6379,11211,9200,5601,2375,23,21,445,8888",
+    ).split(",") if p.strip()
+))
+WORLD_CIDRS = ("0.0.0.0/0", "::/0")
+PROTOCOLS = {"6": "tcp", "17": "udp"}
+
+
+def _ports(rule):
+    """Port label of a rule, or None when it reaches no sensitive port."""
+    protocol = PROTOCOLS.get(str(rule.protocol), str(rule.protocol))
+    if protocol == "-1":
+        return "0-65535"
+    if protocol not in ("tcp", "udp") or rule.from_port is None:
+        return None
+    low, high = rule.from_port, rule.to_port if rule.to_port is not None else rule.from_port
+    if not any(low <= port <= high for port in SENSITIVE_PORTS):
+        return None
+    return str(low) if low == high else f"{low}-{high}"
+
+
+class SecurityGroupIndex:
+    def __init__(self, groups=()):
+        self.groups = {g.group_id: g for g in groups}
+        self._open = {}
+
+    def __len__(self):
+        return len(self.groups)
+
+    def open_rules(self, group_id):
+        """(protocol, ports, cidr) per world-open rule reaching a sensitive port; memoized per group."""
+        rules = self._open.get(group_id)
+        if rules is None:
+            rules = []
+            group = self.groups.get(group_id)
+            for rule in group.ingress if group else ():
+                ports = _ports(rule)
+                if ports is None:
+                    continue
+                protocol = "all" if str(rule.protocol) == "-1" else PROTOCOLS.get(str(rule.protocol), rule.protocol)
+                rules.extend((protocol, ports, cidr) for cidr in rule.cidrs if cidr in WORLD_CIDRS)
+            rules = self._open[group_id] = tuple(rules)
+        return rules
+
+    def instance_exposure(self, instance):
+        """Exposure facts of one describe_instances instance."""
+        if not _is_public(instance):
+            return []
+        facts = []
+        for group_id in _group_ids(instance):
+            for protocol, ports, cidr in self.open_rules(group_id):
+                facts.append({"InstanceId": instance.get("InstanceId"), "GroupId": group_id,
+                              "Protocol": protocol, "Ports": ports, "Cidr": cidr})
+        return facts
+
+    def page_exposure(self, page):
+        return [
+            fact
+            for reservation in page.get("Reservations", [])
+            for instance in reservation.get("Instances", [])
+            for fact in self.instance_exposure(instance)
+        ]
+
+
+def _group_ids(instance):
+    ids = dict.fromkeys(sg.get("GroupId") for sg in instance.get("SecurityGroups") or ())
+    for interface in instance.get("NetworkInterfaces") or ():
+        ids.update(dict.fromkeys(sg.get("GroupId") for sg in interface.get("Groups") or ()))
+    ids.pop(None, None)
+    return ids
+
+
+def _is_public(instance):
+    if instance.get("PublicIpAddress"):
+        return True
+    return any(
+        (interface.get("Association") or {}).get("PublicIp") or interface.get("Ipv6Addresses")
+        for interface in instance.get("NetworkInterfaces") or ()
+    )
+
+
+def fetch_security_groups(ec2, inventory=None):
+    """Every security group of the client's region, indexed by GroupId."""
+    region = ec2.meta.region_name
+    if inventory is None:
+        return SecurityGroupIndex(
+            SecurityGroup.from_boto(g, region)
+            for page in ec2.get_paginator("describe_security_groups").paginate()
+            for g in page.get("SecurityGroups", [])
+        )
+    for page in ec2.get_paginator("describe_security_groups").paginate():
+        inventory.add_security_groups(page.get("SecurityGroups", []), region)
+    return SecurityGroupIndex(inventory.security_groups)
@@ -0,0 +1,256 @@
+"""
+Streaming exports of scan history and findings.
+
+Rows are read from a server-side (named) Postgres cursor EXPORT_BATCH_SIZE at
+a time and rendered batch by batch, so an export holds one batch in memory
+however many scans the tenant has:
+
+    for chunk in render(stream_rows(*findings_query(user_id, ...)), "csv", FINDING_COLUMNS):
+        ...  # bytes, sent as they are produced
+
+Findings are expanded from each scan's `data` in SQL: the `findings` list
+written by clean_aws_results plus every OPA policy violation.
+"""
+import csv
+import io
+import json
+import os
+import uuid
+
+from .metrics import record_bytes, track_call
+from .services import db_connection
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+SEVERITIES = ("critical", "high", "medium", "low")
+
+SCAN_COLUMNS = ["id", "created_at", "scan_type", "aws_account_id", "finding_count"]
+FINDING_COLUMNS = [
+    "scan_id", "scanned_at", "scan_type", "aws_account_id",
+    "source", "service", "resource", "issue", "severity",
+]
+
+
+class ExportError(ValueError):
+    pass
+
+
+def validate(fmt, severities=None):
+    if fmt not in FORMATS:
+        raise ExportError(f"Unsupported format '{fmt}' (expected one of: {', '.join(FORMATS)})")
+    for severity in severities or []:
+        if severity.lower() not in SEVERITIES:
+            raise ExportError(f"Unknown severity '{severity}' (expected one of: {', '.join(SEVERITIES)})")
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+
+
+# -------------------------
+# Queries
+# -------------------------
+# jsonb_array_elements fails on non-arrays; older scans may lack the keys
+_FINDINGS = """
+    jsonb_array_elements(CASE WHEN jsonb_typeof(s.data::jsonb->'findings') = 'array'
+                              THEN s.data::jsonb->'findings' ELSE '[]'::jsonb END)
+"""
+_VIOLATIONS = """
+    jsonb_each(CASE WHEN jsonb_typeof(s.data::jsonb->'policy_violations') = 'object'
+                    THEN s.data::jsonb->'policy_violations' ELSE '{}'::jsonb END)
+"""
+
+
+def _scan_filters(user_id, start=None, end=None, scan_type=None):
+    clauses, params = ["s.user_id = %s"], [user_id]
+    if start:
+        clauses.append("s.created_at >= %s")
+        params.append(start)
+    if end:
+        clauses.append("s.created_at < %s")
+        params.append(end)
+    if scan_type:
+        clauses.append("s.scan_type = %s")
+        params.append(scan_type)
+    return clauses, params
+
+
+def scans_query(user_id, start=None, end=None, scan_type=None, severities=None, include_data=False):
+    """One row per scan; with severities, only scans holding a finding of those severities."""
+    clauses, params = _scan_filters(user_id, start, end, scan_type)
+    if severities:
+        clauses.append(f"EXISTS (SELECT 1 FROM {_FINDINGS} f WHERE lower(f->>'severity') = ANY(%s))")
+        params.append([s.lower() for s in severities])
+    columns = SCAN_COLUMNS + (["data"] if include_data else [])
+    sql = f"""
+        SELECT s.id, s.created_at, s.scan_type, s.aws_account_id,
+               (SELECT count(*) FROM {_FINDINGS} f) AS finding_count
+               {", s.data" if include_data else ""}
+        FROM scans s
+        WHERE {" AND ".join(clauses)}
+        ORDER BY s.created_at, s.id
+    """
+    return sql, params, columns
+
+
+def findings_query(user_id, start=None, end=None, scan_type=None, severities=None):
+    """One row per finding or policy violation of the matching scans."""
+    clauses, params = _scan_filters(user_id, start, end, scan_type)
+    if severities:
+        clauses.append("lower(f.severity) = ANY(%s)")
+        params.append([s.lower() for s in severities])
+    # Policy violations are plain messages; /policy/violations reports them as Medium
+    sql = f"""
+        SELECT s.id, s.created_at, s.scan_type, s.aws_account_id,
+               f.source, f.service, f.resource, f.issue, f.severity
+        FROM scans s
+        CROSS JOIN LATERAL (
+            -- CWPP findings carry type / message instead (findings.finding_rows)
+            SELECT 'finding' AS source,
+                   CASE WHEN e->>'issue' IS NULL AND e->>'type' IS NOT NULL
+                        THEN coalesce(e->>'service', 'CWPP') ELSE e->>'service' END AS service,
+                   CASE WHEN e->>'issue' IS NULL AND e->>'type' IS NOT NULL
+                        THEN e->>'message' ELSE e->>'resource' END AS resource,
+                   coalesce(e->>'issue', e->>'type') AS issue, e->>'severity' AS severity
+            FROM {_FINDINGS} e
+            UNION ALL
+            SELECT 'policy', pv.key, v->>'resource',
+                   CASE WHEN jsonb_typeof(v) = 'string' THEN v #>> '{{}}' ELSE v->>'description' END,
+                   coalesce(v->>'severity', 'Medium')
+            FROM {_VIOLATIONS} pv
+            CROSS JOIN LATERAL jsonb_array_elements(
+                CASE WHEN jsonb_typeof(pv.value) = 'array' THEN pv.value ELSE '[]'::jsonb END) v
+        ) f
+        WHERE {" AND ".join(clauses)}
+        ORDER BY s.created_at, s.id
+    """
+    return sql, params, FINDING_COLUMNS
+
+
+def stream_rows(sql, params, batch_size=None):
+    """
+    Yield lists of row tuples from a named cursor; Postgres keeps the result
+    set and sends batch_size rows per round trip. The pooled connection is
+    held until the generator is exhausted or closed.
+    """
+    batch_size = batch_size or EXPORT_BATCH_SIZE
+    with track_call("postgres", "export"):
+        with db_connection() as conn:
+            with conn.cursor(name=f"export_{uuid.uuid4().hex}") as cur:
+                cur.itersize = batch_size
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+
+# -------------------------
+# Renderers
+# -------------------------
+def _value(value):
+    if value is None:
+        return None
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (int, float, str, bool)):
+        return value
+    return str(value)
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def render_csv(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows([_value(v) for v in row] for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def render_ndjson(batches, columns):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+        ).encode()
+
+
+class _DrainableSink:
+    """Write-only file for ParquetWriter whose bytes are handed out as they are written."""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def render_parquet(batches, columns):
+    """One row group per batch; every column is written as a string except finding_count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.int64() if c == "finding_count" else pa.string()) for c in columns])
+    sink = _DrainableSink()
+    writer = pq.ParquetWriter(sink, schema, compression="snappy")
+    try:
+        for rows in batches:
+            arrays = []
+            for i, column in enumerate(columns):
+                values = [row[i] for row in rows]
+                if column != "finding_count":
+                    values = [None if v is None else str(_value(v)) for v in values]
+                arrays.append(pa.array(values, type=schema.field(column).type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            data = sink.drain()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+RENDERERS = {"csv": render_csv, "ndjson": render_ndjson, "parquet": render_parquet}
+
+
+def render(batches, fmt, columns):
+    """Encode row batches as `fmt`, yielding bytes; counts what is sent to the client."""
+    for chunk in RENDERERS[fmt](batches, columns):
+        if chunk:
+            record_bytes("export", "sent", len(chunk))
+            yield chunk
@@ -0,0 +1,87 @@
+"""
+Row views of a stored scan document.
+
+A scan is saved as one JSON document; these generators flatten it into the
+rows of the normalized tables (scan_findings, scan_resources) without
+copying the document. Both accept the current and the legacy layouts
+(ec2_instances / iam_users nesting).
+
+Fingerprints are short stable hashes of what identifies a finding or a
+resource, so two scans can be compared as sets of keys.
+"""
+import hashlib
+import json
+
+
+def fingerprint(*parts):
+    """16 hex chars of blake2b over the parts; None and "" hash alike."""
+    raw = "\x1f".join("" if p is None else str(p) for p in parts)
+    return hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+
+def finding_key(service, resource, issue):
+    # Policy messages name their resource, so (service, resource, issue) identifies a finding
+    return fingerprint((service or "").lower(), resource, issue)
+
+
+def tenant_finding_key(user_id, aws_account_id, service, resource, issue):
+    # The same finding seen by two tenants, or in two accounts of one tenant, is two findings
+    return fingerprint(user_id, aws_account_id, (service or "").lower(), resource, issue)
+
+
+def resource_key(resource_type, resource_id):
+    return fingerprint(resource_type, resource_id)
+
+
+def _section(data, name, legacy_key):
+    section = data.get(name) or {}
+    return section.get(legacy_key, section) if isinstance(section, dict) else {}
+
+
+def finding_rows(data):
+    """(source, service, resource, issue, severity) per finding and OPA policy violation."""
+    for f in data.get("findings") or []:
+        if not isinstance(f, dict):
+            continue
+        if f.get("issue") is None and f.get("type") is not None:
+            # CWPP findings (cwpp/runtime_scanner.py) are a type and a message naming what was found
+            yield "finding", f.get("service") or "CWPP", f.get("message"), f.get("type"), f.get("severity")
+        else:
+            yield "finding", f.get("service"), f.get("resource"), f.get("issue"), f.get("severity")
+
+    violations = data.get("policy_violations") or {}
+    if isinstance(violations, dict):
+        for service, items in violations.items():
+            for v in items or []:
+                # Policies return plain messages; /policy/violations reports them as Medium
+                if isinstance(v, dict):
+                    yield ("policy", service, v.get("resource"), v.get("description") or v.get("policy"),
+                           v.get("severity") or "Medium")
+                else:
+                    yield "policy", service, None, str(v), "Medium"
+
+
+def _tag(tags, key):
+    for tag in tags or []:
+        if tag.get("Key") == key:
+            return tag.get("Value")
+    return None
+
+
+def resource_rows(data):
+    """(resource_type, resource_id, region, name, attributes JSON) per scanned resource."""
+    ec2 = _section(data, "ec2", "ec2_instances")
+    for reservation in ec2.get("Reservations", []) if isinstance(ec2, dict) else []:
+        for inst in reservation.get("Instances", []):
+            zone = (inst.get("Placement") or {}).get("AvailabilityZone")
+            yield ("ec2_instance", inst.get("InstanceId"), zone[:-1] if zone else None,
+                   _tag(inst.get("Tags"), "Name"), json.dumps(inst, default=str))
+
+    buckets = (data.get("s3") or {}).get("s3_buckets", [])
+    for bucket in buckets if isinstance(buckets, list) else []:
+        yield "s3_bucket", bucket.get("Name"), bucket.get("Region"), bucket.get("Name"), json.dumps(bucket, default=str)
+
+    iam = _section(data, "iam", "iam_users")
+    for user in iam.get("Users", []) if isinstance(iam, dict) else []:
+        yield ("iam_user", user.get("Arn") or user.get("UserName"), None, user.get("UserName"),
+               json.dumps(user, default=str))
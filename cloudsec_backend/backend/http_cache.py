@@ -0,0 +1,89 @@
+"""
+Conditional GETs for the endpoints the dashboard polls.
+
+/dashboard/stats, /results/history-multi and /policy/violations only change
+when the tenant's scans do. Their ETag is derived from the tenant's scan
+version (db.get_scan_version: newest and oldest scan, two index reads) plus
+the request path and query, so a poll whose If-None-Match still matches is
+answered 304 before any scan document is read.
+
+    version = scan_version(user_id)
+    etag = make_etag(request, user_id, version)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    ...
+    set_cache_headers(response, etag)
+
+The version must be read before the data it labels, so an ETag never
+claims a newer state than its body. The lookup is coalesced per tenant for
+the "scan_version" join window (SINGLEFLIGHT_JOIN_WINDOW_SCAN_VERSION) and
+forgotten when this worker saves a scan; another worker may answer 304 for
+up to that window after a scan elsewhere. Responses are per user:
+Cache-Control is private and varies on Authorization. ETags are weak since
+compression changes the bytes.
+"""
+import os
+
+from fastapi import Request, Response
+
+from .db import get_scan_version
+from .findings import fingerprint
+from .log import get_logger
+from .resilience import DependencyUnavailable
+from .singleflight import coalesce
+
+logger = get_logger(__name__)
+
+HTTP_ETAGS = os.getenv("HTTP_ETAGS", "true").lower() in ("1", "true", "yes")
+# Seconds a browser may reuse a response without revalidating (0: revalidate every time)
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+
+def scan_version(user_id, table="scans"):
+    """The tenant's version of `table` (scans or scan_results); None when disabled or unavailable."""
+    if not HTTP_ETAGS:
+        return None
+    try:
+        return coalesce(("scan_version", user_id, table), lambda: get_scan_version(user_id, table))
+    except DependencyUnavailable as e:
+        # The endpoint itself decides how to answer without Postgres (fallback, 503)
+        logger.debug("scan_version_unavailable", user_id=user_id, error=str(e))
+    except Exception as e:
+        # Validators are an optimization: answer in full without one
+        logger.warning("scan_version_failed", user_id=user_id, table=table, error=str(e))
+    return None
+
+
+def make_etag(request: Request, user_id, version, *parts):
+    """Weak ETag of this request at `version` (and `parts`, anything else the body depends on)."""
+    if version is None:
+        return None
+    query = "&".join(sorted(f"{k}={v}" for k, v in request.query_params.multi_items()))
+    return f'W/"{fingerprint(request.url.path, query, user_id, version, *parts)}"'
+
+
+def etag_matches(request: Request, etag):
+    if etag is None:
+        return False
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are the same validator
+    tags = {t.strip().removeprefix("W/") for t in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def _headers(etag):
+    cache_control = f"private, max-age={HTTP_CACHE_MAX_AGE}" if HTTP_CACHE_MAX_AGE else "private, no-cache"
+    return {"ETag": etag, "Cache-Control": cache_control, "Vary": "Authorization"}
+
+
+def not_modified(etag):
+    return Response(status_code=304, headers=_headers(etag))
+
+
+def set_cache_headers(response: Response, etag):
+    if etag is not None:
+        response.headers.update(_headers(etag))
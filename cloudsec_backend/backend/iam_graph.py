@@ -0,0 +1,291 @@
+"""
+IAM effective permissions.
+
+The account's users, groups, roles and policies come from one paginated
+GetAccountAuthorizationDetails call and are held as a graph:
+
+    user  -> inline policies, attached managed policies, groups
+    group -> inline policies, attached managed policies
+    role  -> inline policies, attached managed policies
+
+A principal's effective grants are the union of its own policies and its
+groups', intersected with its permissions boundary (`*` under an `ec2:*`
+boundary is `ec2:*`). A boundary policy the account details do not include
+(an AWS managed policy nothing else attaches) is not a deny-all: the
+principal is analysed without it and its finding notes the boundary as
+unresolved. Each managed policy and each
+group is analysed once however many principals share it, so an account costs
+about as much as its distinct policies, not its principals.
+
+Only grants on every resource are considered. They are flagged as
+admin-equivalent (any action, iam:*, or an action that lets the principal
+grant itself more) or wildcard (service:*, NotAction), unless an
+unconditional Deny covers them. Conditions never clear an Allow: a
+conditional admin grant is still reported.
+"""
+import json
+import os
+from fnmatch import fnmatchcase
+from urllib.parse import unquote
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+IAM_ANALYSIS = os.getenv("IAM_ANALYSIS", "true").lower() in ("1", "true", "yes")
+
+# Each lets a principal attach or write a policy granting itself anything
+ESCALATION_ACTIONS = (
+    "iam:attachgrouppolicy", "iam:attachrolepolicy", "iam:attachuserpolicy",
+    "iam:putgrouppolicy", "iam:putrolepolicy", "iam:putuserpolicy",
+    "iam:createpolicyversion", "iam:setdefaultpolicyversion", "iam:addusertogroup",
+    "iam:updateassumerolepolicy",
+)
+
+# Roles AWS creates and owns; their broad managed policies are not findings
+SERVICE_ROLE_PATH = "/aws-service-role/"
+
+
+class Grants:
+    """Flagged actions (lowercase patterns) of one policy, group or principal."""
+    __slots__ = ("admin", "wildcard", "denied")
+
+    def __init__(self, admin=frozenset(), wildcard=frozenset(), denied=frozenset()):
+        self.admin = admin
+        self.wildcard = wildcard
+        self.denied = denied
+
+    def __bool__(self):
+        return bool(self.admin or self.wildcard or self.denied)
+
+    @classmethod
+    def union(cls, grants):
+        admin, wildcard, denied = set(), set(), set()
+        for g in grants:
+            admin |= g.admin
+            wildcard |= g.wildcard
+            denied |= g.denied
+        return cls(frozenset(admin), frozenset(wildcard), frozenset(denied))
+
+    def patterns(self):
+        return self.admin | self.wildcard
+
+    def effective(self, boundary=None):
+        """Flagged actions not covered by a Deny, each narrowed to what the boundary allows."""
+        if boundary is None:
+            kept = [(p, p in self.admin) for p in self.patterns()]
+        else:
+            # Each pair keeps the narrower pattern, classified as the grant or boundary it came from
+            kept = []
+            for grant in self.patterns():
+                for bound in boundary.patterns():
+                    action = _intersect(grant, bound)
+                    if action is not None:
+                        kept.append((action, action in self.admin if action == grant else action in boundary.admin))
+
+        admin, wildcard = set(), set()
+        for action, is_admin in kept:
+            if not any(fnmatchcase(action, d) for d in self.denied):
+                (admin if is_admin else wildcard).add(action)
+        return Grants(frozenset(admin), frozenset(wildcard - admin))
+
+
+def _excluded(pattern):
+    return pattern[len("notaction:"):].split(",")
+
+
+def _intersect(grant, bound):
+    """The narrower of two action patterns when one contains the other, else None."""
+    if fnmatchcase(grant, bound):
+        return grant
+    if fnmatchcase(bound, grant):
+        return bound
+    # NotAction grants: everything but their exclusions
+    if bound.startswith("notaction:") and not grant.startswith("notaction:"):
+        return None if any(fnmatchcase(grant, e) for e in _excluded(bound)) else grant
+    if grant.startswith("notaction:") and not bound.startswith("notaction:"):
+        return None if any(fnmatchcase(bound, e) for e in _excluded(grant)) else bound
+    return None
+
+
+# -------------------------
+# Policy documents
+# -------------------------
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _document(document):
+    # boto3 decodes policy documents; raw API responses carry URL-encoded JSON
+    if isinstance(document, str):
+        return json.loads(unquote(document))
+    return document or {}
+
+
+def _classify(action, admin, wildcard):
+    if action in ("*", "*:*", "iam:*"):
+        admin.add(action)
+    elif action.endswith(":*"):
+        wildcard.add(action)
+    elif "*" in action:
+        # Partial wildcards (iam:Put*) only matter when they reach an escalation action
+        if any(fnmatchcase(e, action) for e in ESCALATION_ACTIONS):
+            admin.add(action)
+    elif action in ESCALATION_ACTIONS:
+        admin.add(action)
+
+
+def analyze_document(document):
+    """Grants of one policy document."""
+    admin, wildcard, denied = set(), set(), set()
+    for statement in _as_list(_document(document).get("Statement")):
+        # NotResource reaches everything but the listed resources
+        every_resource = "NotResource" in statement or "*" in _as_list(statement.get("Resource"))
+        if not every_resource:
+            continue
+        actions = [a.lower() for a in _as_list(statement.get("Action"))]
+        if statement.get("Effect") == "Deny":
+            if not statement.get("Condition"):
+                denied.update(actions)
+            continue
+        if "NotAction" in statement:
+            excluded = {a.lower() for a in _as_list(statement["NotAction"])}
+            # Everything but the listed actions: admin unless IAM itself is excluded
+            (wildcard if excluded & {"*", "iam:*"} else admin).add("notaction:" + ",".join(sorted(excluded)))
+            continue
+        for action in actions:
+            _classify(action, admin, wildcard)
+    return Grants(frozenset(admin), frozenset(wildcard), frozenset(denied))
+
+
+# -------------------------
+# Graph
+# -------------------------
+class IamGraph:
+    def __init__(self):
+        self.users = []
+        self.roles = []
+        self.groups = {}    # name -> detail
+        self.policies = {}  # arn -> default version document
+        self._policy_grants = {}
+        self._group_grants = {}
+
+    @classmethod
+    def from_pages(cls, pages):
+        """Build from GetAccountAuthorizationDetails response pages."""
+        graph = cls()
+        for page in pages:
+            graph.users.extend(page.get("UserDetailList", []))
+            graph.roles.extend(page.get("RoleDetailList", []))
+            for group in page.get("GroupDetailList", []):
+                graph.groups[group["GroupName"]] = group
+            for policy in page.get("Policies", []):
+                for version in policy.get("PolicyVersionList", []):
+                    if version.get("IsDefaultVersion"):
+                        graph.policies[policy["Arn"]] = version.get("Document")
+        return graph
+
+    @property
+    def principal_count(self):
+        return len(self.users) + len(self.roles) + len(self.groups)
+
+    # Memoized: shared by every principal that attaches them
+    def policy_grants(self, arn):
+        grants = self._policy_grants.get(arn)
+        if grants is None:
+            grants = self._policy_grants[arn] = analyze_document(self.policies.get(arn))
+        return grants
+
+    def group_grants(self, name):
+        grants = self._group_grants.get(name)
+        if grants is None:
+            grants = self._group_grants[name] = Grants.union(
+                g for _, g in self._own_sources(self.groups.get(name, {}))
+            )
+        return grants
+
+    def _own_sources(self, detail):
+        for policy in detail.get("UserPolicyList") or detail.get("RolePolicyList") or detail.get("GroupPolicyList") or []:
+            yield f"inline/{policy.get('PolicyName')}", analyze_document(policy.get("PolicyDocument"))
+        for policy in detail.get("AttachedManagedPolicies", []):
+            yield policy.get("PolicyName") or policy["PolicyArn"], self.policy_grants(policy["PolicyArn"])
+
+    def sources(self, detail):
+        """(label, grants) per policy or group that applies to the principal."""
+        yield from self._own_sources(detail)
+        for name in detail.get("GroupList", []):
+            yield f"group/{name}", self.group_grants(name)
+
+    def effective(self, detail):
+        """(grants, via, unresolved boundary ARN or None) of a principal."""
+        sources = [(label, g) for label, g in self.sources(detail) if g]
+        boundary = (detail.get("PermissionsBoundary") or {}).get("PermissionsBoundaryArn")
+        unresolved = boundary if boundary and boundary not in self.policies else None
+        grants = Grants.union(g for _, g in sources).effective(
+            self.policy_grants(boundary) if boundary and not unresolved else None
+        )
+        # A source counts when it contains one of the effective (possibly narrowed) patterns
+        via = [label for label, g in sources
+               if any(fnmatchcase(action, p) for action in grants.patterns() for p in g.patterns())]
+        return grants, via, unresolved
+
+    def principals(self):
+        for user in self.users:
+            yield "user", user
+        for role in self.roles:
+            if not role.get("Path", "").startswith(SERVICE_ROLE_PATH):
+                yield "role", role
+
+
+# -------------------------
+# Findings
+# -------------------------
+def analyze(graph):
+    """(findings, summary) for every user and role of the graph."""
+    findings = []
+    admin = wildcard = 0
+    for kind, detail in graph.principals():
+        grants, via, unresolved = graph.effective(detail)
+        if not (grants.admin or grants.wildcard):
+            continue
+        finding = {
+            "service": "IAM",
+            "resource": detail.get("Arn") or detail.get("UserName") or detail.get("RoleName"),
+            "principal_type": kind,
+            "via": via,
+        }
+        if unresolved:
+            # Reported without the boundary: it may narrow these actions
+            finding["boundary_unresolved"] = unresolved
+        if grants.admin:
+            admin += 1
+            finding.update(issue="Admin-equivalent permissions", severity="High", actions=sorted(grants.admin))
+        else:
+            wildcard += 1
+            finding.update(issue="Over-permissioned: wildcard actions on all resources", severity="Medium",
+                           actions=sorted(grants.wildcard))
+        findings.append(finding)
+
+    summary = {
+        "users": len(graph.users),
+        "roles": len(graph.roles),
+        "groups": len(graph.groups),
+        "managed_policies": len(graph.policies),
+        "admin_principals": admin,
+        "wildcard_principals": wildcard,
+    }
+    return findings, summary
+
+
+def fetch_authorization_details(iam):
+    """Pages of GetAccountAuthorizationDetails: users, groups, roles and managed policies."""
+    return iam.get_paginator("get_account_authorization_details").paginate()
+
+
+def analyze_account(iam):
+    graph = IamGraph.from_pages(fetch_authorization_details(iam))
+    findings, summary = analyze(graph)
+    logger.info("iam_analysis_finished", principals=graph.principal_count, findings=len(findings))
+    return findings, summary
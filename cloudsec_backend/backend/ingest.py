@@ -0,0 +1,136 @@
+"""
+Bulk ingestion of scans.
+
+A scan row, its findings and its normalized resources are written in one
+transaction. Child rows are streamed from the document (backend/findings.py)
+in INGEST_CHUNK_SIZE chunks, each sent as one COPY (default) or one
+multi-row INSERT (INGEST_METHOD=values), instead of one statement per row:
+
+    result = ingest_scan(user_id, document, scan_type="cspm")
+    result["scan_id"], result["findings"], result["resources"]
+
+Findings and resources are only written with INGEST_NORMALIZED=true, once the
+scan_findings / scan_resources tables exist (see README, Database Setup).
+With SCAN_DIFFS=true the scan's digest and its diff against the previous scan
+are saved in the same transaction (backend/scan_diff.py), and with
+FINDING_LIFECYCLE=true so is the finding lifecycle update (backend/lifecycle.py).
+"""
+import csv
+import io
+import json
+import os
+from itertools import islice
+
+from .findings import finding_rows, resource_rows
+from .lifecycle import FINDING_LIFECYCLE, record_findings
+from .metrics import record_bytes, track_call
+from .scan_diff import SCAN_DIFFS, store_digest
+from .services import db_connection
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "5000"))
+INGEST_METHOD = os.getenv("INGEST_METHOD", "copy")  # copy | values
+INGEST_NORMALIZED = os.getenv("INGEST_NORMALIZED", "false").lower() in ("1", "true", "yes")
+
+FINDING_COLUMNS = ("scan_id", "user_id", "created_at", "source", "service", "resource", "issue", "severity")
+RESOURCE_COLUMNS = (
+    "scan_id", "user_id", "created_at", "resource_type", "resource_id", "region", "name", "attributes",
+)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# -------------------------
+# Writers
+# -------------------------
+def copy_rows(cur, table, columns, rows, chunk_size=INGEST_CHUNK_SIZE):
+    """One COPY ... FROM STDIN (CSV) per chunk. Returns rows written."""
+    from psycopg2 import sql
+
+    statement = sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv)").format(
+        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+    ).as_string(cur)
+    written = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for chunk in chunked(rows, chunk_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(chunk)
+        record_bytes("postgres", "sent", buffer.tell())
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+        written += len(chunk)
+    return written
+
+
+def values_rows(cur, table, columns, rows, chunk_size=INGEST_CHUNK_SIZE):
+    """One multi-row INSERT per chunk (execute_values). Returns rows written."""
+    from psycopg2 import sql
+    from psycopg2.extras import execute_values
+
+    statement = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+    ).as_string(cur)
+    written = 0
+    for chunk in chunked(rows, chunk_size):
+        execute_values(cur, statement, chunk, page_size=len(chunk))
+        written += len(chunk)
+    return written
+
+
+WRITERS = {"copy": copy_rows, "values": values_rows}
+
+
+# -------------------------
+# Scans
+# -------------------------
+def ingest_scan(user_id, document, aws_account_id=None, scan_type="unknown", payload=None,
+                method=None, chunk_size=None, normalized=None):
+    """
+    Write the scan (document: JSON-serializable dict, payload: its JSON if
+    already encoded) and, when normalized, its findings and resources.
+    Everything commits together or not at all.
+    """
+    write = WRITERS[method or INGEST_METHOD]
+    chunk_size = chunk_size or INGEST_CHUNK_SIZE
+    normalized = INGEST_NORMALIZED if normalized is None else normalized
+    payload = payload if payload is not None else json.dumps(document)
+    record_bytes("postgres", "sent", len(payload))
+
+    result = {"scan_id": None, "findings": 0, "resources": 0}
+    with track_call("postgres", "ingest_scan"):
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO scans (user_id, aws_account_id, data, scan_type)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id, created_at;
+                    """,
+                    [user_id, aws_account_id, payload, scan_type]
+                )
+                scan_id, created_at = cur.fetchone()
+                result["scan_id"] = scan_id
+                if SCAN_DIFFS:
+                    store_digest(cur, scan_id, user_id, aws_account_id, scan_type, created_at, document)
+                if FINDING_LIFECYCLE:
+                    record_findings(cur, scan_id, user_id, aws_account_id, scan_type, created_at, document)
+                if normalized:
+                    # created_at is copied so child rows land in the scan's partition
+                    prefix = (scan_id, user_id, created_at)
+                    result["findings"] = write(
+                        cur, "scan_findings", FINDING_COLUMNS,
+                        (prefix + row for row in finding_rows(document)), chunk_size,
+                    )
+                    result["resources"] = write(
+                        cur, "scan_resources", RESOURCE_COLUMNS,
+                        (prefix + row for row in resource_rows(document)), chunk_size,
+                    )
+    return result
@@ -0,0 +1,334 @@
+"""
+Per-tenant inventory index for ad-hoc resource search.
+
+The latest scanned resources of each tenant are kept in a local SQLite file
+(INVENTORY_INDEX_DIR/<user_id>.sqlite3, WAL mode): one row per resource
+with its type, account, region, name, state, public / exposed flags, tags
+and attributes, indexed for the /inventory/search filters.
+
+After each saved scan, refresh() updates the index incrementally: rows
+whose content digest changed are upserted, rows the scan no longer reports
+are deleted (per account, and only for resource types the scan covered),
+unchanged rows are not touched. A tenant without an index file (new host,
+deleted file) is rebuilt on first search from its latest CSPM scan per
+account in Postgres.
+
+    refresh(user_id, aws_account_id, scan_id, document)
+    search(user_id, resource_type="ec2_instance", state="running", tags=["env=prod"], limit=100)
+
+The index is derived data: it is safe to delete and is local to each host.
+"""
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+from .findings import _section, fingerprint
+from .log import get_logger
+from .metrics import track_call
+from .services import db_connection
+from .singleflight import coalesce
+
+logger = get_logger(__name__)
+
+INVENTORY_INDEX = os.getenv("INVENTORY_INDEX", "false").lower() in ("1", "true", "yes")
+INVENTORY_INDEX_DIR = os.getenv("INVENTORY_INDEX_DIR", "inventory_index")
+INVENTORY_SEARCH_MAX = int(os.getenv("INVENTORY_SEARCH_MAX", "1000"))
+# Seconds a writer waits for another process holding the tenant's file
+INVENTORY_BUSY_TIMEOUT = float(os.getenv("INVENTORY_BUSY_TIMEOUT", "5"))
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS resources (
+    account       TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    resource_id   TEXT NOT NULL,
+    region        TEXT,
+    name          TEXT,
+    state         TEXT,
+    public        INTEGER NOT NULL DEFAULT 0,
+    exposed       INTEGER NOT NULL DEFAULT 0,
+    tags          TEXT NOT NULL,
+    attributes    TEXT NOT NULL,
+    digest        TEXT NOT NULL,
+    scan_id       TEXT,
+    UNIQUE (account, resource_type, resource_id)
+);
+CREATE INDEX IF NOT EXISTS resources_type_region ON resources (resource_type, region);
+CREATE INDEX IF NOT EXISTS resources_region ON resources (region);
+CREATE INDEX IF NOT EXISTS resources_state ON resources (state);
+CREATE INDEX IF NOT EXISTS resources_public ON resources (public) WHERE public = 1;
+CREATE INDEX IF NOT EXISTS resources_exposed ON resources (exposed) WHERE exposed = 1;
+CREATE INDEX IF NOT EXISTS resources_scan ON resources (account, scan_id);
+CREATE TABLE IF NOT EXISTS tags (
+    rid   INTEGER NOT NULL,
+    key   TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (rid, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS tags_key_value ON tags (key, value, rid);
+"""
+
+RESOURCE_TYPES = ("ec2_instance", "s3_bucket", "iam_user")
+
+
+class InvalidFilter(ValueError):
+    pass
+
+
+# -------------------------
+# Rows
+# -------------------------
+def _tags(tags):
+    return {t.get("Key"): t.get("Value") for t in tags or [] if isinstance(t, dict) and t.get("Key")}
+
+
+def inventory_rows(data):
+    """
+    (covered resource types, rows): one row per resource of a scan document,
+    (resource_type, resource_id, region, name, state, public, exposed, tags, attributes).
+    """
+    covered, rows = set(), []
+
+    ec2 = _section(data, "ec2", "ec2_instances")
+    if isinstance(ec2, dict) and "Reservations" in ec2:
+        covered.add("ec2_instance")
+        exposure = {}
+        for fact in ec2.get("Exposure") or []:
+            exposure.setdefault(fact.get("InstanceId"), []).append(fact)
+        for reservation in ec2.get("Reservations") or []:
+            for inst in reservation.get("Instances") or []:
+                zone = (inst.get("Placement") or {}).get("AvailabilityZone")
+                facts = exposure.get(inst.get("InstanceId"))
+                tags = _tags(inst.get("Tags"))
+                rows.append((
+                    "ec2_instance", inst.get("InstanceId"), zone[:-1] if zone else None, tags.get("Name"),
+                    (inst.get("State") or {}).get("Name"), bool(inst.get("PublicIpAddress")), bool(facts),
+                    tags, {**inst, "Exposure": facts} if facts else inst,
+                ))
+
+    buckets = (data.get("s3") or {}).get("s3_buckets")
+    if isinstance(buckets, list):
+        covered.add("s3_bucket")
+        for bucket in buckets:
+            public = bool(bucket.get("PublicAccess"))
+            rows.append(("s3_bucket", bucket.get("Name"), bucket.get("Region"), bucket.get("Name"), None,
+                         public, public, _tags(bucket.get("Tags")), bucket))
+
+    iam = _section(data, "iam", "iam_users")
+    if isinstance(iam, dict) and "Users" in iam:
+        covered.add("iam_user")
+        for user in iam.get("Users") or []:
+            rows.append(("iam_user", user.get("Arn") or user.get("UserName"), None, user.get("UserName"), None,
+                         False, False, _tags(user.get("Tags")), user))
+
+    return covered, rows
+
+
+# -------------------------
+# Store
+# -------------------------
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def index_path(user_id):
+    # Tenant ids are UUIDs; parsing them also keeps the path inside the directory
+    return os.path.join(INVENTORY_INDEX_DIR, f"{uuid.UUID(str(user_id))}.sqlite3")
+
+
+def _connect(user_id):
+    path = index_path(user_id)
+    # A deleted file is recreated with its schema on the next connect
+    if path not in _initialized or not os.path.exists(path):
+        with _init_lock:
+            if path not in _initialized or not os.path.exists(path):
+                os.makedirs(INVENTORY_INDEX_DIR, exist_ok=True)
+                conn = sqlite3.connect(path, timeout=INVENTORY_BUSY_TIMEOUT)
+                try:
+                    conn.executescript(SCHEMA)
+                finally:
+                    conn.close()
+                _initialized.add(path)
+    conn = sqlite3.connect(path, timeout=INVENTORY_BUSY_TIMEOUT)
+    # WAL keeps the file consistent with synchronous=NORMAL; a lost tail is rebuilt from later scans
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def refresh(user_id, aws_account_id, scan_id, document):
+    """Apply one scan's resources to the tenant's index; returns {"upserted", "deleted", "unchanged"}."""
+    account, scan_id = str(aws_account_id or ""), str(scan_id)
+    covered, rows = inventory_rows(document)
+    result = {"upserted": 0, "deleted": 0, "unchanged": 0}
+    if not covered:
+        return result
+
+    with track_call("sqlite", "inventory_refresh"):
+        conn = _connect(user_id)
+        try:
+            with conn:
+                existing = {
+                    (rtype, rid_): (rowid, digest)
+                    for rowid, rtype, rid_, digest in conn.execute(
+                        "SELECT rowid, resource_type, resource_id, digest FROM resources WHERE account = ?",
+                        (account,),
+                    )
+                }
+                changed, tags, seen = [], {}, set()
+                for rtype, rid_, region, name, state, public, exposed, tag_map, attributes in rows:
+                    key = (rtype, rid_)
+                    if rid_ is None or key in seen:
+                        continue
+                    seen.add(key)
+                    body = json.dumps(attributes, sort_keys=True, separators=(",", ":"), default=str)
+                    digest = fingerprint(body, public, exposed)
+                    current = existing.get(key)
+                    if current is not None and current[1] == digest:
+                        continue
+                    changed.append((account, rtype, rid_, region, name, state, int(public), int(exposed),
+                                    json.dumps(tag_map), body, digest, scan_id))
+                    tags[key] = tag_map
+
+                stale = [rowid for key, (rowid, _) in existing.items() if key[0] in covered and key not in seen]
+                # Tags of changed and stale rows are rewritten or dropped
+                dropped = stale + [existing[key][0] for key in tags if key in existing]
+                conn.executemany("DELETE FROM tags WHERE rid = ?", ((r,) for r in dropped))
+                conn.executemany("DELETE FROM resources WHERE rowid = ?", ((r,) for r in stale))
+                conn.executemany(
+                    """
+                    INSERT INTO resources (account, resource_type, resource_id, region, name, state, public,
+                                           exposed, tags, attributes, digest, scan_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (account, resource_type, resource_id) DO UPDATE SET
+                        region = excluded.region, name = excluded.name, state = excluded.state,
+                        public = excluded.public, exposed = excluded.exposed, tags = excluded.tags,
+                        attributes = excluded.attributes, digest = excluded.digest, scan_id = excluded.scan_id
+                    """,
+                    changed,
+                )
+                if tags:
+                    rowids = {
+                        (rtype, rid_): rowid
+                        for rowid, rtype, rid_ in conn.execute(
+                            "SELECT rowid, resource_type, resource_id FROM resources WHERE account = ? AND scan_id = ?",
+                            (account, scan_id),
+                        )
+                    }
+                    conn.executemany(
+                        "INSERT INTO tags (rid, key, value) VALUES (?, ?, ?)",
+                        ((rowids[key], k, v) for key, tag_map in tags.items() for k, v in tag_map.items()),
+                    )
+                if (len(changed) + len(stale)) * 10 > len(existing):
+                    # Planner statistics after a large change: broad filters then scan in page order instead of sorting
+                    conn.execute("ANALYZE")
+        finally:
+            conn.close()
+
+    result.update(upserted=len(changed), deleted=len(stale), unchanged=len(seen) - len(changed))
+    logger.info("inventory_index_refreshed", user_id=user_id, scan_id=scan_id, **result)
+    return result
+
+
+def refresh_after_scan(user_id, aws_account_id, scan_id, document):
+    """The save_scan_result hook: the scan is already stored, so a failed refresh is only logged."""
+    try:
+        return refresh(user_id, aws_account_id, scan_id, document)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        logger.warning("inventory_index_refresh_failed", user_id=user_id, scan_id=scan_id, error=str(e))
+        return None
+
+
+def rebuild(user_id):
+    """Index the tenant's latest CSPM scan of each account, from Postgres."""
+    with track_call("postgres", "inventory_rebuild"):
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT DISTINCT ON (aws_account_id) id, aws_account_id, data
+                    FROM scans
+                    WHERE user_id = %s AND scan_type = 'cspm'
+                    ORDER BY aws_account_id, created_at DESC
+                    """,
+                    [user_id]
+                )
+                scans = cur.fetchall()
+    for scan_id, aws_account_id, data in scans:
+        refresh(user_id, aws_account_id, scan_id, data)
+    if not scans:
+        _connect(user_id).close()  # an empty index also counts as built
+    return len(scans)
+
+
+# -------------------------
+# Search
+# -------------------------
+def _tag_filter(tag):
+    key, sep, value = tag.partition("=")
+    if not key:
+        raise InvalidFilter(f"Invalid tag filter {tag!r}: expected key or key=value")
+    if sep:
+        return "r.rowid IN (SELECT rid FROM tags WHERE key = ? AND value = ?)", [key, value]
+    return "r.rowid IN (SELECT rid FROM tags WHERE key = ?)", [key]
+
+
+def search(user_id, resource_type=None, region=None, state=None, public=None, exposed=None,
+           tags=(), account=None, q=None, limit=100, cursor=None):
+    """
+    Resources matching every given filter, in index order, and the cursor
+    of the next page (None on the last one). tags: "key" or "key=value".
+    """
+    if resource_type is not None and resource_type not in RESOURCE_TYPES:
+        raise InvalidFilter(f"Unknown resource type {resource_type!r}; expected one of {', '.join(RESOURCE_TYPES)}")
+    limit = max(1, min(limit, INVENTORY_SEARCH_MAX))
+
+    clauses, params = [], []
+    for column, value in (("resource_type", resource_type), ("region", region), ("state", state),
+                          ("account", account)):
+        if value is not None:
+            clauses.append(f"r.{column} = ?")
+            params.append(value)
+    for column, value in (("public", public), ("exposed", exposed)):
+        if value is not None:
+            clauses.append(f"r.{column} = ?")
+            params.append(int(value))
+    for tag in tags or ():
+        clause, values = _tag_filter(tag)
+        clauses.append(clause)
+        params.extend(values)
+    if q:
+        # Substring of the name or id; not indexed, so combine it with the filters above on big inventories
+        clauses.append("(instr(lower(r.name), ?) > 0 OR instr(lower(r.resource_id), ?) > 0)")
+        params.extend([q.lower(), q.lower()])
+    if cursor is not None:
+        clauses.append("r.rowid > ?")
+        params.append(cursor)
+
+    if not os.path.exists(index_path(user_id)):
+        coalesce(("inventory_rebuild", user_id), lambda: rebuild(user_id), window=0)
+
+    sql = (
+        "SELECT r.rowid, r.account, r.resource_type, r.resource_id, r.region, r.name, r.state, r.public, "
+        "r.exposed, r.tags, r.attributes FROM resources r"
+        + (" WHERE " + " AND ".join(clauses) if clauses else "")
+        + " ORDER BY r.rowid LIMIT ?"
+    )
+    with track_call("sqlite", "inventory_search"):
+        conn = _connect(user_id)
+        try:
+            rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        finally:
+            conn.close()
+
+    items = [
+        {
+            "type": rtype, "id": rid_, "account": account_ or None, "region": region_, "name": name,
+            "state": state_, "public": bool(public_), "exposed": bool(exposed_),
+            "tags": json.loads(tag_json), "attributes": json.loads(attributes),
+        }
+        for _, account_, rtype, rid_, region_, name, state_, public_, exposed_, tag_json, attributes in rows[:limit]
+    ]
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    return items, next_cursor
@@ -0,0 +1,124 @@
+"""
+Finding lifecycle.
+
+One finding_lifecycle row per tenant finding, keyed by a fingerprint of
+(tenant, account, service, resource, rule) (backend/findings.py), so the
+same issue found by successive scans of an account is one row:
+
+    first_seen   first scan that reported it
+    last_seen    latest scan that reported it
+    status       open, or resolved once a scan of the same account and type
+                 no longer reports it (resolved_at)
+
+With FINDING_LIFECYCLE=true, saving a scan updates the store in the save
+transaction: one bulk upsert of everything the scan reported, then one
+UPDATE resolving the open findings it did not report. Open counts read the
+partial index on open findings instead of the scan documents.
+"""
+import os
+
+from .findings import finding_rows, tenant_finding_key
+from .metrics import instrumented
+from .services import db_connection
+
+FINDING_LIFECYCLE = os.getenv("FINDING_LIFECYCLE", "false").lower() in ("1", "true", "yes")
+
+COLUMNS = (
+    "user_id", "fingerprint", "aws_account_id", "scan_type", "source", "service", "resource", "rule",
+    "severity", "status", "first_seen", "last_seen", "last_scan_id",
+)
+
+
+def lifecycle_rows(user_id, aws_account_id, scan_type, scan_id, seen_at, document):
+    """One row per distinct fingerprint in the scan (an upsert may touch a row only once)."""
+    rows = {}
+    for source, service, resource, rule, severity in finding_rows(document):
+        key = tenant_finding_key(user_id, aws_account_id, service, resource, rule)
+        rows[key] = (user_id, key, aws_account_id, scan_type, source, service, resource, rule,
+                     severity, "open", seen_at, seen_at, scan_id)
+    return list(rows.values())
+
+
+def record_findings(cur, scan_id, user_id, aws_account_id, scan_type, seen_at, document):
+    """
+    Upsert the scan's findings and resolve the open ones it no longer reports,
+    on the caller's cursor (inside the save transaction). Returns
+    (seen, resolved).
+    """
+    from psycopg2.extras import execute_values
+
+    if not isinstance(document.get("findings"), list) and not isinstance(document.get("policy_violations"), dict):
+        # Reports and failed saves carry no findings; resolving against them would close everything
+        return 0, 0
+
+    rows = lifecycle_rows(user_id, aws_account_id, scan_type, scan_id, seen_at, document)
+    if rows:
+        execute_values(
+            cur,
+            f"""
+            INSERT INTO finding_lifecycle ({", ".join(COLUMNS)}) VALUES %s
+            ON CONFLICT (user_id, fingerprint) DO UPDATE SET
+                aws_account_id = EXCLUDED.aws_account_id,
+                scan_type = EXCLUDED.scan_type,
+                severity = EXCLUDED.severity,
+                status = 'open',
+                last_seen = GREATEST(finding_lifecycle.last_seen, EXCLUDED.last_seen),
+                resolved_at = NULL,
+                last_scan_id = EXCLUDED.last_scan_id
+            """,
+            rows,
+            page_size=len(rows),
+        )
+
+    # Everything this scan reported now carries its id
+    cur.execute(
+        """
+        UPDATE finding_lifecycle SET status = 'resolved', resolved_at = %s
+        WHERE user_id = %s AND status = 'open'
+          AND aws_account_id IS NOT DISTINCT FROM %s AND scan_type = %s
+          AND last_scan_id <> %s
+        """,
+        (seen_at, user_id, aws_account_id, scan_type, scan_id),
+    )
+    return len(rows), cur.rowcount
+
+
+# -------------------------
+# Reads
+# -------------------------
+@instrumented("postgres")
+def open_counts(user_id):
+    """{severity (lowercase): open findings} plus "total"."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT lower(severity), COUNT(*) FROM finding_lifecycle
+                WHERE user_id = %s AND status = 'open'
+                GROUP BY 1
+                """,
+                (user_id,),
+            )
+            counts = {severity or "unknown": n for severity, n in cur.fetchall()}
+    counts["total"] = sum(counts.values())
+    return counts
+
+
+@instrumented("postgres")
+def open_findings(user_id, source=None):
+    """Open findings, oldest first, as dicts."""
+    query = """
+        SELECT fingerprint, source, service, resource, rule, severity, first_seen, last_seen
+        FROM finding_lifecycle
+        WHERE user_id = %s AND status = 'open'
+    """
+    params = [user_id]
+    if source:
+        query += " AND source = %s"
+        params.append(source)
+    query += " ORDER BY first_seen"
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, params)
+            columns = [c[0] for c in cur.description]
+            return [dict(zip(columns, row)) for row in cur.fetchall()]
@@ -0,0 +1,203 @@
+"""
+Structured, low-overhead logging.
+
+    logger = get_logger(__name__)
+    logger.info("policy_evaluated", policy=policy_path, violations=len(result))
+    logger.debug("opa_request", payload_bytes=lambda: len(payload))
+
+- Level checks happen before anything is built, and callable field values
+  are only evaluated for records that pass them.
+- configure_logging() routes records through a bounded queue to a
+  background listener thread, so request threads never block on I/O. When
+  the queue is full records are dropped and counted instead of waiting.
+- Events can be sampled (log 1 of every N) and every field is capped in
+  size, so logging a 100k-item violation list costs a few hundred bytes.
+  Fields are capped on the calling thread before the record is queued: the
+  listener only sees that snapshot, never live request objects.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from itertools import islice
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json | text
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "512"))
+MAX_FIELD_ITEMS = int(os.getenv("LOG_MAX_FIELD_ITEMS", "10"))
+
+# event -> log one of every N occurrences
+SAMPLE_EVERY = {}
+
+_sample_counters = {}
+_sample_lock = threading.Lock()
+_listener = None
+dropped_records = 0
+
+
+# -------------------------
+# Field rendering
+# -------------------------
+def _cap(value, depth=0):
+    """Evaluate lazy values and bound the size of what gets logged."""
+    if callable(value):
+        value = value()
+    if isinstance(value, str):
+        if len(value) > MAX_FIELD_CHARS:
+            return value[:MAX_FIELD_CHARS] + f"...(+{len(value) - MAX_FIELD_CHARS} chars)"
+        return value
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    if depth >= 2:
+        return _cap(repr(value), depth)
+    if isinstance(value, dict):
+        capped = {str(k): _cap(v, depth + 1) for k, v in islice(value.items(), MAX_FIELD_ITEMS)}
+        if len(value) > MAX_FIELD_ITEMS:
+            capped["..."] = f"+{len(value) - MAX_FIELD_ITEMS} keys"
+        return capped
+    if isinstance(value, (list, tuple, set)):
+        capped = [_cap(v, depth + 1) for v in islice(value, MAX_FIELD_ITEMS)]
+        if len(value) > MAX_FIELD_ITEMS:
+            capped.append(f"...(+{len(value) - MAX_FIELD_ITEMS} items)")
+        return capped
+    return _cap(str(value), depth)
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, fmt=LOG_FORMAT):
+        super().__init__()
+        self.fmt = fmt
+
+    def format(self, record):
+        fields = getattr(record, "fields", {})
+        if not getattr(record, "fields_capped", False):
+            fields = _snapshot(fields)
+        if record.exc_info:
+            fields["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            fields["exc"] = record.exc_text
+        event = record.getMessage()
+
+        if self.fmt == "text":
+            rendered = " ".join(f"{k}={v}" for k, v in fields.items())
+            return f"{self.formatTime(record)} {record.levelname} {record.name} {event} {rendered}".rstrip()
+
+        doc = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": event,
+        }
+        doc.update(fields)
+        return json.dumps(doc, default=str, ensure_ascii=False)
+
+
+def _snapshot(fields):
+    capped = {}
+    for k, v in fields.items():
+        try:
+            capped[k] = _cap(v)
+        except Exception as e:
+            # A failing lazy field or a container changed mid-iteration must not lose the record
+            capped[k] = f"<unloggable: {e!r}>"
+    return capped
+
+
+# -------------------------
+# Non-blocking queue handler
+# -------------------------
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # Formatting happens on the listener thread, after the caller moved on:
+        # snapshot the fields (evaluating lazy ones) and the traceback here.
+        if hasattr(record, "fields"):
+            record.fields = _snapshot(record.fields)
+            record.fields_capped = True
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global dropped_records
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records += 1
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, stream=None):
+    """Install the queue handler on the root logger (idempotent)."""
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(StructuredFormatter(fmt))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [_DroppingQueueHandler(log_queue)]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+    _listener.start()
+
+
+def shutdown_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+# -------------------------
+# Logger facade
+# -------------------------
+def _sampled_out(event, every):
+    if not every or every <= 1:
+        return False
+    with _sample_lock:
+        count = _sample_counters.get(event, 0)
+        _sample_counters[event] = count + 1
+    return count % every != 0
+
+
+class StructuredLogger:
+    __slots__ = ("_logger",)
+
+    def __init__(self, name):
+        self._logger = logging.getLogger(name)
+
+    def isEnabledFor(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, fields, exc_info=False, sample_every=None):
+        if not self._logger.isEnabledFor(level):
+            return
+        if _sampled_out(event, sample_every or SAMPLE_EVERY.get(event)):
+            return
+        self._logger.log(level, event, exc_info=exc_info, extra={"fields": fields}, stacklevel=3)
+
+    def debug(self, event, sample_every=None, **fields):
+        self._log(logging.DEBUG, event, fields, sample_every=sample_every)
+
+    def info(self, event, sample_every=None, **fields):
+        self._log(logging.INFO, event, fields, sample_every=sample_every)
+
+    def warning(self, event, sample_every=None, **fields):
+        self._log(logging.WARNING, event, fields, sample_every=sample_every)
+
+    def error(self, event, sample_every=None, **fields):
+        self._log(logging.ERROR, event, fields, sample_every=sample_every)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
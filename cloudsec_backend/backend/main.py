@@ -3,26 +3,30 @@ import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 from fastapi import FastAPI, Depends, Query, Body, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.encoders import jsonable_encoder
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.security import HTTPAuthorizationCredentials
 from cwpp.runtime_scanner import classify_severity
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List
 import subprocess
 import json
+import math
+import time
 import traceback
-import boto3
+import uuid
+from contextlib import asynccontextmanager
 from botocore.exceptions import ClientError
 from fastapi.security import OAuth2PasswordBearer
-from policy_evaluator import evaluate_policy
-import os
-from dotenv import load_dotenv
+from policy_evaluator import evaluate_policies
 import psycopg2
 from policies.aws_policies import check_s3_public_buckets
 
-from .aws_scanner import scan_all, scan_all_with_assumed_role, clear_default_aws_creds
+from .aws_scanner import scan_all, scan_all_with_assumed_role, scan_session, assume_role, clear_default_aws_creds
+from .org_scanner import scan_organization, ORG_MEMBER_ROLE_NAME
 from cwpp.runtime_scanner import run_runtime_checks
 from .db import (
     save_scan_result,
@@ -31,25 +35,56 @@ from .db import (
     save_aws_account,
     get_user_aws_account,
     update_scan_result_with_aws_account,
-    fetch_user_scan_history
+    fetch_user_scan_history,
+    upsert_org_member_account
 )
 from .auth import auth_scheme, verify_token
-from dotenv import load_dotenv
-import psycopg2
+from .steampipe import get_steampipe_client, SteampipeQueryError
+from .decision_cache import CacheStats
+from .export import FORMATS, ExportError, findings_query, render, scans_query, stream_rows, validate
+from .partitions import start_maintenance_thread
+from .normalize import normalize_scan, shutdown_pool
+from .singleflight import coalesce, forget
+from .findings import finding_rows, tenant_finding_key
+from .lifecycle import FINDING_LIFECYCLE, open_findings
+from .scan_diff import ScanNotFound, get_scan_diff
+from .inventory_index import INVENTORY_INDEX, INVENTORY_SEARCH_MAX, InvalidFilter, search as search_inventory
+from .log import configure_logging, get_logger, shutdown_logging
+from .metrics import (
+    begin_request,
+    end_request,
+    current_request,
+    set_endpoint,
+    track_call,
+    track_stage,
+    render_latest,
+    HTTP_REQUEST_SECONDS,
+)
+from .services import db_connection
+from .http_cache import etag_matches, make_etag, not_modified, scan_version, set_cache_headers
+from .resilience import DependencyUnavailable, FallbackCache, request_budget, reset_deadline, start_deadline
+
+configure_logging()
+logger = get_logger(__name__)
 
-load_dotenv()
+# Where lossless raw scan archives are written when CLOUDSEC_RAW_ARCHIVE=true
+RAW_ARCHIVE_DIR = os.getenv("CLOUDSEC_RAW_ARCHIVE_DIR", "raw_archives")
+# Responses at least this large are gzipped for clients that accept it (0 disables)
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
 
-DB_CONFIG = {
-   "dbname": os.getenv("SUPABASE_DB"),
-    "user": os.getenv("SUPABASE_USER"),
-    "password": os.getenv("SUPABASE_PASS"),
-    "host": os.getenv("SUPABASE_HOST"),
-    "port": "5432",
-    "sslmode": "require",
-}
 
+@asynccontextmanager
+async def lifespan(app):
+    # Creates upcoming scans partitions and applies retention (backend/partitions.py)
+    start_maintenance_thread()
+    yield
+    # Pool workers for large-scan normalization (backend/normalize.py), if any were started
+    shutdown_pool()
+    # Flush records still queued for the log listener thread
+    shutdown_logging()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 
@@ -74,81 +109,53 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # The dashboard revalidates with If-None-Match (backend/http_cache.py)
+    expose_headers=["ETag"],
 )
+if GZIP_MINIMUM_SIZE:
+    app.add_middleware(GZipMiddleware, minimum_size=GZIP_MINIMUM_SIZE)
+
+# Request timing: labels metrics with the endpoint and returns a per-request
+# breakdown of external calls and pipeline stages in Server-Timing. Also
+# starts the request's deadline, which external calls take their timeouts from
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    token = begin_request(request.url.path)
+    deadline_token = start_deadline(request_budget(request.url.path))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        ctx = current_request()
+        route = request.scope.get("route")
+        set_endpoint(getattr(route, "path", None) or "unmatched")
+        elapsed = time.perf_counter() - start
+        response.headers["Server-Timing"] = ctx.server_timing(elapsed)
+        return response
+    finally:
+        ctx = current_request()
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start, endpoint=ctx.endpoint, method=request.method, status=status
+        )
+        reset_deadline(deadline_token)
+        end_request(token)
+
+
+# Open circuit breaker (503) or spent request deadline (504): fail fast with a short body
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable(request: Request, exc: DependencyUnavailable):
+    headers = {"Retry-After": str(math.ceil(exc.retry_after))} if exc.retry_after else None
+    return JSONResponse(
+        status_code=exc.status_code, content={"error": str(exc), "dependency": exc.dependency}, headers=headers
+    )
 
 class AWSAccountData(BaseModel):
     account_id: str
     role_arn: str
 
-# -----------------------------
-# Utility: Clean AWS scan results
-# -----------------------------
-def clean_aws_results(results: dict) -> dict:
-    import copy, traceback
-    results_clean = copy.deepcopy(results)
-    findings = []
-
-    try:
-        # EC2
-        ec2_data = results_clean.get('ec2', {}).get('ec2_instances', {})
-        if isinstance(ec2_data, dict):
-            ec2_data.pop('ResponseMetadata', None)
-            total = running = stopped = 0
-            for res in ec2_data.get('Reservations', []):
-                res.pop('ResponseMetadata', None)
-                for inst in res.get('Instances', []):
-                    if 'LaunchTime' in inst and hasattr(inst['LaunchTime'], 'isoformat'):
-                        inst['LaunchTime'] = inst['LaunchTime'].isoformat()
-                    state = inst.get('State', {}).get('Name')
-                    total += 1
-                    if state == "running":
-                        running += 1
-                    elif state == "stopped":
-                        stopped += 1
-            results_clean['ec2']['summary'] = {
-                "total_instances": total,
-                "running": running,
-                "stopped": stopped
-            }
-
-        # IAM
-        iam_data = results_clean.get('iam', {}).get('iam_users', {})
-        if isinstance(iam_data, dict):
-            iam_data.pop('ResponseMetadata', None)
-            for user in iam_data.get('Users', []):
-                if 'CreateDate' in user and hasattr(user['CreateDate'], 'isoformat'):
-                    user['CreateDate'] = user['CreateDate'].isoformat()
-                if not user.get('MFA', False):
-                    findings.append({
-                        "service": "IAM",
-                        "resource": user.get("UserName"),
-                        "issue": "MFA not enabled",
-                        "severity": "Medium"
-                    })
-
-        # S3
-        s3_buckets = results_clean.get('s3', {}).get('s3_buckets', [])
-        if isinstance(s3_buckets, list):
-            for bucket in s3_buckets:
-                if 'CreationDate' in bucket and hasattr(bucket['CreationDate'], 'isoformat'):
-                    bucket['CreationDate'] = bucket['CreationDate'].isoformat()
-                bucket.pop('ResponseMetadata', None)
-                if bucket.get("PublicAccess", False):
-                    findings.append({
-                        "service": "S3",
-                        "resource": bucket.get("Name"),
-                        "issue": "Public bucket",
-                        "severity": "High"
-                    })
-
-        results_clean["findings"] = findings
-
-    except Exception as e:
-        print(f"Error cleaning AWS results: {e}")
-        print(f"Traceback: {traceback.format_exc()}")
-        return results
-
-    return results_clean
+# Last good dashboard stats per user, served while Postgres is unavailable
+_dashboard_fallback = FallbackCache("postgres")
 
 # -----------------------------
 # CSPM Scan
@@ -158,39 +165,47 @@ def scan_cspm(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     user_info = verify_token(credentials)
     user_id = user_info["id"]
     try:
-        results = scan_all()
-        results = clean_aws_results(results)
-
-        results["scan_type"] = "cspm"
-        results["timestamp"] = datetime.utcnow().isoformat()
-
-        #  Encode for JSON safety
-        safe_results = jsonable_encoder(results)
+        with track_stage("scan"):
+            results = scan_all()
+        raw_archive = results.pop("raw_archive", None)
+        #  Clean and encode for JSON safety (in the process pool for large accounts)
+        with track_stage("clean"):
+            safe_results = normalize_scan(results, scan_type="cspm", timestamp=datetime.utcnow().isoformat())
 
         #  Evaluate against OPA policies
-        print("🔍 Starting policy evaluation for multi-tenant scan...")
-        s3_violations = evaluate_policy(safe_results, "cloudsec/s3/deny")
-        ec2_violations = evaluate_policy(safe_results, "cloudsec/ec2/deny")
+        logger.debug("policy_evaluation_started", user_id=user_id)
+        cache_stats = CacheStats()
+        with track_stage("policy"):
+            violations = evaluate_policies(safe_results, ["cloudsec/s3/deny", "cloudsec/ec2/deny"], stats=cache_stats)
+            s3_violations = violations["cloudsec/s3/deny"]
+            ec2_violations = violations["cloudsec/ec2/deny"]
 
-        print(f"📊 Multi-tenant S3 violations found: {len(s3_violations)}")
-        print(f"📊 Multi-tenant EC2 violations found: {len(ec2_violations)}")
+        logger.info("policy_evaluation_finished", user_id=user_id,
+                    s3_violations=len(s3_violations), ec2_violations=len(ec2_violations),
+                    decision_cache=cache_stats.to_dict())
 
         safe_results["policy_violations"] = {
             "s3": s3_violations,
             "ec2": ec2_violations
         }
+        safe_results["policy_cache"] = cache_stats.to_dict()
 
-        print(f"💾 Multi-tenant policy violations added to results: {safe_results['policy_violations']}")
+        logger.debug("policy_violations_added", violations=safe_results["policy_violations"])
 
         # 🔑 Save findings under data
-        scan_id = save_scan_result(
-            user_id=user_id,
-            data=safe_results,
-            scan_type="cspm",
-            aws_account_id=None
-        )
+        with track_stage("save"):
+            scan_id = save_scan_result(
+                user_id=user_id,
+                data=safe_results,
+                scan_type="cspm",
+                aws_account_id=None
+            )
+        if raw_archive is not None:
+            raw_archive.save(os.path.join(RAW_ARCHIVE_DIR, f"{scan_id}.json.gz"))
 
         return {"status": "ok", "results": safe_results}
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -204,7 +219,7 @@ def scan_cspm_multi(credentials: HTTPAuthorizationCredentials = Depends(auth_sch
     user_id = user_info["id"]
 
     # Fetch AWS account
-    aws_account = get_user_aws_account(user_id)
+    aws_account = coalesce(("aws_account", user_id), lambda: get_user_aws_account(user_id))
     if not aws_account:
         raise HTTPException(status_code=400, detail="No AWS account registered for this user")
 
@@ -219,46 +234,144 @@ def scan_cspm_multi(credentials: HTTPAuthorizationCredentials = Depends(auth_sch
     if not role_arn:
         raise HTTPException(status_code=400, detail="No role ARN found for this AWS account")
 
-    try:
+    def run_scan():
         #  Clear default AWS creds to avoid scanning the wrong environment
         clear_default_aws_creds()
 
         # Run scan with assumed role (always tenant role)
-        results = scan_all_with_assumed_role(role_arn)
-        results = clean_aws_results(results)
-
-        # Add metadata
-        results["scan_type"] = "cspm"
-        results["timestamp"] = datetime.utcnow().isoformat()
-
-        #  JSON-safe encoding
-        safe_results = jsonable_encoder(results)
+        with track_stage("scan"):
+            results = scan_all_with_assumed_role(role_arn)
+        raw_archive = results.pop("raw_archive", None)
+        #  Clean, add metadata and encode for JSON safety (in the process pool for large accounts)
+        with track_stage("clean"):
+            safe_results = normalize_scan(results, scan_type="cspm", timestamp=datetime.utcnow().isoformat())
 
         #  Evaluate against OPA policies
-        print("🔍 Starting policy evaluation...")
-        s3_violations = evaluate_policy(safe_results, "cloudsec/s3/deny")
-        ec2_violations = evaluate_policy(safe_results, "cloudsec/ec2/deny")
+        logger.debug("policy_evaluation_started", user_id=user_id, aws_account_id=aws_account["id"])
+        cache_stats = CacheStats()
+        with track_stage("policy"):
+            violations = evaluate_policies(safe_results, ["cloudsec/s3/deny", "cloudsec/ec2/deny"], stats=cache_stats)
+            s3_violations = violations["cloudsec/s3/deny"]
+            ec2_violations = violations["cloudsec/ec2/deny"]
 
-        print(f"📊 S3 violations found: {len(s3_violations)}")
-        print(f"📊 EC2 violations found: {len(ec2_violations)}")
+        logger.info("policy_evaluation_finished", user_id=user_id, aws_account_id=aws_account["id"],
+                    s3_violations=len(s3_violations), ec2_violations=len(ec2_violations),
+                    decision_cache=cache_stats.to_dict())
 
         safe_results["policy_violations"] = {
             "s3": s3_violations,
             "ec2": ec2_violations
         }
+        safe_results["policy_cache"] = cache_stats.to_dict()
 
-        print(f"💾 Policy violations added to results: {safe_results['policy_violations']}")
+        logger.debug("policy_violations_added", violations=safe_results["policy_violations"])
 
         # Save scan result
-        scan_id = save_scan_result(
-            user_id=user_id,
-            data=safe_results,
-            aws_account_id=str(aws_account["id"]),
-            scan_type="cspm"
-        )
+        with track_stage("save"):
+            scan_id = save_scan_result(
+                user_id=user_id,
+                data=safe_results,
+                aws_account_id=str(aws_account["id"]),
+                scan_type="cspm"
+            )
+        if raw_archive is not None:
+            raw_archive.save(os.path.join(RAW_ARCHIVE_DIR, f"{scan_id}.json.gz"))
+        return safe_results
 
+    try:
+        # A duplicate request (double click) shares the running scan instead of starting another
+        safe_results = coalesce(("scan_cspm_multi", user_id, aws_account["account_id"]), run_scan)
         return {"status": "ok", "results": safe_results}
 
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        return JSONResponse(
+            status_code=500,
+            content={"error": str(e), "traceback": traceback.format_exc()}
+        )
+
+# -----------------------------
+# Organization Scan
+# -----------------------------
+@app.get("/scan/cspm-org")
+def scan_cspm_org(
+    role_name: str = Query(ORG_MEMBER_ROLE_NAME, description="Role assumed in each member account"),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme),
+):
+    user_info = verify_token(credentials)
+    user_id = user_info["id"]
+
+    # The registered account is the organization's management account
+    aws_account = get_user_aws_account(user_id)
+    if not aws_account:
+        raise HTTPException(status_code=400, detail="No AWS account registered for this user")
+    if not aws_account.get("is_valid", False):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid AWS account: {aws_account.get('validation_error', 'Unknown error')}"
+        )
+
+    def process_account(account, session, role_arn):
+        # Member accounts get their own aws_accounts row so each scan record points at it
+        if role_arn is None:
+            account_row_id = aws_account["id"]
+        else:
+            account_row_id = upsert_org_member_account(user_id, account["Id"], role_arn, aws_account["id"])
+
+        with track_stage("scan"):
+            results = scan_session(session)
+        results.pop("raw_archive", None)
+        with track_stage("clean"):
+            safe_results = normalize_scan(
+                results, scan_type="cspm", timestamp=datetime.utcnow().isoformat(),
+                account_identity={"Account": account["Id"], "Name": account.get("Name")},
+            )
+
+        with track_stage("policy"):
+            violations = evaluate_policies(safe_results, ["cloudsec/s3/deny", "cloudsec/ec2/deny"])
+        safe_results["policy_violations"] = {
+            "s3": violations["cloudsec/s3/deny"],
+            "ec2": violations["cloudsec/ec2/deny"]
+        }
+
+        with track_stage("save"):
+            scan_id = save_scan_result(
+                user_id=user_id,
+                data=safe_results,
+                aws_account_id=str(account_row_id),
+                scan_type="cspm"
+            )
+
+        severities = [f.get("severity", "").lower() for f in safe_results["findings"]]
+        return {
+            "scan_id": str(scan_id),
+            "total_findings": len(severities),
+            "critical_findings": sum(1 for sev in severities if sev in ("high", "critical")),
+            "medium_findings": severities.count("medium"),
+            "low_findings": severities.count("low"),
+            "policy_violations": sum(len(v) for v in safe_results["policy_violations"].values()),
+        }
+
+    try:
+        clear_default_aws_creds()
+        management_session = assume_role(aws_account["role_arn"], session_name="CloudSecOrgManagement")
+        report = scan_organization(management_session, process_account, role_name=role_name)
+
+        report["scan_type"] = "cspm-org"
+        report["timestamp"] = datetime.utcnow().isoformat()
+        with track_stage("save"):
+            report["id"] = str(save_scan_result(
+                user_id=user_id,
+                data=report,
+                aws_account_id=str(aws_account["id"]),
+                scan_type="cspm-org"
+            ))
+
+        return {"status": "ok", "results": report}
+
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -273,7 +386,8 @@ def scan_cwpp(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     user_info = verify_token(credentials)
     user_id = user_info["id"]
     try:
-        results = run_runtime_checks()
+        with track_stage("scan"):
+            results = run_runtime_checks()
         for finding in results.get("findings", []):
             sev = finding.get("severity", "").lower()
             if sev in ["critical", "high"]:
@@ -304,16 +418,134 @@ def scan_history(scan_type: str = Query(None), credentials: HTTPAuthorizationCre
     try:
         history = fetch_scan_history(user_id, scan_type)
         return {"status": "ok", "history": history.data}
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
 
 @app.get("/results/history-multi")
-def scan_history_multi(scan_type: str = Query(None), credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+def scan_history_multi(
+    request: Request,
+    response: Response,
+    scan_type: str = Query(None),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
     user_info = verify_token(credentials)
     user_id = user_info["id"]
     try:
+        etag = make_etag(request, user_id, scan_version(user_id))
+        if etag_matches(request, etag):
+            return not_modified(etag)
         history = fetch_user_scan_history(user_id, scan_type)
+        set_cache_headers(response, etag)
         return {"status": "ok", "history": history}
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
+
+@app.get("/results/diff")
+def scan_diff(
+    target: str = Query(...),
+    base: str = Query(None),
+    limit: int = Query(100, ge=0),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    user_info = verify_token(credentials)
+    try:
+        # Scan ids are UUIDs: reject anything else before it reaches Postgres
+        target = str(uuid.UUID(target))
+        base = str(uuid.UUID(base)) if base else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="target and base must be scan ids (UUIDs)")
+    try:
+        return {"status": "ok", **get_scan_diff(user_info["id"], target, base, limit)}
+    except ScanNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
+
+# -----------------------------
+# Exports
+# -----------------------------
+def _export_response(fmt, name, query):
+    sql, params, columns = query
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}.{fmt}"
+    return StreamingResponse(
+        render(stream_rows(sql, params), fmt, columns),
+        media_type=FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/export/scans")
+def export_scans(
+    format: str = Query("csv"),
+    start: datetime = Query(None),
+    end: datetime = Query(None),
+    scan_type: str = Query(None),
+    severity: List[str] = Query(None),
+    include_data: bool = Query(False),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    user_info = verify_token(credentials)
+    try:
+        validate(format, severity)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_response(format, "scans", scans_query(
+        user_info["id"], start, end, scan_type, severity, include_data=include_data
+    ))
+
+
+@app.get("/export/findings")
+def export_findings(
+    format: str = Query("csv"),
+    start: datetime = Query(None),
+    end: datetime = Query(None),
+    scan_type: str = Query(None),
+    severity: List[str] = Query(None),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    user_info = verify_token(credentials)
+    try:
+        validate(format, severity)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _export_response(format, "findings", findings_query(user_info["id"], start, end, scan_type, severity))
+
+# -----------------------------
+# Inventory Search
+# -----------------------------
+@app.get("/inventory/search")
+def inventory_search(
+    type: str = Query(None, description="ec2_instance, s3_bucket or iam_user"),
+    region: str = Query(None),
+    state: str = Query(None),
+    public: bool = Query(None),
+    exposed: bool = Query(None, description="Public with a sensitive port open to the internet"),
+    tag: List[str] = Query(None, description="key or key=value; repeat to require several"),
+    account: str = Query(None),
+    q: str = Query(None, description="Substring of the resource name or id"),
+    limit: int = Query(100, ge=1, le=INVENTORY_SEARCH_MAX),
+    cursor: int = Query(None),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    user_info = verify_token(credentials)
+    if not INVENTORY_INDEX:
+        raise HTTPException(status_code=404, detail="Inventory index is disabled (INVENTORY_INDEX)")
+    try:
+        items, next_cursor = search_inventory(
+            user_info["id"], resource_type=type, region=region, state=state, public=public, exposed=exposed,
+            tags=tag, account=account, q=q, limit=limit, cursor=cursor,
+        )
+        return {"status": "ok", "items": items, "next_cursor": next_cursor}
+    except InvalidFilter as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
 
@@ -321,14 +553,34 @@ def scan_history_multi(scan_type: str = Query(None), credentials: HTTPAuthorizat
 # Dashboard Stats
 # -----------------------------
 @app.get("/dashboard/stats")
-def dashboard_stats(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+def dashboard_stats(
+    request: Request,
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
     payload = verify_token(credentials)
     user_id = payload.get("id")
     if not user_id:
         raise HTTPException(status_code=400, detail="User ID not found in token")
+    # The 7-day trend also moves at midnight
+    today = datetime.utcnow().date().isoformat()
     try:
-        stats = get_dashboard_stats(user_id)
+        etag = make_etag(request, user_id, scan_version(user_id), today)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        # The version is read before the stats it labels, inside the shared computation
+        def load():
+            return scan_version(user_id), get_dashboard_stats(user_id)
+
+        (version, stats), degraded = _dashboard_fallback.call(
+            user_id, lambda: coalesce(("dashboard_stats", user_id), load)
+        )
+        if degraded:
+            return {"status": "ok", "degraded": True, **stats}
+        set_cache_headers(response, make_etag(request, user_id, version, today))
         return {"status": "ok", **stats}
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
 
@@ -348,12 +600,8 @@ def store_aws_account_endpoint(
     
     # --- Validate the AWS account and role ARN ---
     try:
-        sts_client = boto3.client("sts")
-        assumed_role = sts_client.assume_role(
-            RoleArn=aws_account_data.role_arn,
-            RoleSessionName="validation-session"
-        )
-        returned_account_id = assumed_role['AssumedRoleUser']['Arn'].split(":")[4]
+        assumed_role = assume_role(aws_account_data.role_arn, session_name="validation-session", fresh=True)
+        returned_account_id = assumed_role.identity_arn.split(":")[4]
         if returned_account_id != aws_account_data.account_id:
             raise HTTPException(
                 status_code=400,
@@ -364,6 +612,8 @@ def store_aws_account_endpoint(
             status_code=400,
             detail=f"Failed to assume role. Check the role ARN and permissions. Error: {e}"
         )
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -373,6 +623,7 @@ def store_aws_account_endpoint(
     # --- Save to database if validation passed ---
     try:
         save_aws_account(user_id, aws_account_data.account_id, aws_account_data.role_arn)
+        forget(("aws_account", user_id))
         return {"status": "ok", "message": "AWS account info saved successfully"}
     except psycopg2.IntegrityError:
         raise HTTPException(
@@ -381,6 +632,8 @@ def store_aws_account_endpoint(
         )
     except psycopg2.OperationalError as e:
         raise HTTPException(status_code=500, detail=f"Database connection error: {e}")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
 
@@ -392,60 +645,48 @@ def get_aws_account(credentials: HTTPAuthorizationCredentials = Depends(auth_sch
         raise HTTPException(status_code=401, detail="Invalid or missing user ID")
     
     try:
-        aws_account = get_user_aws_account(user_id)
+        # get_user_aws_account already validates the stored role ARN
+        aws_account = coalesce(("aws_account", user_id), lambda: get_user_aws_account(user_id))
         if not aws_account:
             return {"status": "ok", "data": None}
 
-        # --- Validate the stored role ARN ---
-        is_valid = False
-        validation_error = None
-        try:
-            sts_client = boto3.client("sts")
-            assumed_role = sts_client.assume_role(
-                RoleArn=aws_account["role_arn"],
-                RoleSessionName="validation-session"
-            )
-            returned_account_id = assumed_role['AssumedRoleUser']['Arn'].split(":")[4]
-            if returned_account_id == aws_account["account_id"]:
-                is_valid = True
-            else:
-                validation_error = f"Role ARN does not match account ID. Expected {aws_account['account_id']}, got {returned_account_id}"
-        except ClientError as e:
-            validation_error = f"Failed to assume role: {e}"
-        except Exception as e:
-            validation_error = f"Unexpected error during validation: {e}"
-
-        # --- Return the AWS account with validation status ---
         return {
             "status": "ok",
             "data": {
                 **aws_account,
-                "is_valid": is_valid,
-                "validation_error": validation_error if not is_valid else None
+                "validation_error": aws_account["validation_error"] if not aws_account["is_valid"] else None
             }
         }
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e), "traceback": traceback.format_exc()})
 # -----------------------------
 # Steampipe Query
 # -----------------------------
 @app.get("/steampipe/results")
-def steampipe_results(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
-    verify_token(credentials)
+def steampipe_results(
+    query: str = Query("iam_users"),
+    limit: int = Query(None),
+    state: str = Query(None),
+    refresh: bool = Query(False),
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
+    user_info = verify_token(credentials)
     try:
-        query = "select * from aws_iam_user limit 5;"
-        completed_process = subprocess.run(
-            ['steampipe', 'query', '--json', query],
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+        result = get_steampipe_client().query(
+            user_info["id"], query, {"limit": limit, "state": state}, use_cache=not refresh
         )
-        results = json.loads(completed_process.stdout)
-        return {"status": "ok", "results": results}
+        return {"status": "ok", "results": result["rows"], "cached": result["cached"]}
+    except SteampipeQueryError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DependencyUnavailable:
+        raise
     except subprocess.CalledProcessError as e:
         return JSONResponse(status_code=500, content={"status": "error", "message": e.stderr, "traceback": traceback.format_exc()})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"status": "error", "message": str(e), "traceback": traceback.format_exc()})
 
 
 
@@ -453,68 +694,92 @@ def steampipe_results(credentials: HTTPAuthorizationCredentials = Depends(auth_s
 async def submit_contact(form: ContactForm):  # remove token if you don't enforce auth
     try:
         # Connect to database
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO contact_messages (name, email, subject, message) VALUES (%s, %s, %s, %s)",
-            (form.name, form.email, form.subject, form.message)
-        )
-        conn.commit()
-        cur.close()
-        conn.close()
+        with track_call("postgres", "submit_contact"):
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        "INSERT INTO contact_messages (name, email, subject, message) VALUES (%s, %s, %s, %s)",
+                        (form.name, form.email, form.subject, form.message)
+                    )
         return {"status": "ok", "message": "Contact form saved"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/policy/violations")
-def get_policy_violations(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
+def get_policy_violations(
+    request: Request,
+    response: Response,
+    credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)
+):
     user_info = verify_token(credentials)
     user_id = user_info["id"]
 
     try:
+        # Lifecycle rows change with saved scans; otherwise the latest scan_results row is read
+        etag = make_etag(request, user_id, scan_version(user_id, "scans" if FINDING_LIFECYCLE else "scan_results"))
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        set_cache_headers(response, etag)
+
+        if FINDING_LIFECYCLE:
+            # Open violations with when they were first and last seen
+            violations = [
+                {
+                    "id": f["fingerprint"],
+                    "policy_name": f"{f['service']} policy",
+                    "resource": f["resource"] or "unknown",
+                    "severity": f["severity"],
+                    "description": f["rule"] or "Policy violation detected",
+                    "detected_at": f["first_seen"].isoformat(),
+                    "last_seen": f["last_seen"].isoformat(),
+                }
+                for f in open_findings(user_id, source="policy")
+            ]
+            logger.info("policy_violations_returned", user_id=user_id, count=len(violations))
+            return violations
+
         # Connect to DB
-        conn = psycopg2.connect(**DB_CONFIG)
-        cur = conn.cursor()
-
-        # Fetch the latest CSPM scan results
-        cur.execute("""
-            SELECT results
-            FROM scan_results
-            WHERE user_id = %s AND scan_type = 'cspm'
-            ORDER BY created_at DESC
-            LIMIT 1
-        """, (user_id,))
-        row = cur.fetchone()
-        cur.close()
-        conn.close()
+        with track_call("postgres", "get_policy_violations"):
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    # Fetch the latest CSPM scan results
+                    cur.execute("""
+                        SELECT results, aws_account_id
+                        FROM scan_results
+                        WHERE user_id = %s AND scan_type = 'cspm'
+                        ORDER BY created_at DESC
+                        LIMIT 1
+                    """, (user_id,))
+                    row = cur.fetchone()
 
         if not row:
             return []
 
         scan_data = row[0]  # JSON from save_scan_result
+        aws_account_id = str(row[1]) if row[1] else None
 
         violations = []
         policy_data = scan_data.get("policy_violations", {})
 
-        print(f"📋 Raw policy data from scan: {policy_data}")
-
-        # Normalize into list
-        for service, service_violations in policy_data.items():
-            print(f"🔍 Processing {service} violations: {len(service_violations)} items")
-            for v in service_violations:
-                print(f"📝 Processing violation: {v}")
-                violations.append({
-                    "id": v.get("id") or f"{service}-{v.get('resource', 'unknown')}",
-                    "policy_name": v.get("policy") or f"{service} policy",
-                    "resource": v.get("resource", "unknown"),
-                    "severity": v.get("severity", "Medium"),
-                    "description": v.get("description", "Policy violation detected"),
-                    "detected_at": scan_data.get("timestamp"),
-                })
-
-        print(f"✅ Returning {len(violations)} normalized violations")
+        logger.debug("policy_violations_loaded", services=lambda: {k: len(v) for k, v in policy_data.items()})
+
+        # Normalize into list; ids are the lifecycle fingerprints, stable across scans
+        for _, service, resource, rule, severity in finding_rows({"policy_violations": policy_data}):
+            logger.debug("policy_violation", sample_every=100, service=service, violation=rule)
+            violations.append({
+                "id": tenant_finding_key(user_id, aws_account_id, service, resource, rule),
+                "policy_name": f"{service} policy",
+                "resource": resource or "unknown",
+                "severity": severity,
+                "description": rule or "Policy violation detected",
+                "detected_at": scan_data.get("timestamp"),
+            })
+
+        logger.info("policy_violations_returned", user_id=user_id, count=len(violations))
         return violations
 
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         return JSONResponse(
             status_code=500,
@@ -524,4 +789,11 @@ def get_policy_violations(credentials: HTTPAuthorizationCredentials = Depends(au
 @app.get("/scan/policies/s3")
 def s3_policy_scan():
     results = check_s3_public_buckets()
-    return {"violations": results}
\ No newline at end of file
+    return {"violations": results}
+
+# -----------------------------
+# Metrics
+# -----------------------------
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_latest(), media_type="text/plain; version=0.0.4")
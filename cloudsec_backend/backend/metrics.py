@@ -0,0 +1,320 @@
+"""
+Lightweight in-process metrics with Prometheus text exposition.
+
+Every external call (STS, EC2, IAM, S3, OPA, Postgres, Supabase) and every
+pipeline stage is timed into labeled histograms. The labels include the
+tenant and the endpoint of the request being served, which are carried in a
+per-request context object set up by the HTTP middleware. The same object
+collects a per-request breakdown returned in the Server-Timing header.
+
+Observations are a perf_counter delta, a bisect over fixed buckets and a
+few additions under a lock, so the instrumentation stays on in production.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+# -------------------------
+# Metric types
+# -------------------------
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        escaped = (v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+        return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            series = list(self._series.items())
+        for key, value in series:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{self._format_labels(key)} {value}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._series.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, value):
+        counts, total, count = value
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += bucket_count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', le))} {cumulative}")
+        lines.append(f"{self.name}_sum{self._format_labels(key)} {total}")
+        lines.append(f"{self.name}_count{self._format_labels(key)} {count}")
+        return lines
+
+
+REGISTRY = []
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "cloudsec_http_request_seconds", "HTTP request latency", ("endpoint", "method", "status")
+)
+EXTERNAL_CALL_SECONDS = Histogram(
+    "cloudsec_external_call_seconds", "Latency of calls to external services",
+    ("service", "operation", "tenant", "endpoint")
+)
+EXTERNAL_CALL_ERRORS = Counter(
+    "cloudsec_external_call_errors_total", "Failed calls to external services", ("service", "operation", "endpoint")
+)
+STAGE_SECONDS = Histogram(
+    "cloudsec_stage_seconds", "Latency of scan pipeline stages", ("stage", "tenant", "endpoint")
+)
+PAYLOAD_BYTES = Counter(
+    "cloudsec_payload_bytes_total", "Bytes sent to / received from external services",
+    ("service", "direction", "endpoint")
+)
+POLICY_CACHE_LOOKUPS = Counter(
+    "cloudsec_policy_cache_lookups_total", "Policy decision cache lookups by tier and outcome", ("result",)
+)
+POLICY_CACHE_SAVED_SECONDS = Counter(
+    "cloudsec_policy_cache_saved_seconds_total", "OPA evaluation time avoided by decision cache hits"
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "cloudsec_singleflight_calls_total",
+    "Coalesced operations by outcome (leader ran it, inflight/window reused its result)", ("operation", "outcome")
+)
+SINGLEFLIGHT_SAVED_SECONDS = Counter(
+    "cloudsec_singleflight_saved_seconds_total", "Work time not repeated thanks to coalescing", ("operation",)
+)
+CIRCUIT_STATE = Gauge(
+    "cloudsec_circuit_state", "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open)", ("dependency",)
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "cloudsec_circuit_transitions_total", "Circuit breaker state changes", ("dependency", "state")
+)
+CIRCUIT_REJECTED = Counter(
+    "cloudsec_circuit_rejected_total", "Calls failed fast by an open circuit breaker", ("dependency", "endpoint")
+)
+DEADLINE_EXCEEDED = Counter(
+    "cloudsec_deadline_exceeded_total", "Calls not started because the request deadline had passed",
+    ("dependency", "endpoint")
+)
+DEGRADED_RESPONSES = Counter(
+    "cloudsec_degraded_responses_total", "Responses served from a fallback cache while a dependency was unavailable",
+    ("dependency", "endpoint")
+)
+STEAMPIPE_FALLBACKS = Counter(
+    "cloudsec_steampipe_fallbacks_total",
+    "Steampipe queries sent to the CLI after the service failed (cli) or refused because the CLI slots were busy (rejected)",
+    ("outcome",)
+)
+
+
+def render_latest():
+    """All registered metrics in Prometheus text format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Request context
+# -------------------------
+class RequestMetrics:
+    __slots__ = ("endpoint", "tenant", "timings", "_lock")
+
+    def __init__(self, endpoint=""):
+        self.endpoint = endpoint
+        self.tenant = ""
+        self.timings = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        with self._lock:
+            items = list(self.timings.items())
+        parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in items]
+        if total is not None:
+            parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_current = contextvars.ContextVar("cloudsec_request_metrics", default=None)
+
+
+def begin_request(endpoint):
+    return _current.set(RequestMetrics(endpoint))
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_request():
+    return _current.get()
+
+
+def set_tenant(tenant_id):
+    ctx = _current.get()
+    if ctx is not None:
+        ctx.tenant = str(tenant_id)
+
+
+def set_endpoint(endpoint):
+    ctx = _current.get()
+    if ctx is not None and endpoint:
+        ctx.endpoint = endpoint
+
+
+def _labels():
+    ctx = _current.get()
+    if ctx is None:
+        return "", "", None
+    return ctx.tenant, ctx.endpoint, ctx
+
+
+# -------------------------
+# Timing helpers
+# -------------------------
+@contextmanager
+def track_call(service, operation=""):
+    """Time a call to an external service."""
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        tenant, endpoint, ctx = _labels()
+        EXTERNAL_CALL_SECONDS.observe(elapsed, service=service, operation=operation, tenant=tenant, endpoint=endpoint)
+        if failed:
+            EXTERNAL_CALL_ERRORS.inc(service=service, operation=operation, endpoint=endpoint)
+        if ctx is not None:
+            ctx.add(service, elapsed)
+
+
+@contextmanager
+def track_stage(stage):
+    """Time a pipeline stage (scan, clean, policy, save...)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        tenant, endpoint, ctx = _labels()
+        STAGE_SECONDS.observe(elapsed, stage=stage, tenant=tenant, endpoint=endpoint)
+        if ctx is not None:
+            ctx.add(f"stage-{stage}", elapsed)
+
+
+def instrumented(service, operation=None):
+    """Decorator form of track_call; the operation defaults to the function name."""
+    def decorator(fn):
+        op = operation or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track_call(service, op):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_bytes(service, direction, size):
+    if size:
+        _, endpoint, _ = _labels()
+        PAYLOAD_BYTES.inc(size, service=service, direction=direction, endpoint=endpoint)
+
+
+# -------------------------
+# boto3 instrumentation
+# -------------------------
+def _before_aws_call(model, context, **kwargs):
+    context["cloudsec_started"] = time.perf_counter()
+
+
+def _after_aws_call(model, context, http_response=None, **kwargs):
+    started = context.pop("cloudsec_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    service = model.service_model.endpoint_prefix
+    tenant, endpoint, ctx = _labels()
+    EXTERNAL_CALL_SECONDS.observe(elapsed, service=service, operation=model.name, tenant=tenant, endpoint=endpoint)
+    status = getattr(http_response, "status_code", 200)
+    if status and status >= 400:
+        EXTERNAL_CALL_ERRORS.inc(service=service, operation=model.name, endpoint=endpoint)
+    content = getattr(http_response, "raw", None) is not None and http_response.content
+    record_bytes(service, "received", len(content or b""))
+    if ctx is not None:
+        ctx.add(service, elapsed)
+
+
+def instrument_boto3_session(session):
+    """Register timing hooks on a boto3.Session; clients created from it inherit them."""
+    session.events.register("before-call", _before_aws_call, unique_id="cloudsec-metrics-before")
+    session.events.register("after-call", _after_aws_call, unique_id="cloudsec-metrics-after")
+    return session
@@ -0,0 +1,274 @@
+"""
+Scan document normalization: cleaning, findings and JSON encoding.
+
+clean_aws_results strips response metadata, converts timestamps, counts EC2
+states and extracts the MFA, S3 and exposure findings; normalize_scan adds
+the scan metadata and makes the document JSON-safe. On large inventories
+that is pure-Python CPU work which holds the GIL and stalls every other
+request in the worker.
+
+Above NORMALIZE_PROCESS_THRESHOLD resources, normalize_scan ships it to a
+process pool instead. EC2 instances, IAM users and S3 buckets are cut into
+NORMALIZE_CHUNK_SIZE chunks; each chunk is cleaned and encoded in a worker
+and the chunks are merged back in order, while the request thread waits
+without holding the GIL. Only the rest of the document is copied and encoded
+in-process. The output is the same as the in-process path, which also runs
+whenever the pool fails.
+
+    safe_results = normalize_scan(scan_all(), scan_type="cspm", timestamp=now)
+
+Workers start with forkserver (spawn where it is unavailable): forking a
+threaded server could copy locks held by other threads. Each app worker
+process has its own pool, created on first use.
+"""
+import copy
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.encoders import jsonable_encoder
+
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Resources (instances + users + buckets) from which a scan is normalized in the pool; 0 disables it
+NORMALIZE_PROCESS_THRESHOLD = int(os.getenv("NORMALIZE_PROCESS_THRESHOLD", "20000"))
+NORMALIZE_WORKERS = int(os.getenv("NORMALIZE_WORKERS", "0")) or os.cpu_count() or 1
+NORMALIZE_CHUNK_SIZE = int(os.getenv("NORMALIZE_CHUNK_SIZE", "2000"))
+
+
+# -------------------------
+# Per-resource work (runs in pool workers too)
+# -------------------------
+def _clean_instances(instances):
+    total = running = stopped = 0
+    for inst in instances:
+        if 'LaunchTime' in inst and hasattr(inst['LaunchTime'], 'isoformat'):
+            inst['LaunchTime'] = inst['LaunchTime'].isoformat()
+        state = inst.get('State', {}).get('Name')
+        total += 1
+        if state == "running":
+            running += 1
+        elif state == "stopped":
+            stopped += 1
+    return (total, running, stopped), []
+
+
+def _clean_users(users):
+    findings = []
+    for user in users:
+        if 'CreateDate' in user and hasattr(user['CreateDate'], 'isoformat'):
+            user['CreateDate'] = user['CreateDate'].isoformat()
+        if 'MFA' in user and not user['MFA']:
+            findings.append({
+                "service": "IAM",
+                "resource": user.get("UserName"),
+                "issue": "MFA not enabled",
+                "severity": "Medium"
+            })
+    return (0, 0, 0), findings
+
+
+def _clean_buckets(buckets):
+    findings = []
+    for bucket in buckets:
+        if 'CreationDate' in bucket and hasattr(bucket['CreationDate'], 'isoformat'):
+            bucket['CreationDate'] = bucket['CreationDate'].isoformat()
+        bucket.pop('ResponseMetadata', None)
+        if bucket.get("PublicAccess", False):
+            findings.append({
+                "service": "S3",
+                "resource": bucket.get("Name"),
+                "issue": "Public bucket",
+                "severity": "High"
+            })
+        if "Encryption" in bucket and not bucket["Encryption"] and "Encryption" not in bucket.get("Errors", {}):
+            findings.append({
+                "service": "S3",
+                "resource": bucket.get("Name"),
+                "issue": "Default encryption not enabled",
+                "severity": "Medium"
+            })
+    return (0, 0, 0), findings
+
+
+CLEANERS = {"instances": _clean_instances, "users": _clean_users, "buckets": _clean_buckets}
+
+
+def _clean_in_place(kind, items):
+    counts, findings = CLEANERS[kind](items)
+    return items, counts, findings
+
+
+def _normalize_chunk(kind, items):
+    """Pool task: one chunk cleaned and JSON-encoded; items arrive as the worker's own copy."""
+    counts, findings = CLEANERS[kind](items)
+    return jsonable_encoder(items), counts, findings
+
+
+# -------------------------
+# Document
+# -------------------------
+def _sections(doc):
+    """(ec2 describe_instances dict or None, iam dict or None, s3 bucket list or None)."""
+    # Scanners return the describe_instances / list_users shapes directly;
+    # older stored scans nest them under ec2_instances / iam_users.
+    ec2_section = doc.get('ec2', {})
+    ec2_data = ec2_section.get('ec2_instances', ec2_section)
+    iam_section = doc.get('iam', {})
+    iam_data = iam_section.get('iam_users', iam_section)
+    s3_buckets = doc.get('s3', {}).get('s3_buckets')
+    return (
+        ec2_data if isinstance(ec2_data, dict) and 'ec2' in doc else None,
+        iam_data if isinstance(iam_data, dict) else None,
+        s3_buckets if isinstance(s3_buckets, list) else None,
+    )
+
+
+def _resource_lists(doc):
+    """(kind, container, key) of every resource list, in the order _clean_document visits them."""
+    ec2_data, iam_data, s3_buckets = _sections(doc)
+    if ec2_data is not None:
+        for res in ec2_data.get('Reservations', []):
+            if isinstance(res.get('Instances'), list):
+                yield "instances", res, 'Instances'
+    if iam_data is not None and isinstance(iam_data.get('Users'), list):
+        yield "users", iam_data, 'Users'
+    if s3_buckets is not None:
+        yield "buckets", doc['s3'], 's3_buckets'
+
+
+def resource_count(doc):
+    return sum(len(container[key]) for _, container, key in _resource_lists(doc))
+
+
+def _clean_document(doc, clean):
+    """Clean doc in place; clean(kind, items) -> (items, counts, findings) does each resource list."""
+    findings = []
+    ec2_data, iam_data, s3_buckets = _sections(doc)
+
+    # EC2
+    if ec2_data is not None:
+        ec2_data.pop('ResponseMetadata', None)
+        total = running = stopped = 0
+        for res in ec2_data.get('Reservations', []):
+            res.pop('ResponseMetadata', None)
+            if isinstance(res.get('Instances'), list):
+                res['Instances'], (t, r, s), _ = clean("instances", res['Instances'])
+                total, running, stopped = total + t, running + r, stopped + s
+        doc['ec2']['summary'] = {
+            "total_instances": total,
+            "running": running,
+            "stopped": stopped
+        }
+        # Exposure facts (ec2_exposure.py) are reported by policies/ec2.rego, not as findings here
+
+    # IAM
+    if iam_data is not None:
+        iam_data.pop('ResponseMetadata', None)
+        if isinstance(iam_data.get('Users'), list):
+            iam_data['Users'], _, user_findings = clean("users", iam_data['Users'])
+            findings.extend(user_findings)
+        # Admin-equivalent and wildcard grants found by the IAM graph analysis
+        findings.extend(iam_data.get('permission_findings', []))
+
+    # S3
+    if s3_buckets is not None:
+        doc['s3']['s3_buckets'], _, bucket_findings = clean("buckets", s3_buckets)
+        findings.extend(bucket_findings)
+
+    doc["findings"] = findings
+    return doc
+
+
+def clean_aws_results(results: dict) -> dict:
+    """A cleaned deep copy of a scan document, with its findings; the input itself on error."""
+    try:
+        return _clean_document(copy.deepcopy(results), _clean_in_place)
+    except Exception as e:
+        logger.exception("clean_aws_results_failed", error=str(e))
+        return results
+
+
+# -------------------------
+# Process pool
+# -------------------------
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                if context.get_start_method() == "forkserver":
+                    context.set_forkserver_preload([__name__])
+                _pool = ProcessPoolExecutor(max_workers=NORMALIZE_WORKERS, mp_context=context)
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _Pending(list):
+    """Empty stand-in for a resource list being normalized in the pool."""
+    __slots__ = ("index",)
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+
+def _normalize_pooled(results, metadata, chunk_size):
+    pool = _get_pool()
+    slots = list(_resource_lists(results))
+    # Pickling a chunk copies it, so the resource lists need no deepcopy here
+    futures = [
+        [pool.submit(_normalize_chunk, kind, container[key][i:i + chunk_size])
+         for i in range(0, len(container[key]), chunk_size)]
+        for kind, container, key in slots
+    ]
+    # Copy the rest of the document with placeholders where the lists were
+    placeholders = {id(container[key]): _Pending(i) for i, (_, container, key) in enumerate(slots)}
+    skeleton = copy.deepcopy(results, placeholders)
+
+    encoded_lists = [None] * len(slots)
+
+    def merge(kind, pending):
+        chunks = [f.result() for f in futures[pending.index]]
+        encoded_lists[pending.index] = [item for items, _, _ in chunks for item in items]
+        counts = tuple(map(sum, zip((0, 0, 0), *(c for _, c, _ in chunks))))
+        return pending, counts, [f for _, _, chunk_findings in chunks for f in chunk_findings]
+
+    doc = _clean_document(skeleton, merge)
+    doc.update(metadata)
+    encoded = jsonable_encoder(doc)
+    for (_, container, key), items in zip(_resource_lists(encoded), encoded_lists):
+        container[key] = items
+    return encoded
+
+
+def normalize_scan(results: dict, chunk_size=None, **metadata) -> dict:
+    """
+    clean_aws_results, then `metadata` (scan_type, timestamp...), JSON-encoded.
+    Sharded over the process pool from NORMALIZE_PROCESS_THRESHOLD resources.
+    """
+    if NORMALIZE_PROCESS_THRESHOLD and resource_count(results) >= NORMALIZE_PROCESS_THRESHOLD:
+        try:
+            return _normalize_pooled(results, metadata, chunk_size or NORMALIZE_CHUNK_SIZE)
+        except Exception as e:
+            # A broken pool or an unexpected document: the in-process path handles both
+            logger.warning("normalize_pool_failed", error=str(e))
+    results = clean_aws_results(results)
+    results.update(metadata)
+    return jsonable_encoder(results)
@@ -0,0 +1,114 @@
+"""
+AWS Organizations scanning.
+
+The tenant's registered role is treated as the management-account role:
+member accounts are listed through Organizations, a cross-account role is
+assumed into each one from the management session, and the accounts are
+scanned on a bounded thread pool (scans are I/O bound on AWS calls).
+"""
+import os
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from .aws_scanner import assume_role
+from .log import get_logger
+from .metrics import track_call
+
+logger = get_logger(__name__)
+
+ORG_SCAN_WORKERS = int(os.getenv("ORG_SCAN_WORKERS", "8"))
+# Role created in member accounts by AWS Organizations unless the tenant uses its own
+ORG_MEMBER_ROLE_NAME = os.getenv("ORG_MEMBER_ROLE_NAME", "OrganizationAccountAccessRole")
+
+
+def list_member_accounts(session):
+    """Active accounts of the organization the session's account manages."""
+    org = session.client("organizations")
+    accounts = []
+    with track_call("organizations", "ListAccounts"):
+        for page in org.get_paginator("list_accounts").paginate():
+            accounts.extend(a for a in page.get("Accounts", []) if a.get("Status") == "ACTIVE")
+    return accounts
+
+
+def member_role_arn(account_id, role_name=ORG_MEMBER_ROLE_NAME):
+    return f"arn:aws:iam::{account_id}:role/{role_name}"
+
+
+def _scan_account(account, management_session, management_account_id, role_name, process_account):
+    account_id = account["Id"]
+    record = {"account_id": account_id, "name": account.get("Name"), "role_arn": None}
+    started = time.perf_counter()
+    try:
+        if account_id == management_account_id:
+            session = management_session
+        else:
+            record["role_arn"] = member_role_arn(account_id, role_name)
+            session = assume_role(record["role_arn"], session_name="CloudSecOrgScan", session=management_session)
+        record.update(process_account(account, session, record["role_arn"]))
+        record["status"] = "ok"
+    except Exception as e:
+        logger.warning("org_account_scan_failed", account_id=account_id, error=str(e))
+        record["status"] = "error"
+        record["error"] = str(e)
+    record["duration_seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def scan_organization(management_session, process_account, role_name=ORG_MEMBER_ROLE_NAME,
+                      max_workers=ORG_SCAN_WORKERS):
+    """
+    Scan every active account of the organization.
+
+    process_account(account, session, role_arn) scans one account and returns a
+    dict merged into its record (scan id, finding counts...). A failing account
+    is reported with status "error" and does not stop the others.
+
+    Returns the org report: per-account records, totals, and the wall time next
+    to the sequential equivalent (sum of per-account durations). Accounts that
+    compete for CPU run slower side by side, so that sum is an upper bound;
+    benchmarks/bench_org_scan.py measures a real one-worker run.
+    """
+    started = time.perf_counter()
+    identity = management_session.client("sts").get_caller_identity()
+    management_account_id = identity["Account"]
+    accounts = list_member_accounts(management_session)
+    logger.info("org_scan_started", management_account=management_account_id, accounts=len(accounts))
+
+    workers = max(1, min(max_workers, len(accounts)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each task gets its own copy of the request context (metrics labels)
+        futures = [
+            pool.submit(
+                contextvars.copy_context().run, _scan_account,
+                account, management_session, management_account_id, role_name, process_account,
+            )
+            for account in accounts
+        ]
+        records = [future.result() for future in futures]
+
+    wall = time.perf_counter() - started
+    sequential = sum(r["duration_seconds"] for r in records)
+    report = {
+        "management_account_id": management_account_id,
+        "accounts": records,
+        "summary": {
+            "total_accounts": len(records),
+            "scanned": sum(1 for r in records if r["status"] == "ok"),
+            "failed": sum(1 for r in records if r["status"] == "error"),
+            "total_findings": sum(r.get("total_findings", 0) for r in records),
+            "critical_findings": sum(r.get("critical_findings", 0) for r in records),
+            "medium_findings": sum(r.get("medium_findings", 0) for r in records),
+            "low_findings": sum(r.get("low_findings", 0) for r in records),
+            "policy_violations": sum(r.get("policy_violations", 0) for r in records),
+        },
+        "timing": {
+            "workers": workers,
+            "wall_seconds": round(wall, 3),
+            "sequential_seconds": round(sequential, 3),
+            "speedup": round(sequential / wall, 2) if wall else None,
+        },
+    }
+    logger.info("org_scan_finished", management_account=management_account_id, **report["timing"])
+    return report
@@ -0,0 +1,434 @@
+"""
+Monthly partitions, retention and archival for the scans tables.
+
+`scans` (and scan_findings / scan_resources, see backend/ingest.py) is
+range-partitioned on created_at by month (`scans_y2026m01`...), so queries
+bounded on created_at only touch the months they need and old data leaves by
+dropping a whole partition instead of a long DELETE.
+
+Maintenance (`python -m backend.partitions maintain`, or every
+PARTITION_MAINTENANCE_INTERVAL seconds in the app):
+
+1. Creates the partitions of the current and next PARTITION_MONTHS_AHEAD
+   months (created empty, then attached: only a brief lock on `scans`).
+2. Archives partitions older than every tenant's retention to gzip CSV
+   (local directory or S3 / an S3-compatible stand-in, see SCAN_ARCHIVE_URL),
+   then detaches them CONCURRENTLY and drops them.
+3. Purges the remaining rows of tenants whose retention
+   (`scan_retention.retention_days`, else SCAN_RETENTION_DAYS) ended, in
+   PURGE_BATCH_SIZE-row transactions. Purged rows are archived first.
+
+DDL runs with lock_timeout = PARTITION_LOCK_TIMEOUT so maintenance gives up
+rather than queueing application queries behind it; the next run retries.
+"""
+import argparse
+import csv
+import gzip
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from .log import get_logger
+from .services import DB_CONFIG
+
+logger = get_logger(__name__)
+
+# Partitioned table -> partition key. Rows derived from a scan (findings,
+# resources, digests, diffs) copy its created_at, so they share its retention.
+PARTITIONED_TABLES = {
+    "scans": "created_at",
+    "scan_findings": "created_at",
+    "scan_resources": "created_at",
+    "scan_digests": "created_at",
+    "scan_diffs": "created_at",
+}
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "86400"))  # seconds, 0 = off
+SCAN_RETENTION_DAYS = int(os.getenv("SCAN_RETENTION_DAYS", "365"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "5000"))
+# file://<dir> (or a plain path) or s3://<bucket>/<prefix>
+SCAN_ARCHIVE_URL = os.getenv("SCAN_ARCHIVE_URL", "scan_archives")
+# e.g. a MinIO / localstack endpoint standing in for S3
+SCAN_ARCHIVE_S3_ENDPOINT = os.getenv("SCAN_ARCHIVE_S3_ENDPOINT")
+
+# Only one worker runs maintenance at a time
+_ADVISORY_LOCK_KEY = 0x636C6F75  # "clou"
+_PARTITION_RE = re.compile(r"_y(\d{4})m(\d{2})$")
+
+
+# -------------------------
+# Months
+# -------------------------
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_month(name):
+    match = _PARTITION_RE.search(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+# -------------------------
+# Archive stores
+# -------------------------
+class LocalArchiveStore:
+    def __init__(self, root):
+        self.root = root
+
+    def put(self, key, path):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        return target
+
+
+class S3ArchiveStore:
+    def __init__(self, bucket, prefix="", endpoint_url=SCAN_ARCHIVE_S3_ENDPOINT):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+
+    def put(self, key, path):
+        from .aws_clients import get_client_factory
+
+        kwargs = {"endpoint_url": self.endpoint_url} if self.endpoint_url else {}
+        s3 = get_client_factory().default().client("s3", **kwargs)
+        object_key = f"{self.prefix}/{key}" if self.prefix else key
+        s3.upload_file(path, self.bucket, object_key)
+        os.remove(path)
+        return f"s3://{self.bucket}/{object_key}"
+
+
+def get_archive_store(url=SCAN_ARCHIVE_URL):
+    if url.startswith("s3://"):
+        bucket, _, prefix = url[len("s3://"):].partition("/")
+        return S3ArchiveStore(bucket, prefix)
+    return LocalArchiveStore(url[len("file://"):] if url.startswith("file://") else url)
+
+
+class _ArchiveFile:
+    """Gzip CSV written to a temp file, then handed to the store."""
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".csv.gz")
+        os.close(fd)
+        self._file = gzip.open(self.path, "wt", newline="")
+        self._writer = csv.writer(self._file)
+        self._header = False
+        self.rows = 0
+
+    def write(self, columns, rows):
+        if not self._header:
+            self._writer.writerow(columns)
+            self._header = True
+        for row in rows:
+            self._writer.writerow(
+                [json.dumps(v) if isinstance(v, (dict, list)) else v for v in row]
+            )
+        self.rows += len(rows)
+
+    def copy_from(self, cur, statement):
+        """Stream a COPY ... TO STDOUT straight into the file."""
+        cur.copy_expert(statement, self._file)
+        self._header = True
+
+    def close(self):
+        self._file.close()
+
+
+# -------------------------
+# Connection helpers
+# -------------------------
+def _connect():
+    """Maintenance uses its own autocommit connection instead of holding a pool slot."""
+    import psycopg2
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SET lock_timeout = %s", (PARTITION_LOCK_TIMEOUT,))
+    return conn
+
+
+def table_kind(cur, table):
+    """'p' for a partitioned table, 'r' for a plain one, None if it does not exist."""
+    cur.execute("SELECT relkind FROM pg_class WHERE relname = %s", (table,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def list_partitions(cur, table):
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        (table,),
+    )
+    return sorted(row[0] for row in cur.fetchall())
+
+
+# -------------------------
+# Maintenance steps
+# -------------------------
+def ensure_partitions(conn, table, months_ahead=PARTITION_MONTHS_AHEAD, today=None, first_month=None):
+    """
+    Create missing monthly partitions from first_month (default: this month)
+    through months_ahead months from now. Returns the names created.
+    """
+    from psycopg2 import sql
+
+    this_month = month_start(today or date.today())
+    month = month_start(first_month) if first_month else this_month
+    last = add_months(this_month, months_ahead)
+    created = []
+    with conn.cursor() as cur:
+        existing = set(list_partitions(cur, table))
+        while month <= last:
+            name = partition_name(table, month)
+            if name not in existing:
+                # CREATE ... PARTITION OF locks the parent exclusively; ATTACH only
+                # blocks other DDL, and attaching an empty table is instant
+                cur.execute(sql.SQL(
+                    "CREATE TABLE IF NOT EXISTS {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                ).format(sql.Identifier(name), sql.Identifier(table)))
+                cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(
+                    sql.Identifier(table), sql.Identifier(name)), (month, add_months(month, 1)))
+                created.append(name)
+                logger.info("partition_created", table=table, partition=name)
+            month = add_months(month, 1)
+    return created
+
+
+def retention_policies(cur):
+    """(default days, {user_id: days}) from SCAN_RETENTION_DAYS and the scan_retention table."""
+    cur.execute("SELECT user_id, retention_days FROM scan_retention")
+    return SCAN_RETENTION_DAYS, {str(user_id): days for user_id, days in cur.fetchall()}
+
+
+def purge_expired_rows(conn, table, store, now=None, batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete rows past their tenant's retention in short transactions (one batch
+    each) and archive them. Returns the number of rows purged.
+    """
+    from psycopg2 import sql
+
+    now = now or datetime.utcnow()
+    key = PARTITIONED_TABLES[table]
+    with conn.cursor() as cur:
+        default_days, overrides = retention_policies(cur)
+
+    # One cutoff per tenant with an override, one for everyone else
+    targets = [("user_id = %s", [user_id], days) for user_id, days in overrides.items()]
+    targets.append(("user_id NOT IN (SELECT user_id FROM scan_retention)", [], default_days))
+
+    archive = _ArchiveFile()
+    purged = 0
+    conn.autocommit = False
+    try:
+        for condition, params, days in targets:
+            cutoff = now - timedelta(days=days)
+            # The bound on the partition key prunes the scan to the old partitions
+            statement = sql.SQL(
+                """
+                DELETE FROM {table} WHERE (id, {key}) IN (
+                    SELECT id, {key} FROM {table}
+                    WHERE {key} < %s AND {condition}
+                    LIMIT %s
+                )
+                RETURNING *
+                """
+            ).format(table=sql.Identifier(table), key=sql.Identifier(key), condition=sql.SQL(condition))
+            while True:
+                # Archive before the batch commits so a failure never loses rows
+                with conn:
+                    with conn.cursor() as cur:
+                        cur.execute(statement, [cutoff, *params, batch_size])
+                        rows = cur.fetchall()
+                        if rows:
+                            archive.write([c.name for c in cur.description], rows)
+                purged += len(rows)
+                if len(rows) < batch_size:
+                    break
+    finally:
+        conn.autocommit = True
+        archive.close()
+
+    if archive.rows:
+        location = store.put(f"{table}/purged/{now.strftime('%Y%m%dT%H%M%SZ')}.csv.gz", archive.path)
+        logger.info("rows_purged", table=table, rows=purged, archive=location)
+    else:
+        os.remove(archive.path)
+    return purged
+
+
+def archive_expired_partitions(conn, table, store, now=None):
+    """
+    Archive and drop the partitions that end before the longest retention of
+    any tenant (every row in them has expired). Returns the names dropped.
+    """
+    from psycopg2 import sql
+
+    now = now or datetime.utcnow()
+    with conn.cursor() as cur:
+        default_days, overrides = retention_policies(cur)
+        horizon = (now - timedelta(days=max([default_days, *overrides.values()]))).date()
+        partitions = list_partitions(cur, table)
+        cur.execute("SHOW server_version_num")
+        concurrent = int(cur.fetchone()[0]) >= 140000
+
+    dropped = []
+    for name in partitions:
+        month = partition_month(name)
+        if month is None or add_months(month, 1) > horizon:
+            continue
+
+        archive = _ArchiveFile()
+        with conn.cursor() as cur:
+            archive.copy_from(cur, sql.SQL("COPY {} TO STDOUT WITH (FORMAT csv, HEADER)").format(
+                sql.Identifier(name)).as_string(conn))
+        archive.close()
+        location = store.put(f"{table}/{name}.csv.gz", archive.path)
+
+        with conn.cursor() as cur:
+            # Autocommit: DETACH ... CONCURRENTLY cannot run inside a transaction
+            detach = "ALTER TABLE {} DETACH PARTITION {} CONCURRENTLY" if concurrent else \
+                "ALTER TABLE {} DETACH PARTITION {}"
+            cur.execute(sql.SQL(detach).format(sql.Identifier(table), sql.Identifier(name)))
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        dropped.append(name)
+        logger.info("partition_archived", table=table, partition=name, archive=location)
+    return dropped
+
+
+def run_maintenance(store=None, now=None, archive=True):
+    """All maintenance steps for every partitioned table; skipped if another worker holds the lock."""
+    store = store or get_archive_store()
+    report = {"created": [], "purged_rows": 0, "archived": [], "skipped": False}
+    conn = _connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (_ADVISORY_LOCK_KEY,))
+            if not cur.fetchone()[0]:
+                report["skipped"] = True
+                return report
+        try:
+            for table in PARTITIONED_TABLES:
+                with conn.cursor() as cur:
+                    kind = table_kind(cur, table)
+                if kind != "p":
+                    if kind is not None:
+                        # Migration not applied yet (see README, Database Setup)
+                        logger.warning("table_not_partitioned", table=table)
+                    continue
+                report["created"] += ensure_partitions(conn, table)
+                if archive:
+                    # Whole partitions first, so rows in them are not deleted one batch at a time
+                    report["archived"] += archive_expired_partitions(conn, table, store, now)
+                    report["purged_rows"] += purge_expired_rows(conn, table, store, now)
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK_KEY,))
+    finally:
+        conn.close()
+    return report
+
+
+def backfill(source, table="scans"):
+    """
+    Copy an unpartitioned table (e.g. the old `scans`, renamed) into the
+    partitioned one, one month per transaction. Returns rows copied.
+    """
+    from psycopg2 import sql
+
+    key = PARTITIONED_TABLES[table]
+    conn = _connect()
+    copied = 0
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT min({key}), max({key}) FROM {src}").format(
+                key=sql.Identifier(key), src=sql.Identifier(source)))
+            first, last = cur.fetchone()
+        if first is None:
+            return 0
+        ensure_partitions(conn, table, first_month=first.date(),
+                          months_ahead=max(PARTITION_MONTHS_AHEAD, 0),
+                          today=max(last.date(), date.today()))
+        month = month_start(first.date())
+        conn.autocommit = False
+        while month <= month_start(last.date()):
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL(
+                        "INSERT INTO {dst} SELECT * FROM {src} WHERE {key} >= %s AND {key} < %s"
+                    ).format(dst=sql.Identifier(table), src=sql.Identifier(source), key=sql.Identifier(key)),
+                        (month, add_months(month, 1)))
+                    copied += cur.rowcount
+            logger.info("partition_backfilled", table=table, month=month.isoformat(), rows=copied)
+            month = add_months(month, 1)
+    finally:
+        conn.close()
+    return copied
+
+
+# -------------------------
+# Background scheduling
+# -------------------------
+_thread = None
+
+
+def start_maintenance_thread(interval=PARTITION_MAINTENANCE_INTERVAL):
+    """
+    Run maintenance every `interval` seconds in a daemon thread. No-op when 0
+    or when no database is configured.
+    """
+    global _thread
+    if interval <= 0 or not DB_CONFIG["host"] or _thread is not None:
+        return None
+
+    def loop():
+        while True:
+            try:
+                report = run_maintenance()
+                logger.info("partition_maintenance_finished", **report)
+            except Exception as e:
+                logger.warning("partition_maintenance_failed", error=str(e))
+            time.sleep(interval)
+
+    _thread = threading.Thread(target=loop, name="partition-maintenance", daemon=True)
+    _thread.start()
+    return _thread
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition maintenance for the scans table")
+    commands = parser.add_subparsers(dest="command", required=True)
+    maintain = commands.add_parser("maintain", help="create, purge and archive partitions")
+    maintain.add_argument("--no-archive", action="store_true", help="only create upcoming partitions")
+    fill = commands.add_parser("backfill", help="copy an unpartitioned table into scans")
+    fill.add_argument("source", help="e.g. scans_unpartitioned")
+    args = parser.parse_args()
+
+    if args.command == "maintain":
+        print(json.dumps(run_maintenance(archive=not args.no_archive), indent=2))
+    else:
+        print(json.dumps({"copied": backfill(args.source)}))
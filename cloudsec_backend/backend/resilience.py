@@ -0,0 +1,307 @@
+"""
+Request deadlines and per-dependency circuit breakers.
+
+Every HTTP request gets a deadline (set by the middleware in backend/main.py)
+and every external call takes its timeout from what is left of it, capped
+per dependency. A slow dependency then costs a request at most its budget,
+not each call's full timeout in turn, and no new call starts once the budget
+is spent. The deadline is a context variable, so it follows the request into
+threads started with contextvars.copy_context() (org scans, S3 collection).
+
+    timeout = time_left(OPA_TIMEOUT, "opa")       # raises DeadlineExceeded when spent
+    with breaker("opa").guard() as call:          # raises CircuitOpen while open
+        response = requests.post(url, timeout=timeout)
+        if response.status_code >= 500:
+            call.failed()
+
+A breaker opens after BREAKER_FAILURE_THRESHOLD consecutive failures and
+fails calls fast for BREAKER_RESET_SECONDS; then one trial call goes through
+(half-open) and its outcome closes or re-opens it. Callers fall back to
+cached or degraded responses where they have one; otherwise the request ends
+with 503 (CircuitOpen) or 504 (DeadlineExceeded). Breaker states, rejections
+and spent deadlines are exported as metrics.
+
+Breakers and fallback caches are per process.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from .log import get_logger
+from .metrics import (
+    CIRCUIT_REJECTED,
+    CIRCUIT_STATE,
+    CIRCUIT_TRANSITIONS,
+    DEADLINE_EXCEEDED,
+    DEGRADED_RESPONSES,
+    current_request,
+)
+
+logger = get_logger(__name__)
+
+# Seconds of budget per request; scans and streamed exports get their own (0 = no deadline)
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "30"))
+REQUEST_DEADLINE_SCAN = float(os.getenv("REQUEST_DEADLINE_SCAN", "900"))
+REQUEST_DEADLINE_EXPORT = float(os.getenv("REQUEST_DEADLINE_EXPORT", "0"))
+
+# BREAKER_<SETTING>_<DEPENDENCY> overrides these per dependency (OPA, SUPABASE_AUTH, STS, POSTGRES)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# Seconds a last good response may be served while its dependency is unavailable
+FALLBACK_MAX_AGE = float(os.getenv("FALLBACK_MAX_AGE", "300"))
+FALLBACK_CACHE_SIZE = int(os.getenv("FALLBACK_CACHE_SIZE", "10000"))
+
+
+class DependencyUnavailable(Exception):
+    """A dependency could not be called; the request ends with status_code."""
+    status_code = 503
+
+    def __init__(self, dependency, message, retry_after=None):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    status_code = 503
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    status_code = 504
+
+
+def _endpoint():
+    ctx = current_request()
+    return ctx.endpoint if ctx is not None else ""
+
+
+# -------------------------
+# Deadlines
+# -------------------------
+_deadline = contextvars.ContextVar("cloudsec_deadline", default=None)
+
+
+def request_budget(path):
+    """Deadline budget in seconds for a request path, or None."""
+    if path.startswith("/scan/"):
+        budget = REQUEST_DEADLINE_SCAN
+    elif path.startswith("/export/"):
+        budget = REQUEST_DEADLINE_EXPORT
+    else:
+        budget = REQUEST_DEADLINE
+    return budget or None
+
+
+def start_deadline(seconds):
+    """Set the deadline `seconds` from now (None: no deadline); returns a token for reset_deadline."""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def reset_deadline(token):
+    _deadline.reset(token)
+
+
+@contextmanager
+def deadline(seconds):
+    """Tighten the current deadline to at most `seconds` from now for the block."""
+    current = _deadline.get()
+    target = time.monotonic() + seconds
+    token = _deadline.set(target if current is None else min(current, target))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left before the deadline (negative once passed), or None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def deadline_exceeded(dependency, message=None):
+    """A counted DeadlineExceeded for the caller to raise."""
+    DEADLINE_EXCEEDED.inc(dependency=dependency, endpoint=_endpoint())
+    return DeadlineExceeded(dependency, message or f"Request deadline exceeded before calling {dependency}")
+
+
+def time_left(cap, dependency=""):
+    """
+    Timeout for one call: `cap`, or less if the deadline is nearer (None
+    when there is neither). Raises DeadlineExceeded once the deadline passed.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    if left <= 0:
+        raise deadline_exceeded(dependency)
+    return min(cap, left) if cap else left
+
+
+# -------------------------
+# Circuit breakers
+# -------------------------
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class _Call:
+    __slots__ = ("ok",)
+
+    def __init__(self):
+        self.ok = True
+
+    def failed(self):
+        """Count this call as a failure although it raised nothing (an HTTP 5xx, say)."""
+        self.ok = False
+
+
+def _always(error):
+    return True
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False  # a half-open trial call is in flight
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, dependency=name)
+
+    def _transition(self, state):
+        # Called with the lock held
+        if state != self.state:
+            self.state = state
+            CIRCUIT_STATE.set(_STATE_VALUES[state], dependency=self.name)
+            CIRCUIT_TRANSITIONS.inc(dependency=self.name, state=state)
+            logger.warning("circuit_state_changed", dependency=self.name, state=state, failures=self.failures)
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_seconds - time.monotonic())
+
+    def allow(self):
+        """Whether a call may go out now; an open breaker lets one trial through after reset_seconds."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() >= self.opened_at + self.reset_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self._trial:
+                self._trial = True
+                return True
+        CIRCUIT_REJECTED.inc(dependency=self.name, endpoint=_endpoint())
+        return False
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self._transition(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    @contextmanager
+    def guard(self, failure=_always):
+        """
+        Run the block as one call through the breaker. Exceptions for which
+        failure(e) is true count against the dependency; others (a 401, an
+        AccessDenied) mean it answered and count as successes.
+        """
+        if not self.allow():
+            raise CircuitOpen(self.name, f"{self.name} is unavailable (circuit open)", retry_after=self.retry_after())
+        call = _Call()
+        try:
+            yield call
+        except BaseException as e:
+            self.record(not (isinstance(e, Exception) and failure(e)))
+            raise
+        self.record(call.ok)
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def _setting(name, dependency, default):
+    return os.getenv(f"BREAKER_{name}_{dependency.upper()}", default)
+
+
+def breaker(dependency):
+    """The process-wide breaker of a dependency ("opa", "supabase_auth", "sts", "postgres")."""
+    cb = _breakers.get(dependency)
+    if cb is None:
+        with _breakers_lock:
+            cb = _breakers.get(dependency)
+            if cb is None:
+                cb = _breakers[dependency] = CircuitBreaker(
+                    dependency,
+                    failure_threshold=int(_setting("FAILURE_THRESHOLD", dependency, BREAKER_FAILURE_THRESHOLD)),
+                    reset_seconds=float(_setting("RESET_SECONDS", dependency, BREAKER_RESET_SECONDS)),
+                )
+    return cb
+
+
+def breaker_states():
+    return {name: cb.state for name, cb in _breakers.items()}
+
+
+# -------------------------
+# Fallbacks
+# -------------------------
+class FallbackCache:
+    """Last good value per key, served for up to max_age seconds while its dependency is unavailable."""
+
+    def __init__(self, dependency, max_age=FALLBACK_MAX_AGE, size=FALLBACK_CACHE_SIZE):
+        self.dependency = dependency
+        self.max_age = max_age
+        self.size = size
+        self._values = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def put(self, key, value):
+        with self._lock:
+            self._values[key] = (time.monotonic(), value)
+            self._values.move_to_end(key)
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._values.pop(key, None)
+
+    def get(self, key):
+        """The cached value if still fresh enough, else None; counted as a degraded response."""
+        with self._lock:
+            entry = self._values.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        DEGRADED_RESPONSES.inc(dependency=self.dependency, endpoint=_endpoint())
+        return entry[1]
+
+    def call(self, key, fn):
+        """
+        (value, degraded): fn()'s result, remembered; or, when fn raises
+        DependencyUnavailable, the last good value for key with degraded=True.
+        """
+        try:
+            value = fn()
+        except DependencyUnavailable as e:
+            cached = self.get(key)
+            if cached is None:
+                raise
+            logger.warning("serving_fallback", dependency=e.dependency, cache=self.dependency)
+            return cached, True
+        self.put(key, value)
+        return value, False
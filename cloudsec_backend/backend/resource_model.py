@@ -0,0 +1,326 @@
+"""
+Compact resource model for large inventories.
+
+boto3 responses carry dozens of nested fields per resource that nothing
+downstream reads. The classes below keep only what the policies
+(policies/*.rego), clean_aws_results and the dashboard use, in __slots__
+objects with tuples instead of nested dicts and lists. Inventory builds them
+page by page while scanning, so a full raw response never has to sit in
+memory, and renders the same document shape the rest of the pipeline expects.
+
+RawArchive keeps a lossless, zlib-compressed copy of the raw pages for
+callers that need every field (datetimes round-trip exactly).
+"""
+import gzip
+import json
+import os
+import zlib
+from datetime import datetime
+
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _tags(tags):
+    return tuple((t.get("Key"), t.get("Value")) for t in tags or ())
+
+
+class SecurityGroupRef:
+    __slots__ = ("group_id", "group_name")
+
+    def __init__(self, group_id, group_name):
+        self.group_id = group_id
+        self.group_name = group_name
+
+    def to_dict(self):
+        return {"GroupId": self.group_id, "GroupName": self.group_name}
+
+
+class Ec2Instance:
+    __slots__ = (
+        "instance_id", "instance_type", "state", "launch_time", "availability_zone",
+        "vpc_id", "subnet_id", "private_ip", "public_ip", "image_id", "security_groups", "tags",
+    )
+
+    def __init__(self, instance_id, instance_type=None, state=None, launch_time=None,
+                 availability_zone=None, vpc_id=None, subnet_id=None, private_ip=None,
+                 public_ip=None, image_id=None, security_groups=(), tags=()):
+        self.instance_id = instance_id
+        self.instance_type = instance_type
+        self.state = state
+        self.launch_time = launch_time
+        self.availability_zone = availability_zone
+        self.vpc_id = vpc_id
+        self.subnet_id = subnet_id
+        self.private_ip = private_ip
+        self.public_ip = public_ip
+        self.image_id = image_id
+        self.security_groups = security_groups
+        self.tags = tags
+
+    @classmethod
+    def from_boto(cls, inst):
+        return cls(
+            instance_id=inst.get("InstanceId"),
+            instance_type=inst.get("InstanceType"),
+            state=inst.get("State", {}).get("Name"),
+            launch_time=_iso(inst.get("LaunchTime")),
+            availability_zone=inst.get("Placement", {}).get("AvailabilityZone"),
+            vpc_id=inst.get("VpcId"),
+            subnet_id=inst.get("SubnetId"),
+            private_ip=inst.get("PrivateIpAddress"),
+            public_ip=inst.get("PublicIpAddress"),
+            image_id=inst.get("ImageId"),
+            security_groups=tuple(
+                SecurityGroupRef(sg.get("GroupId"), sg.get("GroupName")) for sg in inst.get("SecurityGroups", ())
+            ),
+            tags=_tags(inst.get("Tags")),
+        )
+
+    def to_dict(self):
+        doc = {
+            "InstanceId": self.instance_id,
+            "InstanceType": self.instance_type,
+            "State": {"Name": self.state},
+            "LaunchTime": self.launch_time,
+            "Placement": {"AvailabilityZone": self.availability_zone},
+            "VpcId": self.vpc_id,
+            "SubnetId": self.subnet_id,
+            "PrivateIpAddress": self.private_ip,
+            "ImageId": self.image_id,
+            "SecurityGroups": [sg.to_dict() for sg in self.security_groups],
+        }
+        if self.public_ip:
+            doc["PublicIpAddress"] = self.public_ip
+        # Untagged instances have no Tags key, as in describe_instances (ec2.rego relies on this)
+        if self.tags:
+            doc["Tags"] = [{"Key": k, "Value": v} for k, v in self.tags]
+        return doc
+
+
+class SecurityGroupRule:
+    __slots__ = ("protocol", "from_port", "to_port", "cidrs")
+
+    def __init__(self, protocol, from_port, to_port, cidrs):
+        self.protocol = protocol
+        self.from_port = from_port
+        self.to_port = to_port
+        self.cidrs = cidrs
+
+    @classmethod
+    def from_boto(cls, permission):
+        cidrs = tuple(r["CidrIp"] for r in permission.get("IpRanges", ()) if "CidrIp" in r)
+        cidrs += tuple(r["CidrIpv6"] for r in permission.get("Ipv6Ranges", ()) if "CidrIpv6" in r)
+        return cls(permission.get("IpProtocol"), permission.get("FromPort"), permission.get("ToPort"), cidrs)
+
+    def to_dict(self):
+        return {"IpProtocol": self.protocol, "FromPort": self.from_port, "ToPort": self.to_port,
+                "Cidrs": list(self.cidrs)}
+
+
+class SecurityGroup:
+    __slots__ = ("group_id", "group_name", "vpc_id", "region", "ingress")
+
+    def __init__(self, group_id, group_name=None, vpc_id=None, region=None, ingress=()):
+        self.group_id = group_id
+        self.group_name = group_name
+        self.vpc_id = vpc_id
+        self.region = region
+        self.ingress = ingress
+
+    @classmethod
+    def from_boto(cls, group, region=None):
+        return cls(
+            group_id=group.get("GroupId"),
+            group_name=group.get("GroupName"),
+            vpc_id=group.get("VpcId"),
+            region=region,
+            ingress=tuple(SecurityGroupRule.from_boto(p) for p in group.get("IpPermissions", ())),
+        )
+
+    def to_dict(self):
+        return {"GroupId": self.group_id, "GroupName": self.group_name, "VpcId": self.vpc_id,
+                "Region": self.region, "Ingress": [r.to_dict() for r in self.ingress]}
+
+
+class S3Bucket:
+    __slots__ = (
+        "name", "creation_date", "region", "public_access", "acl_public", "policy_public",
+        "public_access_block", "encryption", "versioning", "errors",
+    )
+
+    _BLOCK_FLAGS = ("BlockPublicAcls", "IgnorePublicAcls", "BlockPublicPolicy", "RestrictPublicBuckets")
+
+    def __init__(self, name, creation_date=None, region=None, public_access=False, acl_public=None,
+                 policy_public=None, public_access_block=None, encryption=None, versioning=None, errors=()):
+        self.name = name
+        self.creation_date = creation_date
+        self.region = region
+        self.public_access = public_access
+        self.acl_public = acl_public
+        self.policy_public = policy_public
+        self.public_access_block = public_access_block
+        self.encryption = encryption
+        self.versioning = versioning
+        self.errors = errors
+
+    @classmethod
+    def from_boto(cls, bucket):
+        """From a list_buckets entry or an s3_collector record."""
+        block = bucket.get("PublicAccessBlock")
+        return cls(
+            name=bucket.get("Name"),
+            creation_date=_iso(bucket.get("CreationDate")),
+            region=bucket.get("Region"),
+            public_access=bool(bucket.get("PublicAccess", False)),
+            acl_public=bucket.get("AclPublic"),
+            policy_public=bucket.get("PolicyIsPublic"),
+            public_access_block=tuple(bool(block.get(f)) for f in cls._BLOCK_FLAGS) if block else None,
+            encryption=bucket.get("Encryption"),
+            versioning=bucket.get("Versioning"),
+            errors=tuple((bucket.get("Errors") or {}).items()),
+        )
+
+    def to_dict(self):
+        doc = {
+            "Name": self.name,
+            "CreationDate": self.creation_date,
+            "Region": self.region,
+            "PublicAccess": self.public_access,
+        }
+        if self.acl_public is not None or self.policy_public is not None:
+            doc.update({
+                "AclPublic": self.acl_public,
+                "PolicyIsPublic": self.policy_public,
+                "PublicAccessBlock": dict(zip(self._BLOCK_FLAGS, self.public_access_block))
+                if self.public_access_block else None,
+                "Encryption": self.encryption,
+                "Versioning": self.versioning,
+                "Errors": dict(self.errors),
+            })
+        return doc
+
+
+class IamUser:
+    __slots__ = ("user_name", "user_id", "arn", "create_date", "password_last_used", "mfa_enabled")
+
+    def __init__(self, user_name, user_id=None, arn=None, create_date=None, password_last_used=None,
+                 mfa_enabled=None):
+        self.user_name = user_name
+        self.user_id = user_id
+        self.arn = arn
+        self.create_date = create_date
+        self.password_last_used = password_last_used
+        self.mfa_enabled = mfa_enabled
+
+    @classmethod
+    def from_boto(cls, user):
+        return cls(
+            user_name=user.get("UserName"),
+            user_id=user.get("UserId"),
+            arn=user.get("Arn"),
+            create_date=_iso(user.get("CreateDate")),
+            password_last_used=_iso(user.get("PasswordLastUsed")),
+            mfa_enabled=user.get("MFA"),
+        )
+
+    def to_dict(self):
+        doc = {"UserName": self.user_name, "UserId": self.user_id, "Arn": self.arn, "CreateDate": self.create_date}
+        if self.password_last_used:
+            doc["PasswordLastUsed"] = self.password_last_used
+        if self.mfa_enabled is not None:
+            doc["MFA"] = self.mfa_enabled
+        return doc
+
+
+# -------------------------
+# Raw archive
+# -------------------------
+def _encode_raw(obj):
+    if isinstance(obj, datetime):
+        return {"$dt": obj.isoformat()}
+    return str(obj)
+
+
+def _decode_raw(obj):
+    if len(obj) == 1 and "$dt" in obj:
+        return datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+class RawArchive:
+    """Compressed raw API pages, restorable field-for-field."""
+
+    def __init__(self):
+        self._pages = {}
+
+    def add(self, section, page):
+        encoded = json.dumps(page, default=_encode_raw, separators=(",", ":")).encode()
+        self._pages.setdefault(section, []).append(zlib.compress(encoded, 6))
+
+    def restore(self, section):
+        return [json.loads(zlib.decompress(blob), object_hook=_decode_raw) for blob in self._pages.get(section, [])]
+
+    def save(self, path):
+        """Write every section to a gzip'd JSON file (datetimes tagged as {"$dt": ...})."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump({section: self.restore(section) for section in self._pages}, f, default=_encode_raw)
+
+    @staticmethod
+    def load(path):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f, object_hook=_decode_raw)
+
+    def size(self):
+        return sum(len(blob) for blobs in self._pages.values() for blob in blobs)
+
+
+# -------------------------
+# Inventory
+# -------------------------
+class Inventory:
+    __slots__ = ("instances", "security_groups", "buckets", "users", "raw")
+
+    def __init__(self, keep_raw=False):
+        self.instances = []
+        self.security_groups = []
+        self.buckets = []
+        self.users = []
+        self.raw = RawArchive() if keep_raw else None
+
+    def __len__(self):
+        return len(self.instances) + len(self.security_groups) + len(self.buckets) + len(self.users)
+
+    def add_ec2_page(self, page):
+        if self.raw is not None:
+            self.raw.add("ec2", page)
+        for reservation in page.get("Reservations", []):
+            self.instances.extend(Ec2Instance.from_boto(inst) for inst in reservation.get("Instances", []))
+
+    def add_security_groups(self, groups, region=None):
+        if self.raw is not None:
+            self.raw.add("security_groups", groups)
+        self.security_groups.extend(SecurityGroup.from_boto(g, region) for g in groups)
+
+    def add_buckets(self, buckets):
+        if self.raw is not None:
+            self.raw.add("s3", buckets)
+        self.buckets.extend(S3Bucket.from_boto(b) for b in buckets)
+
+    def add_users(self, users):
+        if self.raw is not None:
+            self.raw.add("iam", users)
+        self.users.extend(IamUser.from_boto(u) for u in users)
+
+    def ec2_document(self):
+        # A single reservation keeps ec2.rego's input.ec2.Reservations[_].Instances[_]
+        # shape without carrying the original reservation wrappers.
+        return {"Reservations": [{"Instances": [inst.to_dict() for inst in self.instances]}] if self.instances else []}
+
+    def s3_document(self):
+        return {"s3_buckets": [b.to_dict() for b in self.buckets]}
+
+    def iam_document(self):
+        return {"Users": [u.to_dict() for u in self.users]}
@@ -0,0 +1,159 @@
+import os
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import ClientError
+
+S3_COLLECTOR_WORKERS = int(os.getenv("S3_COLLECTOR_WORKERS", "32"))
+
+PUBLIC_GRANTEES = {
+    "http://acs.amazonaws.com/groups/global/AllUsers",
+    "http://acs.amazonaws.com/groups/global/AuthenticatedUsers",
+}
+
+# Error codes that mean "not configured" rather than a failed check
+NOT_CONFIGURED = {
+    "NoSuchPublicAccessBlockConfiguration",
+    "NoSuchBucketPolicy",
+    "ServerSideEncryptionConfigurationNotFoundError",
+}
+
+
+class RegionalClients:
+    """One S3 client per region, created on first use and shared by all workers."""
+
+    def __init__(self, session, max_pool_connections=S3_COLLECTOR_WORKERS):
+        from botocore.config import Config
+
+        self.session = session
+        self.config = Config(max_pool_connections=max_pool_connections, retries={"mode": "adaptive"})
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, region=None):
+        key = region or "default"
+        client = self._clients.get(key)
+        if client is None:
+            # Client creation is not thread-safe; calls on a created client are.
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self.session.client("s3", region_name=region, config=self.config)
+                    self._clients[key] = client
+        return client
+
+
+def _submit(pool, fn, *args):
+    # Each task gets its own copy of the request context (metrics labels)
+    return pool.submit(contextvars.copy_context().run, fn, *args)
+
+
+def _bucket_region(clients, name):
+    location = clients.get().get_bucket_location(Bucket=name).get("LocationConstraint")
+    # us-east-1 is reported as None, and the legacy "EU" constraint means eu-west-1
+    if not location:
+        return "us-east-1"
+    if location == "EU":
+        return "eu-west-1"
+    return location
+
+
+def _public_access_block(client, name):
+    return client.get_public_access_block(Bucket=name).get("PublicAccessBlockConfiguration")
+
+
+def _policy_is_public(client, name):
+    return client.get_bucket_policy_status(Bucket=name).get("PolicyStatus", {}).get("IsPublic", False)
+
+
+def _acl_is_public(client, name):
+    grants = client.get_bucket_acl(Bucket=name).get("Grants", [])
+    return any(grant.get("Grantee", {}).get("URI") in PUBLIC_GRANTEES for grant in grants)
+
+
+def _encryption(client, name):
+    rules = client.get_bucket_encryption(Bucket=name).get(
+        "ServerSideEncryptionConfiguration", {}
+    ).get("Rules", [])
+    for rule in rules:
+        algorithm = rule.get("ApplyServerSideEncryptionByDefault", {}).get("SSEAlgorithm")
+        if algorithm:
+            return algorithm
+    return None
+
+
+def _versioning(client, name):
+    return client.get_bucket_versioning(Bucket=name).get("Status", "Disabled")
+
+
+CHECKS = {
+    "PublicAccessBlock": _public_access_block,
+    "PolicyIsPublic": _policy_is_public,
+    "AclPublic": _acl_is_public,
+    "Encryption": _encryption,
+    "Versioning": _versioning,
+}
+
+
+def _run_check(check, client, name):
+    try:
+        return CHECKS[check](client, name), None
+    except ClientError as e:
+        code = e.response.get("Error", {}).get("Code", "")
+        if code in NOT_CONFIGURED:
+            return None, None
+        return None, code or str(e)
+
+
+def _is_public(record):
+    """Public through the ACL or the bucket policy, unless the access block neutralises that path."""
+    block = record.get("PublicAccessBlock") or {}
+    acl_public = record.get("AclPublic") and not block.get("IgnorePublicAcls")
+    policy_public = record.get("PolicyIsPublic") and not block.get("RestrictPublicBuckets")
+    return bool(acl_public or policy_public)
+
+
+def collect_s3_posture(session, buckets=None, max_workers=S3_COLLECTOR_WORKERS):
+    """
+    Assess every bucket: resolve its region, then fetch public access block,
+    policy status, ACL, encryption and versioning from a client in that region.
+    All calls run concurrently on one bounded thread pool.
+    """
+    clients = RegionalClients(session, max_pool_connections=max_workers)
+    if buckets is None:
+        buckets = clients.get().list_buckets().get("Buckets", [])
+    if not buckets:
+        return []
+
+    records = [
+        {"Name": b["Name"], "CreationDate": b.get("CreationDate"), "Region": None, "Errors": {}}
+        for b in buckets
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Phase 1: regions
+        region_futures = [(record, _submit(pool, _bucket_region, clients, record["Name"])) for record in records]
+        for record, future in region_futures:
+            try:
+                record["Region"] = future.result()
+            except ClientError as e:
+                record["Errors"]["Region"] = e.response.get("Error", {}).get("Code", str(e))
+
+        # Phase 2: every check for every bucket, against its regional client
+        check_futures = []
+        for record in records:
+            client = clients.get(record["Region"])
+            for check in CHECKS:
+                check_futures.append((record, check, _submit(pool, _run_check, check, client, record["Name"])))
+
+        for record, check, future in check_futures:
+            value, error = future.result()
+            record[check] = value
+            if error:
+                record["Errors"][check] = error
+
+    for record in records:
+        record["PublicAccess"] = _is_public(record)
+        record["Versioning"] = record.get("Versioning") or "Disabled"
+    return records
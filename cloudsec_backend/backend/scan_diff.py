@@ -0,0 +1,222 @@
+"""
+Scan-to-scan diffs.
+
+Each scan is reduced to a digest: its findings keyed by fingerprint, and its
+resources as fingerprint -> content hash (backend/findings.py). Two digests
+are compared as hash sets, so a diff never walks the scan documents:
+
+    findings   added / resolved / unchanged
+    resources  added / removed / changed (same resource, new attributes) / unchanged
+
+Responses carry the counts and at most `limit` items per list.
+
+With SCAN_DIFFS=true, saving a scan stores its digest (scan_digests) and its
+diff against the previous scan of the same account and type (scan_diffs) in
+the save transaction; otherwise digests are built from the stored documents
+when a diff is requested.
+"""
+import heapq
+import json
+import os
+import zlib
+
+from .findings import fingerprint, finding_key, finding_rows, resource_key, resource_rows
+from .metrics import instrumented
+from .services import db_connection
+
+SCAN_DIFFS = os.getenv("SCAN_DIFFS", "false").lower() in ("1", "true", "yes")
+# Items kept per list in cached diffs, and the largest `limit` a request may ask for
+SCAN_DIFF_MAX_ITEMS = int(os.getenv("SCAN_DIFF_MAX_ITEMS", "500"))
+
+
+class ScanNotFound(LookupError):
+    pass
+
+
+class ScanDigest:
+    __slots__ = ("findings", "resources")
+
+    def __init__(self, findings=None, resources=None):
+        self.findings = findings or {}    # key -> [service, resource, issue, severity]
+        self.resources = resources or {}  # key -> (content hash, resource type, resource id)
+
+    @classmethod
+    def from_document(cls, data):
+        digest = cls()
+        for _, service, resource, issue, severity in finding_rows(data):
+            digest.findings[finding_key(service, resource, issue)] = [service, resource, issue, severity]
+        for resource_type, resource_id, _, _, attributes in resource_rows(data):
+            digest.resources[resource_key(resource_type, resource_id)] = (
+                fingerprint(attributes), resource_type, resource_id,
+            )
+        return digest
+
+    def pack(self):
+        """(findings JSON, zlib-compressed resource lines) for scan_digests."""
+        lines = "\n".join(
+            f"{key}\t{h}\t{t}\t{i}" for key, (h, t, i) in sorted(self.resources.items())
+        )
+        return json.dumps(self.findings), zlib.compress(lines.encode(), 6)
+
+    @classmethod
+    def unpack(cls, findings, resources):
+        digest = cls(findings=json.loads(findings) if isinstance(findings, str) else findings)
+        text = zlib.decompress(bytes(resources)).decode()
+        for line in text.split("\n") if text else ():
+            key, content_hash, resource_type, resource_id = line.split("\t", 3)
+            digest.resources[key] = (content_hash, resource_type, resource_id)
+        return digest
+
+
+# -------------------------
+# Diffing
+# -------------------------
+def _finding_item(row):
+    service, resource, issue, severity = row
+    return {"service": service, "resource": resource, "issue": issue, "severity": severity}
+
+
+def _resource_item(entry):
+    return {"type": entry[1], "id": entry[2]}
+
+
+def _first(keys, limit):
+    # Sorted by key so the same diff always lists the same items
+    return heapq.nsmallest(limit, keys)
+
+
+def diff_digests(base, target, limit=SCAN_DIFF_MAX_ITEMS):
+    base_findings, target_findings = base.findings.keys(), target.findings.keys()
+    added, resolved = target_findings - base_findings, base_findings - target_findings
+
+    base_resources, target_resources = base.resources.keys(), target.resources.keys()
+    new, removed = target_resources - base_resources, base_resources - target_resources
+    kept = target_resources & base_resources
+    changed = [k for k in kept if base.resources[k][0] != target.resources[k][0]]
+
+    return {
+        "findings": {
+            "added": len(added),
+            "resolved": len(resolved),
+            "unchanged": len(target_findings) - len(added),
+            "added_items": [_finding_item(target.findings[k]) for k in _first(added, limit)],
+            "resolved_items": [_finding_item(base.findings[k]) for k in _first(resolved, limit)],
+        },
+        "resources": {
+            "added": len(new),
+            "removed": len(removed),
+            "changed": len(changed),
+            "unchanged": len(kept) - len(changed),
+            "added_items": [_resource_item(target.resources[k]) for k in _first(new, limit)],
+            "removed_items": [_resource_item(base.resources[k]) for k in _first(removed, limit)],
+            "changed_items": [_resource_item(target.resources[k]) for k in _first(changed, limit)],
+        },
+    }
+
+
+def truncate(diff, limit):
+    """A cached diff with at most `limit` items per list."""
+    return {
+        section: {name: value[:limit] if isinstance(value, list) else value for name, value in counts.items()}
+        for section, counts in diff.items()
+    }
+
+
+# -------------------------
+# Storage
+# -------------------------
+def _scan(cur, user_id, scan_id):
+    cur.execute(
+        "SELECT id, created_at, aws_account_id, scan_type FROM scans WHERE id = %s AND user_id = %s",
+        (scan_id, user_id),
+    )
+    row = cur.fetchone()
+    if row is None:
+        raise ScanNotFound(f"Scan {scan_id} not found")
+    return row
+
+
+def _previous_scan(cur, user_id, aws_account_id, scan_type, created_at):
+    cur.execute(
+        """
+        SELECT id, created_at, aws_account_id, scan_type FROM scans
+        WHERE user_id = %s AND aws_account_id IS NOT DISTINCT FROM %s AND scan_type = %s
+          AND created_at < %s
+        ORDER BY created_at DESC
+        LIMIT 1
+        """,
+        (user_id, aws_account_id, scan_type, created_at),
+    )
+    return cur.fetchone()
+
+
+def _load_digest(cur, scan):
+    scan_id, created_at = scan[0], scan[1]
+    if SCAN_DIFFS:
+        cur.execute(
+            "SELECT findings, resources FROM scan_digests WHERE scan_id = %s AND created_at = %s",
+            (scan_id, created_at),
+        )
+        row = cur.fetchone()
+        if row is not None:
+            return ScanDigest.unpack(*row)
+    cur.execute("SELECT data FROM scans WHERE id = %s AND created_at = %s", (scan_id, created_at))
+    data = cur.fetchone()[0]
+    return ScanDigest.from_document(json.loads(data) if isinstance(data, str) else data)
+
+
+def store_digest(cur, scan_id, user_id, aws_account_id, scan_type, created_at, document):
+    """
+    Save the new scan's digest and its diff against the previous scan of the
+    same account and type, on the caller's cursor (inside the save transaction).
+    """
+    digest = ScanDigest.from_document(document)
+    findings, resources = digest.pack()
+    cur.execute(
+        """
+        INSERT INTO scan_digests (scan_id, user_id, created_at, findings, resources)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        (scan_id, user_id, created_at, findings, resources),
+    )
+
+    previous = _previous_scan(cur, user_id, aws_account_id, scan_type, created_at)
+    if previous is None:
+        return None
+    diff = diff_digests(_load_digest(cur, previous), digest, SCAN_DIFF_MAX_ITEMS)
+    cur.execute(
+        """
+        INSERT INTO scan_diffs (scan_id, base_scan_id, user_id, created_at, diff)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        (scan_id, previous[0], user_id, created_at, json.dumps(diff)),
+    )
+    return diff
+
+
+@instrumented("postgres")
+def get_scan_diff(user_id, target_id, base_id=None, limit=100):
+    """
+    Diff of scan `target_id` against `base_id` (default: the previous scan of
+    the same account and type). Raises ScanNotFound for another tenant's scan.
+    """
+    limit = max(0, min(limit, SCAN_DIFF_MAX_ITEMS))
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            target = _scan(cur, user_id, target_id)
+            base = _scan(cur, user_id, base_id) if base_id else _previous_scan(cur, user_id, *target[2:], target[1])
+            if base is None:
+                raise ScanNotFound(f"No earlier scan to compare scan {target_id} with")
+
+            result = {"base_scan_id": base[0], "target_scan_id": target[0], "cached": False}
+            if SCAN_DIFFS:
+                cur.execute(
+                    "SELECT diff FROM scan_diffs WHERE scan_id = %s AND base_scan_id = %s AND created_at = %s",
+                    (target[0], base[0], target[1]),
+                )
+                row = cur.fetchone()
+                if row is not None:
+                    diff = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+                    return {**result, **truncate(diff, limit), "cached": True}
+
+            return {**result, **diff_digests(_load_digest(cur, base), _load_digest(cur, target), limit)}
@@ -0,0 +1,153 @@
+"""
+Lazy service registry.
+
+Clients for external services (Supabase, the Postgres pool, AWS) are built
+on first use instead of at import time, so importing the app is fast and does
+not need credentials in the environment. The heavy libraries are imported
+inside the factories for the same reason.
+
+    from .services import db_connection, supabase_client
+    with db_connection() as conn: ...
+    supabase_client().table("scan_results")...
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+from .resilience import breaker, deadline_exceeded, time_left
+
+load_dotenv()
+
+DB_CONFIG = {
+    "dbname": os.getenv("SUPABASE_DB"),
+    "user": os.getenv("SUPABASE_USER"),
+    "password": os.getenv("SUPABASE_PASS"),
+    "host": os.getenv("SUPABASE_HOST"),
+    "port": "5432",
+    "sslmode": "require",
+    "connect_timeout": os.getenv("DB_CONNECT_TIMEOUT", "5"),
+}
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+
+class LazyService:
+    """Builds its instance once, on first get(), thread-safely."""
+
+    def __init__(self, name, factory, close=None):
+        self.name = name
+        self.factory = factory
+        self.close = close
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self.factory()
+        return self._instance
+
+    def reset(self):
+        with self._lock:
+            instance, self._instance = self._instance, None
+        if instance is not None and self.close is not None:
+            self.close(instance)
+
+
+_registry = {}
+
+
+def register(name, factory, close=None):
+    _registry[name] = LazyService(name, factory, close)
+    return _registry[name]
+
+
+def get(name):
+    return _registry[name].get()
+
+
+def reset(name=None):
+    """Drop built instances (all of them by default); they are rebuilt on next use."""
+    for service in ([_registry[name]] if name else list(_registry.values())):
+        service.reset()
+
+
+def built_services():
+    return [name for name, service in _registry.items() if service.built]
+
+
+# -------------------------
+# Factories
+# -------------------------
+def _build_supabase():
+    from supabase import create_client
+
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set to use the Supabase client")
+    return create_client(url, key)
+
+
+def _build_db_pool():
+    from psycopg2.pool import ThreadedConnectionPool
+
+    return ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONFIG)
+
+
+register("supabase", _build_supabase)
+register("db_pool", _build_db_pool, close=lambda pool: pool.closeall())
+
+# ThreadedConnectionPool raises when exhausted; callers wait for a free slot instead
+_db_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+# -------------------------
+# Accessors
+# -------------------------
+def supabase_client():
+    return get("supabase")
+
+
+@contextmanager
+def db_connection():
+    """
+    A pooled Postgres connection. Commits on success and rolls back on error,
+    like `with psycopg2.connect(...) as conn`, then returns it to the pool.
+
+    Under a request deadline, waiting for a free connection is bounded by it
+    and the transaction's statement_timeout is what is left of it. Lost
+    connections and timeouts count against the "postgres" breaker.
+    """
+    timeout = time_left(None, "postgres")
+    if not _db_slots.acquire(timeout=timeout):
+        raise deadline_exceeded("postgres", "No database connection became free before the request deadline")
+    try:
+        with breaker("postgres").guard(_db_unavailable):
+            pool = get("db_pool")
+            conn = pool.getconn()
+            try:
+                with conn:
+                    if timeout is not None:
+                        left = time_left(timeout, "postgres")
+                        with conn.cursor() as cur:
+                            cur.execute("SET LOCAL statement_timeout = %s", (max(1, int(left * 1000)),))
+                    yield conn
+            finally:
+                pool.putconn(conn, close=conn.closed != 0)
+    finally:
+        _db_slots.release()
+
+
+def _db_unavailable(error):
+    import psycopg2
+
+    # Connection failures, server shutdowns and statement timeouts; not constraint or SQL errors
+    return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
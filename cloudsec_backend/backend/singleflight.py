@@ -0,0 +1,114 @@
+"""
+Request coalescing (single-flight).
+
+Identical concurrent work - a double-clicked scan, several dashboard tabs
+loading at once - runs once: the first caller for a key (the leader) runs
+it and every caller arriving meanwhile waits for and shares its result. A
+successful result is also handed to callers arriving within the operation's
+join window after it finished. Errors are shared with waiting callers only.
+
+    result = coalesce(("scan_cspm_multi", user_id, account_id), lambda: run_scan(...))
+
+Keys start with the operation name and must include the tenant. Coalescing
+is per process; each worker coalesces its own requests.
+"""
+import os
+import threading
+import time
+
+from .metrics import SINGLEFLIGHT_CALLS, SINGLEFLIGHT_SAVED_SECONDS
+from .resilience import deadline_exceeded, time_left
+
+# Seconds a finished result is still shared; SINGLEFLIGHT_JOIN_WINDOW_<OPERATION> overrides it
+SINGLEFLIGHT_JOIN_WINDOW = float(os.getenv("SINGLEFLIGHT_JOIN_WINDOW", "1.0"))
+
+
+def join_window(operation):
+    return float(os.getenv(f"SINGLEFLIGHT_JOIN_WINDOW_{operation.upper()}", SINGLEFLIGHT_JOIN_WINDOW))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "duration", "expires_at")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.duration = 0.0
+        self.expires_at = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> _Call, in flight or within its join window
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, window=None):
+        operation = key[0]
+        window = join_window(operation) if window is None else window
+        with self._lock:
+            now = time.monotonic()
+            call = self._calls.get(key)
+            if call is None or (call.expires_at is not None and call.expires_at <= now):
+                self._evict(now)
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                leader = False
+                outcome = "window" if call.done.is_set() else "inflight"
+
+        if leader:
+            return self._lead(key, call, fn, window)
+
+        # A follower waits no longer than its own request deadline
+        if not call.done.wait(time_left(None, operation)):
+            raise deadline_exceeded(operation, f"Request deadline exceeded waiting for a running {operation}")
+        SINGLEFLIGHT_CALLS.inc(operation=operation, outcome=outcome)
+        SINGLEFLIGHT_SAVED_SECONDS.inc(call.duration, operation=operation)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _lead(self, key, call, fn, window):
+        started = time.monotonic()
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            finished = time.monotonic()
+            call.duration = finished - started
+            with self._lock:
+                if call.error is not None or window <= 0:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                else:
+                    call.expires_at = finished + window
+            call.done.set()
+            SINGLEFLIGHT_CALLS.inc(operation=key[0], outcome="leader")
+
+    def forget(self, key):
+        """Drop a shared result (after a write); a running call finishes but is no longer joined."""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    def _evict(self, now):
+        for key in [k for k, c in self._calls.items() if c.expires_at is not None and c.expires_at <= now]:
+            del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
+
+
+_flights = SingleFlight()
+
+
+def coalesce(key, fn, window=None):
+    """Run fn once for concurrent callers with the same key; see SingleFlight.do."""
+    return _flights.do(key, fn, window)
+
+
+def forget(key):
+    _flights.forget(key)
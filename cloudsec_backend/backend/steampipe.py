@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import threading
+import subprocess
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from .log import get_logger
+from .metrics import STEAMPIPE_FALLBACKS
+from .resilience import DependencyUnavailable
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+# Steampipe service (`steampipe service start`) exposes a Postgres endpoint
+STEAMPIPE_BACKEND = os.getenv("STEAMPIPE_BACKEND", "service")  # service | cli | local
+STEAMPIPE_DB_CONFIG = {
+    "dbname": os.getenv("STEAMPIPE_DB", "steampipe"),
+    "user": os.getenv("STEAMPIPE_USER", "steampipe"),
+    "password": os.getenv("STEAMPIPE_PASS"),
+    "host": os.getenv("STEAMPIPE_HOST", "localhost"),
+    "port": os.getenv("STEAMPIPE_PORT", "9193"),
+}
+STEAMPIPE_POOL_SIZE = int(os.getenv("STEAMPIPE_POOL_SIZE", "4"))
+STEAMPIPE_CACHE_TTL = float(os.getenv("STEAMPIPE_CACHE_TTL", "300"))
+# Most cached results kept (least recently used are dropped first)
+STEAMPIPE_CACHE_SIZE = int(os.getenv("STEAMPIPE_CACHE_SIZE", "1024"))
+# CLI subprocesses allowed at once when the service backend fails (0: no CLI fallback)
+STEAMPIPE_CLI_FALLBACK_CONCURRENCY = int(os.getenv("STEAMPIPE_CLI_FALLBACK_CONCURRENCY", "2"))
+STEAMPIPE_LOCAL_FIXTURES = os.getenv("STEAMPIPE_LOCAL_FIXTURES")
+
+# -------------------------
+# Whitelisted queries
+# -------------------------
+# Only these queries can be run; parameters are bound by the driver, never
+# interpolated by callers.
+QUERIES = {
+    "iam_users": {
+        "sql": "select * from aws_iam_user limit %(limit)s;",
+        "params": {"limit": 5},
+    },
+    "iam_users_without_mfa": {
+        "sql": "select name, arn, create_date from aws_iam_user where not mfa_enabled limit %(limit)s;",
+        "params": {"limit": 100},
+    },
+    "public_s3_buckets": {
+        "sql": "select name, region, bucket_policy_is_public from aws_s3_bucket where bucket_policy_is_public limit %(limit)s;",
+        "params": {"limit": 100},
+    },
+    "ec2_instances_by_state": {
+        "sql": "select instance_id, instance_type, region, instance_state from aws_ec2_instance where instance_state = %(state)s limit %(limit)s;",
+        "params": {"state": "running", "limit": 100},
+    },
+}
+
+MAX_LIMIT = 1000
+
+
+class SteampipeQueryError(Exception):
+    pass
+
+
+def resolve_query(name: str, params: dict = None):
+    """
+    Look up a whitelisted query and merge caller params over its defaults.
+    Unknown queries or parameters raise SteampipeQueryError.
+    """
+    if name not in QUERIES:
+        raise SteampipeQueryError(f"Unknown query '{name}'")
+
+    spec = QUERIES[name]
+    bound = dict(spec["params"])
+    for key, value in (params or {}).items():
+        if value is None:
+            continue
+        if key not in bound:
+            raise SteampipeQueryError(f"Unknown parameter '{key}' for query '{name}'")
+        default = bound[key]
+        try:
+            bound[key] = type(default)(value)
+        except (TypeError, ValueError):
+            raise SteampipeQueryError(f"Invalid value for parameter '{key}'")
+
+    if "limit" in bound and not 0 < bound["limit"] <= MAX_LIMIT:
+        raise SteampipeQueryError(f"limit must be between 1 and {MAX_LIMIT}")
+    return spec["sql"], bound
+
+
+# -------------------------
+# Backends
+# -------------------------
+class ServiceBackend:
+    """Long-lived connection pool to the Steampipe Postgres service."""
+
+    def __init__(self, db_config: dict = None, pool_size: int = STEAMPIPE_POOL_SIZE):
+        self.db_config = db_config or STEAMPIPE_DB_CONFIG
+        self.pool_size = pool_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+                    self._pool = ThreadedConnectionPool(1, self.pool_size, **self.db_config)
+        return self._pool
+
+    def query(self, sql: str, params: dict) -> list:
+        from psycopg2.extras import RealDictCursor
+
+        pool = self._get_pool()
+        conn = pool.getconn()
+        broken = False
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                cur.execute(sql, params)
+                rows = [dict(r) for r in cur.fetchall()]
+            conn.rollback()
+            return rows
+        except Exception:
+            broken = conn.closed != 0
+            raise
+        finally:
+            pool.putconn(conn, close=broken)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+class CliBackend:
+    """Fallback: one `steampipe query --json` subprocess per query."""
+
+    def query(self, sql: str, params: dict) -> list:
+        completed_process = subprocess.run(
+            ['steampipe', 'query', '--json', sql % {k: _sql_literal(v) for k, v in params.items()}],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        results = json.loads(completed_process.stdout)
+        # Newer CLI versions wrap rows as {"columns": [...], "rows": [...]}
+        if isinstance(results, dict):
+            return results.get("rows", [])
+        return results
+
+
+class LocalBackend:
+    """
+    Stand-in backend for tests and local development. Returns canned rows
+    per query name from a dict or a JSON fixtures file.
+    """
+
+    def __init__(self, fixtures: dict = None, fixtures_path: str = STEAMPIPE_LOCAL_FIXTURES):
+        if fixtures is None and fixtures_path and os.path.exists(fixtures_path):
+            with open(fixtures_path) as f:
+                fixtures = json.load(f)
+        self.fixtures = fixtures or {}
+        self.calls = 0
+
+    def query(self, sql: str, params: dict) -> list:
+        self.calls += 1
+        for name, spec in QUERIES.items():
+            if spec["sql"] == sql:
+                rows = self.fixtures.get(name, [])
+                return rows[:params["limit"]] if "limit" in params else rows
+        return []
+
+
+def _sql_literal(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+# -------------------------
+# Client with per-tenant TTL cache
+# -------------------------
+class SteampipeClient:
+    def __init__(self, backend=None, fallback=None, ttl: float = STEAMPIPE_CACHE_TTL,
+                 max_entries: int = STEAMPIPE_CACHE_SIZE,
+                 fallback_concurrency: int = STEAMPIPE_CLI_FALLBACK_CONCURRENCY):
+        self.backend = backend
+        self.fallback = fallback
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # key -> (expires_at, rows, source)
+        self._lock = threading.Lock()
+        # Each fallback query is a subprocess: never let a failing service fan out into many
+        self._fallback_slots = threading.BoundedSemaphore(fallback_concurrency) if fallback_concurrency > 0 else None
+
+    def query(self, tenant_id: str, name: str, params: dict = None, use_cache: bool = True) -> dict:
+        sql, bound = resolve_query(name, params)
+        key = (tenant_id, name, tuple(sorted(bound.items())))
+        now = time.monotonic()
+
+        if use_cache:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached and cached[0] > now:
+                    self._cache.move_to_end(key)
+                    return {"rows": cached[1], "cached": True, "source": cached[2]}
+
+        try:
+            rows, source = self.backend.query(sql, bound), "primary"
+        except Exception as e:
+            if self.fallback is None:
+                raise
+            rows, source = self._query_fallback(name, sql, bound, e), "fallback"
+
+        self._remember(key, (now + self.ttl, rows, source))
+        return {"rows": rows, "cached": False, "source": source}
+
+    def _query_fallback(self, name, sql, bound, error):
+        if self._fallback_slots is None or not self._fallback_slots.acquire(blocking=False):
+            STEAMPIPE_FALLBACKS.inc(outcome="rejected")
+            logger.warning("steampipe_fallback_rejected", query=name, error=str(error))
+            raise DependencyUnavailable("steampipe", f"Steampipe service unavailable: {error}") from error
+        STEAMPIPE_FALLBACKS.inc(outcome="cli")
+        logger.warning("steampipe_fallback", query=name, error=str(error))
+        try:
+            return self.fallback.query(sql, bound)
+        finally:
+            self._fallback_slots.release()
+
+    def _remember(self, key, entry):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def invalidate(self, tenant_id: str = None):
+        with self._lock:
+            if tenant_id is None:
+                self._cache.clear()
+            else:
+                for key in [k for k in self._cache if k[0] == tenant_id]:
+                    del self._cache[key]
+
+
+def build_client(backend_name: str = STEAMPIPE_BACKEND) -> SteampipeClient:
+    if backend_name == "local":
+        return SteampipeClient(LocalBackend())
+    if backend_name == "cli":
+        return SteampipeClient(CliBackend())
+    return SteampipeClient(ServiceBackend(), fallback=CliBackend())
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_steampipe_client() -> SteampipeClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = build_client()
+    return _client
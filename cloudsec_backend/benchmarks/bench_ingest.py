@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Scan ingestion benchmark: row-by-row INSERTs vs execute_values vs COPY.
+
+    python -m benchmarks.bench_ingest --resources 100000 --chunk-sizes 1000 5000 20000
+
+Builds one synthetic scan document (benchmarks/synthetic.py through scan_all
+and clean_aws_results), then times ingest_scan writing the scan row, its
+findings and its normalized resources with each method. Needs a local
+Postgres (BENCH_PG_HOST, BENCH_PG_PORT, BENCH_PG_DB, BENCH_PG_USER,
+BENCH_PG_PASS); tables are created in a throwaway `bench_ingest` schema.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import SyntheticAccount, SyntheticSession
+
+SCHEMA = "bench_ingest"
+USER_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def insert_rows(cur, table, columns, rows, chunk_size=None):
+    """The baseline: one INSERT statement per row."""
+    from psycopg2 import sql
+
+    statement = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+        sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns)),
+        sql.SQL(", ").join(sql.Placeholder() * len(columns)),
+    ).as_string(cur)
+    written = 0
+    for row in rows:
+        cur.execute(statement, row)
+        written += 1
+    return written
+
+
+def configure_postgres():
+    from backend import services
+
+    if not os.getenv("BENCH_PG_HOST"):
+        return False
+    services.DB_CONFIG.update({
+        "host": os.getenv("BENCH_PG_HOST"),
+        "port": os.getenv("BENCH_PG_PORT", "5432"),
+        "dbname": os.getenv("BENCH_PG_DB", "postgres"),
+        "user": os.getenv("BENCH_PG_USER", "postgres"),
+        "password": os.getenv("BENCH_PG_PASS", ""),
+        "sslmode": "disable",
+        "options": f"-c search_path={SCHEMA}",
+    })
+    services.reset("db_pool")
+    with services.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+                CREATE SCHEMA {SCHEMA};
+                CREATE TABLE scans (
+                    id BIGSERIAL PRIMARY KEY, user_id UUID, aws_account_id UUID, data JSONB,
+                    scan_type TEXT, created_at TIMESTAMP DEFAULT NOW()
+                );
+                CREATE TABLE scan_findings (
+                    id BIGSERIAL PRIMARY KEY, scan_id BIGINT NOT NULL, user_id UUID, created_at TIMESTAMP NOT NULL,
+                    source TEXT, service TEXT, resource TEXT, issue TEXT, severity TEXT
+                );
+                CREATE INDEX ON scan_findings (scan_id);
+                CREATE TABLE scan_resources (
+                    id BIGSERIAL PRIMARY KEY, scan_id BIGINT NOT NULL, user_id UUID, created_at TIMESTAMP NOT NULL,
+                    resource_type TEXT, resource_id TEXT, region TEXT, name TEXT, attributes JSONB
+                );
+                CREATE INDEX ON scan_resources (scan_id);
+            """)
+    return True
+
+
+def build_document(resources):
+    from fastapi.encoders import jsonable_encoder
+    from backend import aws_scanner
+    from backend.normalize import clean_aws_results
+
+    account = SyntheticAccount.with_resources(resources)
+    session = SyntheticSession(account)
+    aws_scanner.get_session = lambda credentials=None: session
+    return jsonable_encoder(clean_aws_results(aws_scanner.scan_all())), account.resource_count
+
+
+def run(document, method, chunk_size, repeat, normalized=True):
+    from backend import ingest, services
+
+    timings = []
+    result = None
+    for _ in range(repeat):
+        with services.db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("TRUNCATE scans, scan_findings, scan_resources")
+        payload = json.dumps(document)
+        start = time.perf_counter()
+        result = ingest.ingest_scan(USER_ID, document, scan_type="cspm", payload=payload,
+                                    method=method, chunk_size=chunk_size, normalized=normalized)
+        timings.append(time.perf_counter() - start)
+    rows = 1 + result["findings"] + result["resources"]
+    latency = statistics.median(timings)
+    return {
+        "method": method,
+        "chunk_size": chunk_size if method != "row" else None,
+        "rows": rows,
+        "latency_ms": round(latency * 1000, 1),
+        "rows_per_second": round(rows / latency),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare scan ingestion methods against a local Postgres")
+    parser.add_argument("--resources", type=int, default=100000)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    from backend import ingest, services
+
+    if not configure_postgres():
+        print("⚠️  Set BENCH_PG_HOST (and BENCH_PG_PORT, BENCH_PG_DB, BENCH_PG_USER, BENCH_PG_PASS) to a local Postgres")
+        sys.exit(1)
+    ingest.WRITERS["row"] = insert_rows
+
+    print(f"🚀 Building a {args.resources}-resource scan...")
+    document, resources = build_document(args.resources)
+
+    # The scan row alone (one large JSONB document) is common to every method
+    scan_only = run(document, "copy", None, args.repeat, normalized=False)
+    results = [run(document, "row", None, args.repeat)]
+    for chunk_size in args.chunk_sizes:
+        for method in ("values", "copy"):
+            results.append(run(document, method, chunk_size, args.repeat))
+
+    baseline = results[0]["latency_ms"]
+    print(f"\n{'method':<8} {'chunk':>7} {'rows':>8} {'latency ms':>11} {'rows/s':>9} {'speedup':>8}")
+    for r in results:
+        r["speedup"] = round(baseline / r["latency_ms"], 1) if r["latency_ms"] else None
+        print(f"{r['method']:<8} {r['chunk_size'] or '-':>7} {r['rows']:>8} {r['latency_ms']:>11.1f} "
+              f"{r['rows_per_second']:>9} {r['speedup']:>7}x")
+    print(f"\nscan row alone (included above): {scan_only['latency_ms']:.1f} ms. Row-by-row pays one round trip "
+          f"per row, so its gap grows with the latency to the database.")
+
+    with services.db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"resources": resources, "scan_row_ms": scan_only["latency_ms"], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
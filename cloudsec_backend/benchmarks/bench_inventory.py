@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Inventory index refresh and search latency (backend/inventory_index.py).
+
+    python -m benchmarks.bench_inventory --resources 100000
+
+Builds a synthetic scan of --resources resources, indexes it into a fresh
+tenant file, re-applies it with --changed of the instances modified (the
+incremental refresh after a scan), then times search() for a set of filter
+combinations and reports p50 / p99 per query. Needs no Postgres.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.bench_normalize import METADATA, build_scan, percentile
+
+QUERIES = {
+    "type": {"resource_type": "ec2_instance"},
+    "type+region": {"resource_type": "ec2_instance", "region": "us-west-2"},
+    "type+state+region": {"resource_type": "ec2_instance", "state": "stopped", "region": "eu-west-1"},
+    "public": {"public": True},
+    "exposed": {"exposed": True},
+    "tag key": {"tags": ["Name"]},
+    "tag value": {"tags": ["env=prod"]},
+    "tag+exposed+region": {"tags": ["env=prod"], "exposed": True, "region": "eu-west-1"},
+    "rare tag": {"tags": ["Name=host-4242"]},
+    "name substring": {"resource_type": "s3_bucket", "q": "bucket-0199"},
+    "no match": {"resource_type": "ec2_instance", "state": "terminated"},
+    "page 50": {"resource_type": "ec2_instance", "cursor": 50000},
+}
+
+
+def modify(document, share):
+    """A copy of document with `share` of its instances changed."""
+    document = json.loads(json.dumps(document))
+    instances = [i for r in document["ec2"]["Reservations"] for i in r["Instances"]]
+    step = max(1, int(1 / share)) if share else 0
+    for inst in instances[::step] if step else []:
+        inst["State"] = {"Code": 80, "Name": "stopped"}
+    return document
+
+
+def run(resources, changed, repeat, limit):
+    from backend import inventory_index
+    from backend.normalize import normalize_scan
+
+    document = normalize_scan(build_scan(resources), **METADATA)
+    user_id = str(uuid.uuid4())
+    rows = []
+
+    start = time.perf_counter()
+    result = inventory_index.refresh(user_id, "1", 1, document)
+    rows.append({"step": "initial refresh", "ms": round((time.perf_counter() - start) * 1000, 1), **result})
+
+    start = time.perf_counter()
+    result = inventory_index.refresh(user_id, "1", 2, document)
+    rows.append({"step": "unchanged refresh", "ms": round((time.perf_counter() - start) * 1000, 1), **result})
+
+    modified = modify(document, changed)
+    start = time.perf_counter()
+    result = inventory_index.refresh(user_id, "1", 3, modified)
+    rows.append({"step": f"refresh {changed:.0%} changed", "ms": round((time.perf_counter() - start) * 1000, 1),
+                 **result})
+
+    searches = []
+    for name, filters in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            items, _ = inventory_index.search(user_id, limit=limit, **filters)
+            timings.append(time.perf_counter() - start)
+        searches.append({
+            "query": name, "items": len(items),
+            "p50_ms": round(statistics.median(timings) * 1000, 2),
+            "p99_ms": round(percentile(timings, 0.99) * 1000, 2),
+        })
+    return rows, searches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time inventory index refreshes and searches")
+    parser.add_argument("--resources", type=int, default=100000)
+    parser.add_argument("--changed", type=float, default=0.01, help="Share of instances changed between scans")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    from backend import inventory_index
+
+    with tempfile.TemporaryDirectory() as directory:
+        inventory_index.INVENTORY_INDEX_DIR = directory
+        refreshes, searches = run(args.resources, args.changed, args.repeat, args.limit)
+
+    print(f"resources: {args.resources}")
+    print(f"{'step':>22} {'ms':>9} {'upserted':>9} {'deleted':>8} {'unchanged':>10}")
+    for r in refreshes:
+        print(f"{r['step']:>22} {r['ms']:>9} {r['upserted']:>9} {r['deleted']:>8} {r['unchanged']:>10}")
+    print(f"{'query':>22} {'items':>6} {'p50 ms':>8} {'p99 ms':>8}")
+    for s in searches:
+        print(f"{s['query']:>22} {s['items']:>6} {s['p50_ms']:>8} {s['p99_ms']:>8}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"resources": args.resources, "refreshes": refreshes, "searches": searches}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Scan normalization in-process vs in the process pool (backend/normalize.py).
+
+    python -m benchmarks.bench_normalize --resources 20000 100000 --workers 1 2 4 8
+
+For each synthetic account size it times normalize_scan (cleaning, findings
+and JSON encoding) in-process and sharded over pools of --workers processes.
+While each run is in progress, a probe thread in the same process repeats a
+small unit of pure-Python work (about a millisecond, like a light request)
+and reports its p50 / p99 latency against an idle baseline. That is the
+stall the GIL imposes on the other requests of an app worker.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import SyntheticAccount, SyntheticSession
+
+PROBE_DOCUMENT = {"items": [{"id": i, "name": f"resource-{i}", "tags": ["a", "b"]} for i in range(200)]}
+METADATA = {"scan_type": "cspm", "timestamp": "2026-01-01T00:00:00"}
+
+
+def probe_once():
+    start = time.perf_counter()
+    json.loads(json.dumps(PROBE_DOCUMENT))
+    return time.perf_counter() - start
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+class Probe(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.samples = []
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.samples.append(probe_once())
+            time.sleep(0.002)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return {
+            "probe_p50_ms": round(percentile(self.samples, 0.5) * 1000, 2),
+            "probe_p99_ms": round(percentile(self.samples, 0.99) * 1000, 2),
+        }
+
+
+def build_scan(resources):
+    from backend import aws_scanner
+
+    account = SyntheticAccount.with_resources(resources)
+    session = SyntheticSession(account)
+    aws_scanner.get_session = lambda credentials=None: session
+    results = aws_scanner.scan_all()
+    results.pop("raw_archive", None)
+    return results
+
+
+def timed_run(results, repeat, chunk_size):
+    from backend import normalize
+
+    timings = []
+    probe = Probe()
+    probe.start()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        normalize.normalize_scan(results, chunk_size=chunk_size, **METADATA)
+        timings.append(time.perf_counter() - start)
+    return {"latency_ms": round(statistics.median(timings) * 1000, 1), **probe.stop()}
+
+
+def run(resources, workers, repeat, chunk_size):
+    from backend import normalize
+
+    results = build_scan(resources)
+    idle = [probe_once() for _ in range(500)]
+    rows = []
+
+    normalize.NORMALIZE_PROCESS_THRESHOLD = 0
+    rows.append({"resources": resources, "mode": "in-process", **timed_run(results, repeat, chunk_size)})
+
+    normalize.NORMALIZE_PROCESS_THRESHOLD = 1
+    for count in workers:
+        normalize.shutdown_pool()
+        normalize.NORMALIZE_WORKERS = count
+        normalize.normalize_scan(results, chunk_size=chunk_size, **METADATA)  # start the workers
+        rows.append({"resources": resources, "mode": f"pool:{count}", **timed_run(results, repeat, chunk_size)})
+    normalize.shutdown_pool()
+
+    for row in rows:
+        row["probe_idle_p50_ms"] = round(percentile(idle, 0.5) * 1000, 2)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time scan normalization in-process and in the process pool")
+    parser.add_argument("--resources", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    print(f"cpus: {os.cpu_count()}")
+    results = [row for n in args.resources for row in run(n, args.workers, args.repeat, args.chunk_size)]
+    print(f"{'resources':>9} {'mode':>11} {'latency ms':>11} {'probe p50':>10} {'probe p99':>10} {'idle p50':>9}")
+    for r in results:
+        print(f"{r['resources']:>9} {r['mode']:>11} {r['latency_ms']:>11} {r['probe_p50_ms']:>10} "
+              f"{r['probe_p99_ms']:>10} {r['probe_idle_p50_ms']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Organization scan: concurrent wall time vs the sequential equivalent.
+
+    python -m benchmarks.bench_org_scan --accounts 50 --resources 500 --latency 0.02 --workers 1 8 16
+
+Every member account is a SyntheticAccount; --latency adds a simulated
+round trip to each AWS call so the pool's overlap of network waits shows up
+as it would against real AWS.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.synthetic import SyntheticAccount, SyntheticSession
+
+
+def build_organization(accounts, resources):
+    members = [
+        SyntheticAccount.with_resources(resources, account_id=f"{100000000000 + i:012d}", seed=i)
+        for i in range(1, accounts)
+    ]
+    management = SyntheticAccount.with_resources(resources, member_accounts=members)
+    return management, {m.account_id: m for m in members}
+
+
+def run(accounts, resources, latency, workers):
+    from backend import aws_scanner, org_scanner
+    from backend.normalize import clean_aws_results
+
+    management, members = build_organization(accounts, resources)
+    org_scanner.assume_role = lambda role_arn, session_name=None, session=None: SyntheticSession(
+        members[role_arn.split(":")[4]], latency=latency
+    )
+
+    def process_account(account, session, role_arn):
+        results = clean_aws_results(aws_scanner.scan_session(session))
+        return {"total_findings": len(results["findings"])}
+
+    report = org_scanner.scan_organization(
+        SyntheticSession(management, latency=latency), process_account, max_workers=workers
+    )
+    return {"workers": workers, **report["timing"], **report["summary"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark organization scans")
+    parser.add_argument("--accounts", type=int, default=20)
+    parser.add_argument("--resources", type=int, default=200, help="Resources per account")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per AWS call")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = [run(args.accounts, args.resources, args.latency, w) for w in args.workers]
+    print(f"{'workers':>8} {'accounts':>9} {'wall s':>8} {'sequential s':>13} {'speedup':>8} {'findings':>9}")
+    for r in results:
+        print(f"{r['workers']:>8} {r['total_accounts']:>9} {r['wall_seconds']:>8} "
+              f"{r['sequential_seconds']:>13} {r['speedup']:>8} {r['total_findings']:>9}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
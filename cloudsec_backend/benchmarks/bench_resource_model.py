@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Memory footprint of raw boto3 responses vs the compact resource model.
+
+    python -m benchmarks.bench_resource_model --instances 10000 50000
+
+For each size it measures (tracemalloc, after GC) the retained size of:
+  raw      - describe_instances / list_buckets / list_users responses as boto3 returns them
+  compact  - the same resources as resource_model.Inventory (__slots__ objects)
+  document - the slim dict document the pipeline carries after scanning
+  archive  - the optional compressed raw archive
+"""
+import argparse
+import copy
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import SyntheticAccount
+from backend.resource_model import Inventory
+
+
+def retained_mb(build):
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, round(current / (1024 * 1024), 2)
+
+
+def raw_responses(account):
+    # Deep copies so the measurement owns every nested object, like a parsed response
+    return {
+        "ec2": copy.deepcopy(account.respond("DescribeInstances", {})),
+        "s3": copy.deepcopy(account.respond("ListBuckets", {})),
+        "iam": copy.deepcopy(account.respond("ListUsers", {})),
+    }
+
+
+def run(instances):
+    account = SyntheticAccount(instances=instances, buckets=instances // 5, users=instances // 5)
+    raw, raw_mb = retained_mb(lambda: raw_responses(account))
+
+    def build_inventory(keep_raw=False):
+        inventory = Inventory(keep_raw=keep_raw)
+        inventory.add_ec2_page(raw["ec2"])
+        inventory.add_buckets(raw["s3"]["Buckets"])
+        inventory.add_users(raw["iam"]["Users"])
+        return inventory
+
+    inventory, compact_mb = retained_mb(build_inventory)
+    _, document_mb = retained_mb(lambda: {
+        "ec2": inventory.ec2_document(), "s3": inventory.s3_document(), "iam": inventory.iam_document()
+    })
+    archived = build_inventory(keep_raw=True)
+
+    return {
+        "instances": instances,
+        "resources": account.resource_count,
+        "raw_mb": raw_mb,
+        "compact_mb": compact_mb,
+        "document_mb": document_mb,
+        "archive_mb": round(archived.raw.size() / (1024 * 1024), 2),
+        "reduction": round(raw_mb / compact_mb, 1) if compact_mb else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare raw vs compact inventory memory")
+    parser.add_argument("--instances", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = [run(n) for n in args.instances]
+    print(f"{'instances':>10} {'resources':>10} {'raw MB':>9} {'compact MB':>11} {'doc MB':>8} {'archive MB':>11} {'x smaller':>10}")
+    for r in results:
+        print(f"{r['instances']:>10} {r['resources']:>10} {r['raw_mb']:>9} {r['compact_mb']:>11} "
+              f"{r['document_mb']:>8} {r['archive_mb']:>11} {r['reduction']:>10}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
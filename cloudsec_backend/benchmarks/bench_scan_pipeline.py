@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Scan pipeline benchmark.
+
+Times scan_all, clean_aws_results, evaluate_policy and save_scan_result on
+synthetic AWS accounts of increasing size and records, per stage:
+latency (median of --repeat runs), peak RSS, tracemalloc peak and the
+number of memory blocks / gen-0 collections the stage caused.
+
+    python -m benchmarks.bench_scan_pipeline --sizes 10 1000 10000 100000
+    python -m benchmarks.bench_scan_pipeline --compare benchmarks/results/<sha>.json
+
+AWS is served by botocore stubs (benchmarks/synthetic.py) and OPA by a local
+stand-in (benchmarks/opa_standin.py) unless --opa-url points at a real OPA.
+save_scan_result runs against a local Postgres configured with BENCH_PG_HOST,
+BENCH_PG_PORT, BENCH_PG_DB, BENCH_PG_USER and BENCH_PG_PASS; it is reported as
+skipped when none is reachable. Its tables are created in the bench_pipeline
+schema with the app's schema (UUID scan ids).
+
+evaluate_policy is timed with an empty decision cache, so every run reaches
+OPA; evaluate_policy_cached is the same call answered from the warm cache.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import SyntheticAccount, SyntheticSession
+from benchmarks.opa_standin import OpaStandin
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SIZES = [10, 1000, 10000, 100000]
+STAGES = ["scan_all", "clean_aws_results", "evaluate_policy", "evaluate_policy_cached", "save_scan_result"]
+SCHEMA = "bench_pipeline"
+
+
+# -------------------------
+# Process memory helpers
+# -------------------------
+def _read_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    # Linux: writing 5 to clear_refs resets VmHWM to the current RSS
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    hwm = _read_status_kb("VmHWM")
+    if hwm is not None:
+        return round(hwm / 1024, 1)
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def measure(fn, repeat):
+    """Run fn `repeat` times for latency/RSS, then once under tracemalloc."""
+    timings = []
+    result = None
+    peak_rss = None
+    for _ in range(repeat):
+        gc.collect()
+        _reset_peak_rss()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+        peak_rss = max(peak_rss or 0, _peak_rss_mb())
+
+    gc.collect()
+    gen0_before = gc.get_stats()[0]["collections"]
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.start()
+    fn()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = {
+        "latency_ms": round(statistics.median(timings) * 1000, 3),
+        "latency_min_ms": round(min(timings) * 1000, 3),
+        "peak_rss_mb": peak_rss,
+        "traced_peak_mb": round(traced_peak / (1024 * 1024), 2),
+        "allocated_blocks": sys.getallocatedblocks() - blocks_before,
+        "gc_gen0_collections": gc.get_stats()[0]["collections"] - gen0_before,
+    }
+    return result, stats
+
+
+# -------------------------
+# Pipeline
+# -------------------------
+def _configure_postgres(db_module):
+    if not os.getenv("BENCH_PG_HOST"):
+        return False
+    db_module.DB_CONFIG.update({
+        "host": os.getenv("BENCH_PG_HOST"),
+        "port": os.getenv("BENCH_PG_PORT", "5432"),
+        "dbname": os.getenv("BENCH_PG_DB", "postgres"),
+        "user": os.getenv("BENCH_PG_USER", "postgres"),
+        "password": os.getenv("BENCH_PG_PASS", ""),
+        "sslmode": "disable",
+        "options": f"-c search_path={SCHEMA}",
+    })
+    try:
+        import psycopg2
+        with psycopg2.connect(**db_module.DB_CONFIG) as conn:
+            with conn.cursor() as cur:
+                # As in the app (see the README Database Setup): UUID scan ids
+                cur.execute(f"""
+                    DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+                    CREATE SCHEMA {SCHEMA};
+                    CREATE TABLE scans (
+                        id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                        user_id UUID,
+                        aws_account_id UUID,
+                        data JSONB,
+                        scan_type TEXT,
+                        created_at TIMESTAMP DEFAULT NOW()
+                    );
+                    CREATE INDEX ON scans (user_id, created_at DESC);
+                """)
+            conn.commit()
+        return True
+    except Exception as e:
+        print(f"⚠️  Postgres unavailable, save_scan_result will be skipped: {e}")
+        return False
+
+
+def run_size(size, repeat, pg_enabled):
+    from fastapi.encoders import jsonable_encoder
+    from backend import aws_scanner, db
+    from backend.normalize import clean_aws_results
+    from policy_evaluator import POLICY_DIR, evaluate_policies
+    from backend.decision_cache import get_decision_cache
+
+    account = SyntheticAccount.with_resources(size)
+    session = SyntheticSession(account)
+    aws_scanner.get_session = lambda credentials=None: session
+
+    stages = {}
+    raw, stages["scan_all"] = measure(aws_scanner.scan_all, repeat)
+    cleaned, stages["clean_aws_results"] = measure(lambda: clean_aws_results(raw), repeat)
+
+    safe_results = jsonable_encoder(cleaned)
+
+    def evaluate():
+        violations = evaluate_policies(safe_results, ["cloudsec/s3/deny", "cloudsec/ec2/deny"])
+        return {"s3": violations["cloudsec/s3/deny"], "ec2": violations["cloudsec/ec2/deny"]}
+
+    # Cold: every run (the tracemalloc one too) starts with an empty decision cache
+    cache = get_decision_cache(POLICY_DIR)
+    cache.persistent = False
+
+    def evaluate_cold():
+        cache.clear()
+        return evaluate()
+
+    violations, stages["evaluate_policy"] = measure(evaluate_cold, repeat)
+    _, stages["evaluate_policy_cached"] = measure(evaluate, repeat)
+    safe_results["policy_violations"] = violations
+
+    if pg_enabled:
+        user_id = "00000000-0000-0000-0000-000000000000"
+        _, stages["save_scan_result"] = measure(
+            lambda: db.save_scan_result(user_id=user_id, data=safe_results, scan_type="cspm"), repeat
+        )
+    else:
+        stages["save_scan_result"] = {"skipped": "no local Postgres (set BENCH_PG_HOST)"}
+
+    return {
+        "resources": account.resource_count,
+        "instances": len(account.instances),
+        "buckets": len(account.buckets),
+        "users": len(account.users),
+        "stages": stages,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+# -------------------------
+# Reporting
+# -------------------------
+def print_report(report):
+    print(f"\n{'size':>8} {'stage':<24} {'latency ms':>12} {'peak RSS MB':>12} {'traced MB':>10} {'blocks':>10} {'gc0':>6}")
+    for run in report["runs"]:
+        for stage in STAGES:
+            s = run["stages"].get(stage, {})
+            if "skipped" in s:
+                print(f"{run['resources']:>8} {stage:<24} {'skipped':>12}")
+                continue
+            print(f"{run['resources']:>8} {stage:<24} {s['latency_ms']:>12.2f} {s['peak_rss_mb']:>12} "
+                  f"{s['traced_peak_mb']:>10} {s['allocated_blocks']:>10} {s['gc_gen0_collections']:>6}")
+
+
+def compare(report, baseline_path, threshold):
+    """Print per-stage latency ratios against a saved run; returns the number of regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    base_runs = {run["resources"]: run for run in baseline["runs"]}
+
+    regressions = 0
+    print(f"\n📊 Comparing against {baseline.get('revision')} ({baseline_path})")
+    for run in report["runs"]:
+        base = base_runs.get(run["resources"])
+        if not base:
+            continue
+        for stage in STAGES:
+            new, old = run["stages"].get(stage, {}), base["stages"].get(stage, {})
+            if "latency_ms" not in new or "latency_ms" not in old or not old["latency_ms"]:
+                continue
+            ratio = new["latency_ms"] / old["latency_ms"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  ❌ regression"
+                regressions += 1
+            elif ratio < 1 - threshold:
+                flag = "  ✅ faster"
+            print(f"{run['resources']:>8} {stage:<24} {old['latency_ms']:>10.2f} -> {new['latency_ms']:>10.2f} ms "
+                  f"({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSPM scan pipeline on synthetic accounts")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--opa-url", help="Use a running OPA instead of the local stand-in")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<git revision>.json)")
+    parser.add_argument("--compare", help="Baseline result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Latency change treated as a regression")
+    args = parser.parse_args()
+
+    import policy_evaluator
+    from backend import db
+
+    pg_enabled = _configure_postgres(db)
+    report = {
+        "revision": _git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "runs": [],
+    }
+
+    standin = None
+    if args.opa_url:
+        policy_evaluator.OPA_URL = args.opa_url
+    else:
+        standin = OpaStandin().__enter__()
+        policy_evaluator.OPA_URL = standin.url
+
+    try:
+        for size in args.sizes:
+            print(f"🚀 Benchmarking {size} resources...")
+            report["runs"].append(run_size(size, args.repeat, pg_enabled))
+    finally:
+        if standin:
+            standin.__exit__(None, None, None)
+
+    print_report(report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results saved to {output}")
+
+    if args.compare and compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
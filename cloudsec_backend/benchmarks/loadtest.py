@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+HTTP load test of the API against local stand-ins.
+
+    python -m benchmarks.loadtest --servers uvicorn:1 uvicorn:4 gunicorn:4 --concurrency 1 8 32 --duration 20
+
+Starts a Supabase auth stand-in and the OPA stand-in (benchmarks/opa_standin.py)
+in this process and creates a throwaway `loadtest` schema in the BENCH_PG_*
+Postgres. Then, for each server configuration, it:
+
+  1. launches benchmarks/loadtest_app.py (the real app, AWS answered by
+     synthetic accounts) under uvicorn or gunicorn with uvicorn workers
+  2. registers --users tenants through POST /aws-account and runs one scan each
+  3. drives a closed-loop traffic mix (--mix) at each --concurrency level
+     for --duration seconds
+
+Per endpoint it reports throughput, p50/p95/p99 latency and the error rate
+(non-2xx responses and connection errors). The client runs in this process;
+watch its CPU at high concurrency, or run it from another machine.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.opa_standin import OpaStandin
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+SCHEMA = "loadtest"
+ACCOUNT_ID = "123456789012"  # SyntheticAccount's default
+ROLE_ARN = f"arn:aws:iam::{ACCOUNT_ID}:role/CloudSecScanRole"
+
+ENDPOINTS = {
+    "scan": "/scan/cspm-multi",
+    "history": "/results/history-multi",
+    "dashboard": "/dashboard/stats",
+    "violations": "/policy/violations",
+    "account": "/aws-account",
+    # Needs INVENTORY_INDEX=true in the server's environment
+    "inventory": "/inventory/search?type=ec2_instance&exposed=true&tag=env%3Dprod",
+}
+DEFAULT_MIX = "scan=1,history=4,dashboard=4,violations=3,account=2"
+
+
+# -------------------------
+# Stand-ins
+# -------------------------
+def user_id(token):
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, token))
+
+
+class _AuthHandler(BaseHTTPRequestHandler):
+    """GET /auth/v1/user: any "loadtest-..." bearer token is a user."""
+
+    def do_GET(self):
+        token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not self.path.rstrip("/").endswith("/user") or not token.startswith("loadtest-"):
+            body, status = b'{"msg": "invalid token"}', 401
+        else:
+            body, status = json.dumps({"id": user_id(token), "email": f"{token}@example.com"}).encode(), 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AuthStandin:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), _AuthHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/auth/v1"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def pg_settings():
+    return {
+        "host": os.getenv("BENCH_PG_HOST"),
+        "port": os.getenv("BENCH_PG_PORT", "5432"),
+        "dbname": os.getenv("BENCH_PG_DB", "postgres"),
+        "user": os.getenv("BENCH_PG_USER", "postgres"),
+        "password": os.getenv("BENCH_PG_PASS", ""),
+    }
+
+
+def postgres(sql, params=None):
+    import psycopg2
+
+    conn = psycopg2.connect(**pg_settings(), sslmode="disable", options=f"-c search_path={SCHEMA}")
+    try:
+        with conn, conn.cursor() as cur:
+            cur.execute(sql, params)
+    finally:
+        conn.close()
+
+
+def reset_schema():
+    postgres(f"""
+        DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+        CREATE SCHEMA {SCHEMA};
+        SET search_path = {SCHEMA};
+        CREATE TABLE aws_accounts (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(), user_id UUID, account_id TEXT, role_arn TEXT,
+            management_account_id UUID, created_at TIMESTAMP DEFAULT NOW(), UNIQUE (user_id, account_id)
+        );
+        CREATE TABLE scans (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(), user_id UUID, aws_account_id UUID, data JSONB,
+            scan_type TEXT, created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE INDEX ON scans (user_id, created_at DESC);
+        -- /policy/violations reads the latest CSPM result from scan_results
+        CREATE TABLE scan_results (
+            id UUID PRIMARY KEY DEFAULT gen_random_uuid(), user_id UUID, aws_account_id UUID, results JSONB,
+            scan_type TEXT, created_at TIMESTAMP DEFAULT NOW()
+        );
+        CREATE INDEX ON scan_results (user_id, created_at DESC);
+    """)
+
+
+# -------------------------
+# Servers
+# -------------------------
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(server, workers, port):
+    if server == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "benchmarks.loadtest_app:app", "--host", "127.0.0.1",
+                "--port", str(port), "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+    if server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "benchmarks.loadtest_app:app", "-k", "uvicorn.workers.UvicornWorker",
+                "-w", str(workers), "-b", f"127.0.0.1:{port}", "--log-level", "warning"]
+    raise ValueError(f"Unknown server {server!r} (uvicorn or gunicorn)")
+
+
+class Server:
+    def __init__(self, spec, env):
+        server, _, workers = spec.partition(":")
+        self.spec = spec
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.command = server_command(server, int(workers or 1), self.port)
+        self.env = env
+        self.process = None
+        # Server output goes to a file; an unread pipe would stall the server once full
+        self.log = tempfile.NamedTemporaryFile(prefix="loadtest-", suffix=".log", delete=False)
+
+    def __enter__(self):
+        self.process = subprocess.Popen(self.command, cwd=ROOT, env=self.env,
+                                        stdout=self.log, stderr=subprocess.STDOUT)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                with open(self.log.name, errors="replace") as f:
+                    raise RuntimeError(f"{self.spec} exited (log: {self.log.name}): {f.read()[-2000:]}")
+            try:
+                if requests.get(f"{self.url}/metrics", timeout=1).status_code == 200:
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError(f"{self.spec} did not become ready")
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        self.log.close()
+
+
+# -------------------------
+# Load
+# -------------------------
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r} in --mix (one of {', '.join(ENDPOINTS)})")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def seed(url, tokens):
+    """Register every tenant's account, run one scan each and mirror it to scan_results."""
+    with requests.Session() as http:
+        for token in tokens:
+            headers = {"Authorization": f"Bearer {token}"}
+            for response in (
+                http.post(f"{url}/aws-account", json={"account_id": ACCOUNT_ID, "role_arn": ROLE_ARN},
+                          headers=headers, timeout=60),
+                http.get(f"{url}{ENDPOINTS['scan']}", headers=headers, timeout=300),
+            ):
+                if not response.ok:
+                    raise RuntimeError(f"Seeding failed: {response.request.method} {response.url} -> "
+                                       f"{response.status_code} {response.text[:2000]}")
+    postgres("""
+        INSERT INTO scan_results (user_id, aws_account_id, results, scan_type, created_at)
+        SELECT user_id, aws_account_id, data, scan_type, created_at FROM scans
+    """)
+
+
+def client(url, tokens, mix, deadline, seed_value, samples, revalidate=False):
+    rng = random.Random(seed_value)
+    names, weights = list(mix), list(mix.values())
+    etags = {}  # (token, endpoint) -> last ETag, sent back like a polling browser with --revalidate
+    with requests.Session() as http:
+        while time.time() < deadline:
+            name = rng.choices(names, weights)[0]
+            token = rng.choice(tokens)
+            headers = {"Authorization": f"Bearer {token}"}
+            if revalidate and (token, name) in etags:
+                headers["If-None-Match"] = etags[token, name]
+            start = time.perf_counter()
+            try:
+                response = http.get(f"{url}{ENDPOINTS[name]}", headers=headers, timeout=300)
+                ok = response.ok
+                if "ETag" in response.headers:
+                    etags[token, name] = response.headers["ETag"]
+            except requests.RequestException:
+                ok = False
+            samples.append((name, time.perf_counter() - start, ok))
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(samples, elapsed):
+    by_endpoint = {}
+    for name, latency, ok in samples:
+        by_endpoint.setdefault(name, []).append((latency, ok))
+    by_endpoint["all"] = [(latency, ok) for _, latency, ok in samples]
+
+    stats = {}
+    for name, rows in by_endpoint.items():
+        latencies = sorted(latency for latency, _ in rows)
+        errors = sum(1 for _, ok in rows if not ok)
+        stats[name] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "error_rate": round(errors / len(rows), 4),
+        }
+    return stats
+
+
+def run_level(url, tokens, mix, concurrency, duration, revalidate=False):
+    samples = []  # list.append is atomic; one list for all clients
+    deadline = time.time() + duration
+    threads = [
+        threading.Thread(target=client, args=(url, tokens, mix, deadline, i, samples, revalidate), daemon=True)
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return summarize(samples, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the API with local stand-ins")
+    parser.add_argument("--servers", nargs="+", default=["uvicorn:1", "uvicorn:4", "gunicorn:4"],
+                        help="server:workers, server is uvicorn or gunicorn")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per concurrency level")
+    parser.add_argument("--users", type=int, default=20, help="Tenants, each with one registered account")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,... over " + ", ".join(ENDPOINTS))
+    parser.add_argument("--resources", type=int, default=200, help="Resources in the synthetic AWS account")
+    parser.add_argument("--aws-latency", type=float, default=0.0, help="Simulated seconds per AWS call")
+    parser.add_argument("--revalidate", action="store_true",
+                        help="Send each tenant's last ETag per endpoint in If-None-Match, like the polling dashboard")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    if not os.getenv("BENCH_PG_HOST"):
+        print("⚠️  Set BENCH_PG_HOST (and BENCH_PG_PORT, BENCH_PG_DB, BENCH_PG_USER, BENCH_PG_PASS) to a local Postgres")
+        sys.exit(1)
+    mix = parse_mix(args.mix)
+    tokens = [f"loadtest-{i:04d}" for i in range(args.users)]
+
+    results = []
+    with AuthStandin() as auth, OpaStandin() as opa:
+        env = {
+            **os.environ,
+            "SUPABASE_AUTH_URL": auth.url,
+            "OPA_URL": opa.url,
+            "LOADTEST_RESOURCES": str(args.resources),
+            "LOADTEST_AWS_LATENCY": str(args.aws_latency),
+            "PARTITION_MAINTENANCE_INTERVAL": "0",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        }
+        for spec in args.servers:
+            reset_schema()
+            print(f"🚀 {spec}: seeding {args.users} tenants...")
+            with Server(spec, env) as server:
+                seed(server.url, tokens)
+                for concurrency in args.concurrency:
+                    stats = run_level(server.url, tokens, mix, concurrency, args.duration, args.revalidate)
+                    results.append({"server": spec, "concurrency": concurrency, "endpoints": stats})
+                    print(f"   concurrency {concurrency}: {stats['all']['throughput_rps']} req/s, "
+                          f"p99 {stats['all']['p99_ms']} ms, errors {stats['all']['error_rate']:.2%}")
+    postgres(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+
+    print(f"\n{'server':<12} {'conc':>5} {'endpoint':<11} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for r in results:
+        for name, s in sorted(r["endpoints"].items(), key=lambda item: item[0] == "all"):
+            print(f"{r['server']:<12} {r['concurrency']:>5} {name:<11} {s['throughput_rps']:>8} {s['p50_ms']:>8} "
+                  f"{s['p95_ms']:>8} {s['p99_ms']:>8} {s['error_rate']:>7.2%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"mix": mix, "users": args.users, "resources": args.resources, "aws_latency": args.aws_latency,
+                       "revalidate": args.revalidate,
+                       "duration": args.duration, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+The API (backend/main.py) wired to local stand-ins, for benchmarks/loadtest.py.
+
+    uvicorn benchmarks.loadtest_app:app --workers 4
+    gunicorn benchmarks.loadtest_app:app -k uvicorn.workers.UvicornWorker -w 4
+
+loadtest.py starts the stand-ins and passes them in the environment:
+  SUPABASE_AUTH_URL     auth stand-in (token -> user id)
+  OPA_URL               benchmarks/opa_standin.py
+  BENCH_PG_*            local Postgres; tables live in the `loadtest` schema
+  LOADTEST_RESOURCES    resources in the synthetic AWS account (default: 200)
+  LOADTEST_AWS_LATENCY  simulated seconds per AWS call (default: 0)
+
+Every boto3 session the app creates is a SyntheticSession, so role
+assumption, identity checks, scans and policy evaluation run the real code.
+"""
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.synthetic import SyntheticAccount, SyntheticSession
+from backend import aws_clients, services
+from backend.main import app  # noqa: F401  (served by uvicorn / gunicorn)
+from backend.metrics import instrument_boto3_session
+
+SCHEMA = "loadtest"
+
+ACCOUNT = SyntheticAccount.with_resources(int(os.getenv("LOADTEST_RESOURCES", "200")))
+AWS_LATENCY = float(os.getenv("LOADTEST_AWS_LATENCY", "0"))
+
+services.DB_CONFIG.update({
+    "host": os.getenv("BENCH_PG_HOST"),
+    "port": os.getenv("BENCH_PG_PORT", "5432"),
+    "dbname": os.getenv("BENCH_PG_DB", "postgres"),
+    "user": os.getenv("BENCH_PG_USER", "postgres"),
+    "password": os.getenv("BENCH_PG_PASS", ""),
+    "sslmode": "disable",
+    "options": f"-c search_path={SCHEMA}",
+})
+
+
+def _synthetic_session(self, **kwargs):
+    return instrument_boto3_session(SyntheticSession(ACCOUNT, latency=AWS_LATENCY))
+
+
+aws_clients.ClientFactory._new_session = _synthetic_session
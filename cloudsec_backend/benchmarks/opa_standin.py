@@ -0,0 +1,111 @@
+"""
+Local OPA stand-in for benchmarks and load tests.
+
+Serves POST /v1/data/<policy path> like OPA's data API, evaluating Python
+mirrors of the rules in policies/*.rego. PUT/DELETE /v1/data/<path> store
+documents, and POST /v1/query answers "x = data.<policy> with input as
+data.<document>" queries against them. Use a real `opa run --server
+policies/` when the binary is available and exact Rego semantics matter.
+"""
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def s3_deny(doc):
+    violations = []
+    for bucket in (doc.get("s3") or {}).get("s3_buckets", []):
+        if bucket.get("PublicAccess") is True:
+            violations.append(f"S3 Bucket {bucket.get('Name')} is publicly accessible")
+    return violations
+
+
+def ec2_deny(doc):
+    violations = []
+    for reservation in (doc.get("ec2") or {}).get("Reservations", []):
+        for instance in reservation.get("Instances", []):
+            if not instance.get("Tags"):
+                violations.append(f"⚠️ EC2 instance {instance.get('InstanceId')} has no tags")
+    for e in (doc.get("ec2") or {}).get("Exposure", []):
+        violations.append(
+            f"🚨 EC2 instance {e.get('InstanceId')} is open to {e.get('Cidr')} on {e.get('Protocol')}/"
+            f"{e.get('Ports')} via security group {e.get('GroupId')}"
+        )
+    return violations
+
+
+POLICIES = {
+    "cloudsec/s3/deny": s3_deny,
+    "cloudsec/ec2/deny": ec2_deny,
+}
+
+
+_QUERY = re.compile(r"^(\w+) = data\.([\w.]+) with input as data\.([\w.]+)$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Documents pushed through the data API, keyed by dotted path
+    documents = {}
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _data_path(self):
+        return self.path.split("/v1/data/", 1)[-1].strip("/").replace("/", ".")
+
+    def _reply(self, payload, status=200):
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_POST(self):
+        body = self._body()
+        if self.path.rstrip("/").endswith("/v1/query"):
+            match = _QUERY.match(body.get("query", "").strip())
+            if not match:
+                return self._reply({"code": "invalid_parameter", "message": "unsupported query"}, 400)
+            var, rule, document = match.groups()
+            policy = POLICIES.get(rule.replace(".", "/"))
+            if policy is None or document not in self.documents:
+                return self._reply({"result": []})
+            return self._reply({"result": [{var: policy(self.documents[document])}]})
+
+        policy = POLICIES.get(self._data_path().replace(".", "/"))
+        self._reply({} if policy is None else {"result": policy(body.get("input") or {})})
+
+    def do_PUT(self):
+        self.documents[self._data_path()] = self._body()
+        self.send_response(204)
+        self.end_headers()
+
+    def do_DELETE(self):
+        self.documents.pop(self._data_path(), None)
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class OpaStandin:
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1/data"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,344 @@
+"""
+Synthetic AWS accounts for benchmarks and load tests.
+
+SyntheticAccount describes an account with a configurable number of EC2
+instances, S3 buckets, IAM users and IAM roles (with groups and managed
+policies for GetAccountAuthorizationDetails). AccountStubber plugs it into real
+boto3 clients through botocore's Stubber hook, answering each call from the
+request parameters instead of a pre-built queue, so call order and
+concurrency in the scanners do not matter.
+"""
+import copy
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from botocore.stub import Stubber
+
+CREATED = datetime(2024, 1, 1, tzinfo=timezone.utc)
+AWS_POLICY = "arn:aws:iam::aws:policy/"
+# Instances cycle through these (without drawing from the seeded rng, so other fields keep their values)
+ZONES = ("us-east-1a", "us-east-1b", "us-west-2a", "eu-west-1a")
+ENVIRONMENTS = ("prod", "staging", "dev", "test", "sandbox")
+
+# AWS managed policies as published (abridged where the full list does not change the analysis)
+AWS_MANAGED_POLICIES = {
+    "AdministratorAccess": [{"Effect": "Allow", "Action": "*", "Resource": "*"}],
+    "PowerUserAccess": [
+        {"Effect": "Allow", "NotAction": ["iam:*", "organizations:*", "account:*"], "Resource": "*"},
+        {"Effect": "Allow", "Action": ["iam:CreateServiceLinkedRole", "iam:ListRoles"], "Resource": "*"},
+    ],
+    "ReadOnlyAccess": [{"Effect": "Allow", "Action": ["ec2:Describe*", "iam:Get*", "iam:List*", "s3:Get*",
+                                                      "s3:List*"], "Resource": "*"}],
+    "AmazonS3FullAccess": [{"Effect": "Allow", "Action": ["s3:*", "s3-object-lambda:*"], "Resource": "*"}],
+}
+# Group -> attached AWS managed policy; users join one group each
+GROUPS = {"admins": "AdministratorAccess", "developers": "PowerUserAccess", "readers": "ReadOnlyAccess",
+          "data": "AmazonS3FullAccess"}
+
+
+def _public_ip(i):
+    return f"54.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+
+
+def _security_group(i, account_id):
+    """sg-<i>: every eighth opens SSH to 0.0.0.0/0, every 32nd all traffic to ::/0, the rest HTTPS and VPC-internal."""
+    permissions = [
+        {"IpProtocol": "tcp", "FromPort": 443, "ToPort": 443, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]},
+        {"IpProtocol": "tcp", "FromPort": 0, "ToPort": 65535, "IpRanges": [{"CidrIp": "10.0.0.0/8"}]},
+    ]
+    if i % 8 == 3:
+        permissions.append({"IpProtocol": "tcp", "FromPort": 22, "ToPort": 22, "IpRanges": [{"CidrIp": "0.0.0.0/0"}]})
+    if i % 32 == 7:
+        permissions.append({"IpProtocol": "-1", "Ipv6Ranges": [{"CidrIpv6": "::/0"}]})
+    return {"GroupId": f"sg-{i:08x}", "GroupName": f"sg-{i}", "Description": "synthetic", "OwnerId": account_id,
+            "VpcId": "vpc-0123456789abcdef0", "IpPermissions": permissions, "IpPermissionsEgress": []}
+
+
+def _policy_document(statements):
+    # IAM returns policy documents URL-encoded; botocore decodes them
+    return quote(json.dumps({"Version": "2012-10-17", "Statement": statements}))
+
+
+class SyntheticAccount:
+    def __init__(self, instances=0, buckets=0, users=0, account_id="123456789012",
+                 public_ratio=0.05, mfa_ratio=0.7, seed=42, member_accounts=(), roles=0,
+                 admin_ratio=0.02, role_policies=50):
+        self.account_id = account_id
+        # Accounts listed by organizations:ListAccounts when this is a management account
+        self.member_accounts = list(member_accounts)
+        rng = random.Random(seed)
+
+        self.instances = [
+            {
+                "InstanceId": f"i-{i:017x}",
+                "InstanceType": rng.choice(["t3.micro", "t3.large", "m5.xlarge", "c5.2xlarge"]),
+                "ImageId": "ami-0abcdef1234567890",
+                "LaunchTime": CREATED,
+                "State": {"Code": 16, "Name": "running"} if rng.random() < 0.8 else {"Code": 80, "Name": "stopped"},
+                "Placement": {"AvailabilityZone": ZONES[i % len(ZONES)], "Tenancy": "default"},
+                "PrivateIpAddress": f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+                "SubnetId": f"subnet-{i % 16:08x}",
+                "VpcId": "vpc-0123456789abcdef0",
+                "SecurityGroups": [{"GroupId": f"sg-{i % 32:08x}", "GroupName": f"sg-{i % 32}"}],
+                "NetworkInterfaces": [{
+                    "NetworkInterfaceId": f"eni-{i:017x}",
+                    "Groups": [{"GroupId": f"sg-{i % 32:08x}", "GroupName": f"sg-{i % 32}"}],
+                    **({"Association": {"PublicIp": _public_ip(i)}} if i % 4 == 3 else {}),
+                }],
+                **({"PublicIpAddress": _public_ip(i)} if i % 4 == 3 else {}),
+                "Tags": ([{"Key": "Name", "Value": f"host-{i}"}] if rng.random() < 0.6 else [])
+                        + [{"Key": "env", "Value": ENVIRONMENTS[i % len(ENVIRONMENTS)]}],
+                "BlockDeviceMappings": [{
+                    "DeviceName": "/dev/xvda",
+                    "Ebs": {"VolumeId": f"vol-{i:017x}", "Status": "attached", "AttachTime": CREATED,
+                            "DeleteOnTermination": True},
+                }],
+            }
+            for i in range(instances)
+        ]
+        self.buckets = [
+            {"Name": f"bucket-{i:06d}", "CreationDate": CREATED, "Public": rng.random() < public_ratio}
+            for i in range(buckets)
+        ]
+        self.users = [
+            {
+                "UserName": f"user-{i:06d}",
+                "UserId": f"AIDA{i:017d}",
+                "Arn": f"arn:aws:iam::{account_id}:user/user-{i:06d}",
+                "Path": "/",
+                "CreateDate": CREATED,
+                "MFA": rng.random() < mfa_ratio,
+                "Group": "admins" if rng.random() < admin_ratio else rng.choice(["developers", "readers", "data"]),
+            }
+            for i in range(users)
+        ]
+        # Roles share `role_policies` customer managed policies; one in ten of those is s3:* / ec2:*
+        self.roles = [
+            {
+                "RoleName": f"role-{i:06d}",
+                "RoleId": f"AROA{i:017d}",
+                "Arn": f"arn:aws:iam::{account_id}:role/role-{i:06d}",
+                "Path": "/aws-service-role/" if i % 50 == 0 else "/",
+                "CreateDate": CREATED,
+                "Policy": f"role-policy-{rng.randrange(role_policies):04d}",
+                "Admin": rng.random() < admin_ratio,
+            }
+            for i in range(roles)
+        ]
+        self.role_policies = role_policies
+        self._authorization_details = None
+        self._users_by_name = {u["UserName"]: u for u in self.users}
+        self._buckets_by_name = {b["Name"]: b for b in self.buckets}
+
+    @property
+    def resource_count(self):
+        return len(self.instances) + len(self.buckets) + len(self.users)
+
+    @classmethod
+    def with_resources(cls, total, instance_share=0.6, bucket_share=0.2, **kwargs):
+        """Split `total` resources across instances, buckets and users."""
+        instances = int(total * instance_share)
+        buckets = int(total * bucket_share)
+        return cls(instances=instances, buckets=buckets, users=total - instances - buckets, **kwargs)
+
+    # -------------------------
+    # Responses by operation
+    # -------------------------
+    def respond(self, operation, params):
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None:
+            return {}
+        return handler(params)
+
+    def _op_GetCallerIdentity(self, params):
+        return {"Account": self.account_id, "Arn": f"arn:aws:iam::{self.account_id}:role/CloudSecScanRole",
+                "UserId": "AROAEXAMPLE"}
+
+    def _op_AssumeRole(self, params):
+        account_id = params["RoleArn"].split(":")[4]
+        return {
+            "Credentials": {"AccessKeyId": "ASIABENCHMARK", "SecretAccessKey": "benchmark",
+                            "SessionToken": "benchmark", "Expiration": datetime.now(timezone.utc) + timedelta(hours=1)},
+            "AssumedRoleUser": {"AssumedRoleId": "AROAEXAMPLE:session",
+                                "Arn": f"arn:aws:sts::{account_id}:assumed-role/{params['RoleArn'].rsplit('/', 1)[-1]}/"
+                                       f"{params['RoleSessionName']}"},
+        }
+
+    def _op_ListAccounts(self, params):
+        return {"Accounts": [
+            {"Id": account.account_id, "Name": f"account-{account.account_id}", "Status": "ACTIVE",
+             "Arn": f"arn:aws:organizations::{self.account_id}:account/o-example/{account.account_id}"}
+            for account in [self, *self.member_accounts]
+        ]}
+
+    def _op_DescribeInstances(self, params):
+        start = int(params.get("NextToken") or 0)
+        page = self.instances[start:start + (params.get("MaxResults") or len(self.instances))]
+        response = {"Reservations": [
+            {"ReservationId": f"r-{start + i:017x}", "OwnerId": self.account_id, "Instances": page[i:i + 5]}
+            for i in range(0, len(page), 5)
+        ]}
+        if start + len(page) < len(self.instances):
+            response["NextToken"] = str(start + len(page))
+        return response
+
+    def _op_DescribeSecurityGroups(self, params):
+        # Instances use sg-0 .. sg-31 (instance i -> sg-<i % 32>)
+        return {"SecurityGroups": [_security_group(i, self.account_id) for i in range(32)]}
+
+    def _op_ListBuckets(self, params):
+        return {"Buckets": [{"Name": b["Name"], "CreationDate": b["CreationDate"]} for b in self.buckets],
+                "Owner": {"ID": "owner"}}
+
+    def _op_GetBucketLocation(self, params):
+        return {"LocationConstraint": None}
+
+    def _op_GetBucketAcl(self, params):
+        grants = [{"Grantee": {"Type": "CanonicalUser", "ID": "owner"}, "Permission": "FULL_CONTROL"}]
+        if self._buckets_by_name.get(params.get("Bucket"), {}).get("Public"):
+            grants.append({"Grantee": {"Type": "Group", "URI": "http://acs.amazonaws.com/groups/global/AllUsers"},
+                           "Permission": "READ"})
+        return {"Owner": {"ID": "owner"}, "Grants": grants}
+
+    def _op_GetPublicAccessBlock(self, params):
+        if self._buckets_by_name.get(params.get("Bucket"), {}).get("Public"):
+            return {}
+        return {"PublicAccessBlockConfiguration": {
+            "BlockPublicAcls": True, "IgnorePublicAcls": True,
+            "BlockPublicPolicy": True, "RestrictPublicBuckets": True,
+        }}
+
+    def _op_GetBucketPolicyStatus(self, params):
+        return {"PolicyStatus": {"IsPublic": False}}
+
+    def _op_GetBucketEncryption(self, params):
+        return {"ServerSideEncryptionConfiguration": {"Rules": [
+            {"ApplyServerSideEncryptionByDefault": {"SSEAlgorithm": "AES256"}}
+        ]}}
+
+    def _op_GetBucketVersioning(self, params):
+        return {"Status": "Enabled"}
+
+    def _op_ListUsers(self, params):
+        start = int(params.get("Marker") or 0)
+        page = self.users[start:start + (params.get("MaxItems") or len(self.users))]
+        response = {"Users": [{k: v for k, v in u.items() if k != "MFA"} for u in page],
+                    "IsTruncated": start + len(page) < len(self.users)}
+        if response["IsTruncated"]:
+            response["Marker"] = str(start + len(page))
+        return response
+
+    def _op_ListMFADevices(self, params):
+        user = self._users_by_name.get(params.get("UserName"), {})
+        devices = []
+        if user.get("MFA"):
+            devices.append({"UserName": user["UserName"], "EnableDate": CREATED,
+                            "SerialNumber": f"arn:aws:iam::{self.account_id}:mfa/{user['UserName']}"})
+        return {"MFADevices": devices, "IsTruncated": False}
+
+    def authorization_details(self):
+        """GetAccountAuthorizationDetails entries, in the order pages list them."""
+        if self._authorization_details is None:
+            account = self.account_id
+            entries = []
+            for u in self.users:
+                entries.append(("UserDetailList", {
+                    "UserName": u["UserName"], "UserId": u["UserId"], "Arn": u["Arn"], "Path": "/",
+                    "CreateDate": CREATED, "GroupList": [u["Group"]], "AttachedManagedPolicies": [],
+                    "UserPolicyList": [],
+                }))
+            for name, policy in GROUPS.items():
+                entries.append(("GroupDetailList", {
+                    "GroupName": name, "GroupId": f"AGPA{name.upper():0>17}", "Path": "/", "CreateDate": CREATED,
+                    "Arn": f"arn:aws:iam::{account}:group/{name}", "GroupPolicyList": [],
+                    "AttachedManagedPolicies": [{"PolicyName": policy, "PolicyArn": AWS_POLICY + policy}],
+                }))
+            for r in self.roles:
+                attached = [{"PolicyName": r["Policy"], "PolicyArn": f"arn:aws:iam::{account}:policy/{r['Policy']}"}]
+                if r["Admin"]:
+                    attached.append({"PolicyName": "AdministratorAccess", "PolicyArn": AWS_POLICY + "AdministratorAccess"})
+                entries.append(("RoleDetailList", {
+                    "RoleName": r["RoleName"], "RoleId": r["RoleId"], "Arn": r["Arn"], "Path": r["Path"],
+                    "CreateDate": CREATED, "RolePolicyList": [], "AttachedManagedPolicies": attached,
+                    "AssumeRolePolicyDocument": _policy_document([
+                        {"Effect": "Allow", "Principal": {"Service": "ec2.amazonaws.com"}, "Action": "sts:AssumeRole"}
+                    ]),
+                }))
+            for name, statements in AWS_MANAGED_POLICIES.items():
+                entries.append(("Policies", self._managed_policy(name, AWS_POLICY + name, statements)))
+            for i in range(self.role_policies if self.roles else 0):
+                name = f"role-policy-{i:04d}"
+                action = ["s3:*", "ec2:*"] if i % 10 == 0 else ["s3:GetObject", "s3:PutObject"]
+                resource = "*" if i % 10 == 0 else f"arn:aws:s3:::bucket-{i:06d}/*"
+                entries.append(("Policies", self._managed_policy(
+                    name, f"arn:aws:iam::{account}:policy/{name}",
+                    [{"Effect": "Allow", "Action": action, "Resource": resource}],
+                )))
+            self._authorization_details = entries
+        return self._authorization_details
+
+    @staticmethod
+    def _managed_policy(name, arn, statements):
+        return {
+            "PolicyName": name, "PolicyId": f"ANPA{abs(hash(arn)) % 10 ** 17:017d}", "Arn": arn, "Path": "/",
+            "DefaultVersionId": "v1", "AttachmentCount": 1, "IsAttachable": True, "CreateDate": CREATED,
+            "PolicyVersionList": [{"Document": _policy_document(statements),
+                                   "VersionId": "v1", "IsDefaultVersion": True, "CreateDate": CREATED}],
+        }
+
+    def _op_GetAccountAuthorizationDetails(self, params):
+        entries = self.authorization_details()
+        start = int(params.get("Marker") or 0)
+        page = entries[start:start + (params.get("MaxItems") or 100)]
+        response = {"UserDetailList": [], "GroupDetailList": [], "RoleDetailList": [], "Policies": [],
+                    "IsTruncated": start + len(page) < len(entries)}
+        # botocore decodes policy documents in place; the cached entries must stay encoded
+        for key, entry in copy.deepcopy(page):
+            response[key].append(entry)
+        if response["IsTruncated"]:
+            response["Marker"] = str(start + len(page))
+        return response
+
+
+class AccountStubber(Stubber):
+    """Stubber that answers every call from a SyntheticAccount."""
+
+    def __init__(self, client, account, latency=0.0):
+        super().__init__(client)
+        self.account = account
+        self.latency = latency
+
+    def _assert_expected_params(self, model, params, context, **kwargs):
+        # API parameters are only visible here; before-call sees the serialized request
+        context["synthetic_params"] = dict(params)
+
+    def _get_response_handler(self, model, params, context, **kwargs):
+        api_params = context.get("synthetic_params", {})
+        if self.latency:
+            time.sleep(self.latency)  # simulated network round trip
+        return AWSResponse(None, 200, {}, None), self.account.respond(model.name, api_params)
+
+
+class SyntheticSession:
+    """Drop-in for boto3.Session whose clients are backed by a SyntheticAccount."""
+
+    def __init__(self, account, region_name="us-east-1", latency=0.0):
+        self.account = account
+        self.region_name = region_name
+        self.latency = latency
+        self._session = boto3.Session(
+            aws_access_key_id="AKIABENCHMARK",
+            aws_secret_access_key="benchmark",
+            region_name=region_name,
+        )
+        self.events = self._session.events
+
+    def client(self, service_name, region_name=None, **kwargs):
+        client = self._session.client(service_name, region_name=region_name or self.region_name, **kwargs)
+        AccountStubber(client, self.account, self.latency).activate()
+        return client
@@ -2,7 +2,8 @@
 from datetime import datetime
 import socket
 import platform
-import random
+
+from cwpp.vuln_matcher import find_vulnerable_packages
 
 def run_runtime_checks():
     # Simulated runtime security checks
@@ -19,8 +20,15 @@ def run_runtime_checks():
     except Exception:
         pass
 
-    if random.random() > 0.5:
-        findings.append({"type": "Package Alert", "message": "Outdated curl package found"})
+    # Installed packages matched against the offline advisory feed (CWPP_VULN_FEED)
+    for vuln in find_vulnerable_packages():
+        fixed = f", fixed in {vuln['fixed_version']}" if vuln["fixed_version"] else ""
+        findings.append({
+            "type": "Package Vulnerability",
+            "message": f"{vuln['id']}: {vuln['package']} {vuln['installed_version']} is vulnerable{fixed}",
+            "severity": vuln["severity"],
+            "package": vuln["package"],
+        })
 
     return {
         "scan_type": "CWPP",
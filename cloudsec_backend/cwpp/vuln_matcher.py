@@ -0,0 +1,512 @@
+# cwpp/vuln_matcher.py
+"""
+Package vulnerability matching against an offline advisory feed.
+
+The feed is a JSON file with an "advisories" list. Each advisory looks like:
+
+    {
+        "id": "CVE-2023-38545",
+        "package": "curl",
+        "ecosystem": "dpkg",            # optional: dpkg | rpm | pip
+        "introduced": "7.69.0",         # optional, inclusive lower bound
+        "fixed": "8.4.0",               # optional, exclusive upper bound
+        "severity": "critical",
+        "summary": "SOCKS5 heap buffer overflow"
+    }
+
+Advisories are indexed by package name with ranges sorted by their lower
+bound, so matching a host inventory is one dict lookup plus a bisect per
+package. The index is persisted to a compact binary cache that is read via
+mmap, so a restart only decodes the packages it actually looks up.
+"""
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import subprocess
+import threading
+
+DPKG_STATUS_PATH = "/var/lib/dpkg/status"
+FEED_PATH = os.getenv("CWPP_VULN_FEED")
+CACHE_PATH = os.getenv("CWPP_VULN_CACHE", (FEED_PATH or "vuln_feed.json") + ".idx")
+
+_CACHE_MAGIC = b"CWPPIDX1"
+# magic, feed digest, package count
+_HEADER = struct.Struct("<8s32sI")
+# name offset, name length, ranges offset, ranges length
+_ENTRY = struct.Struct("<IHII")
+
+_DPKG_PART = re.compile(r"(\D*)(\d*)")
+_RPM_SEGMENT = re.compile(r"~|\^|[A-Za-z]+|\d+")
+
+# Key of an empty version ("introduced" left out): before every real version
+_LOWEST = (-1,)
+
+
+# -------------------------
+# Version ordering
+# -------------------------
+# Each ecosystem orders versions its own way; keys are only ever compared
+# with keys of the same ecosystem.
+def _split_epoch(version: str) -> tuple:
+    head, sep, rest = version.partition(":")
+    if sep and head.isdigit():
+        return int(head), rest
+    return 0, version
+
+
+def _dpkg_order(char: str) -> int:
+    # dpkg: "~" before everything (even the end), then the end, letters, other characters
+    if char == "~":
+        return -1
+    if char.isalpha():
+        return ord(char)
+    return ord(char) + 256
+
+
+def _dpkg_part_key(part: str) -> tuple:
+    """dpkg's verrevcmp as a key: alternating non-digit runs (by character) and numbers."""
+    key = []
+    for letters, digits in _DPKG_PART.findall(part):
+        if not letters and not digits:
+            continue
+        key.append((tuple(_dpkg_order(c) for c in letters) + (0,), int(digits or 0)))
+    key.append(((0,), 0))  # the end compares as an empty run
+    return tuple(key)
+
+
+def _dpkg_key(version: str) -> tuple:
+    """[epoch:]upstream[-revision]; the revision (after the last "-") only breaks upstream ties."""
+    epoch, version = _split_epoch(version)
+    upstream, _, revision = version.rpartition("-") if "-" in version else (version, "", "")
+    return (epoch, _dpkg_part_key(upstream), _dpkg_part_key(revision))
+
+
+def _rpm_part_key(part: str) -> tuple:
+    """rpmvercmp as a key: "~" < end < "^" < letters < numbers; separators only split segments."""
+    key = []
+    for segment in _RPM_SEGMENT.findall(part):
+        if segment == "~":
+            key.append((0,))
+        elif segment == "^":
+            key.append((2,))
+        elif segment.isdigit():
+            key.append((4, int(segment)))
+        else:
+            key.append((3, segment))
+    key.append((1,))
+    return tuple(key)
+
+
+def _rpm_key(version: str) -> tuple:
+    """[epoch:]version[-release]."""
+    epoch, version = _split_epoch(version)
+    upstream, _, release = version.rpartition("-") if "-" in version else (version, "", "")
+    return (epoch, _rpm_part_key(upstream), _rpm_part_key(release))
+
+
+def _pep440_key(version: str) -> tuple:
+    """PEP 440 order (pre- and dev releases before the release); dpkg rules for anything else."""
+    from packaging.version import InvalidVersion, Version
+
+    try:
+        return (1, Version(version))
+    except InvalidVersion:
+        return (0, _dpkg_key(version))
+
+
+_VERSION_KEYS = {"dpkg": _dpkg_key, "rpm": _rpm_key, "pip": _pep440_key}
+
+
+def version_key(version: str, ecosystem: str = None) -> tuple:
+    """
+    Sort key of `version` in `ecosystem` (dpkg, rpm or pip). Versions of an
+    unknown ecosystem are read as PEP 440 when they parse, so "2.0rc1" stays
+    before "2.0".
+    """
+    if not version:
+        return _LOWEST
+    return _VERSION_KEYS.get(ecosystem, _pep440_key)(version)
+
+
+# -------------------------
+# Host package inventory
+# -------------------------
+def parse_dpkg_status(path: str = DPKG_STATUS_PATH) -> list:
+    """Parse installed packages from a dpkg status file."""
+    packages = []
+    if not os.path.exists(path):
+        return packages
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        fields = {}
+        for line in f:
+            line = line.rstrip("\n")
+            if not line:
+                if fields:
+                    _append_dpkg_package(packages, fields)
+                fields = {}
+                continue
+            if line[0] in " \t":
+                continue
+            name, _, value = line.partition(":")
+            fields[name] = value.strip()
+        if fields:
+            _append_dpkg_package(packages, fields)
+    return packages
+
+
+def _append_dpkg_package(packages: list, fields: dict):
+    if "install ok installed" not in fields.get("Status", ""):
+        return
+    if fields.get("Package") and fields.get("Version"):
+        packages.append({
+            "name": fields["Package"].lower(),
+            "version": fields["Version"],
+            "ecosystem": "dpkg",
+        })
+
+
+def list_rpm_packages() -> list:
+    """List installed RPM packages (empty when rpm is not available)."""
+    try:
+        completed_process = subprocess.run(
+            ["rpm", "-qa", "--queryformat", "%{NAME} %{EPOCHNUM}:%{VERSION}-%{RELEASE}\n"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=30,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return []
+
+    packages = []
+    for line in completed_process.stdout.splitlines():
+        name, _, version = line.partition(" ")
+        if name and version:
+            packages.append({"name": name.lower(), "version": version, "ecosystem": "rpm"})
+    return packages
+
+
+def list_pip_packages() -> list:
+    """List Python distributions installed in the current environment."""
+    from importlib import metadata
+
+    packages = []
+    for dist in metadata.distributions():
+        name = dist.metadata.get("Name")
+        if name and dist.version:
+            packages.append({
+                "name": re.sub(r"[-_.]+", "-", name).lower(),
+                "version": dist.version,
+                "ecosystem": "pip",
+            })
+    return packages
+
+
+def collect_host_packages() -> list:
+    """Installed packages from every package database found on the host."""
+    return parse_dpkg_status() + list_rpm_packages() + list_pip_packages()
+
+
+# -------------------------
+# Advisory index
+# -------------------------
+def _range_entry(advisory: dict) -> tuple:
+    """Compact range tuple: (introduced, fixed, id, ecosystem, severity, summary)."""
+    return (
+        advisory.get("introduced") or "",
+        advisory.get("fixed") or "",
+        advisory["id"],
+        advisory.get("ecosystem") or "",
+        (advisory.get("severity") or "").lower(),
+        advisory.get("summary") or "",
+    )
+
+
+def _range_sort_key(entry) -> tuple:
+    return entry[3], version_key(entry[0], entry[3] or None)
+
+
+class AdvisoryIndex:
+    """
+    In-memory advisory index keyed by package name.
+
+    Each package maps to a list of range tuples sorted by ecosystem and lower
+    bound. A lookup sorts the ranges that apply to the installed package's
+    ecosystem with that ecosystem's version order (once per package and
+    ecosystem), so it only scans ranges whose lower bound is <= the installed
+    version. Packages loaded from the mmap cache are decoded on first use.
+    """
+
+    def __init__(self, packages: dict = None, digest: bytes = b""):
+        self._packages = packages or {}
+        self._views = {}  # name -> {ecosystem: (ranges, lower bound keys, fixed keys)}
+        self._mapped = None
+        self._mapped_count = 0
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.package_names())
+
+    def package_names(self) -> set:
+        names = set(self._packages)
+        if self._mapped is not None:
+            names.update(self._mapped_name(i) for i in range(self._mapped_count))
+        return names
+
+    # --- building ---
+    def copy(self):
+        """A copy to update while lookups keep using this one; the mmap cache is shared (read-only)."""
+        index = type(self)(dict(self._packages), self.digest)
+        index._views = dict(self._views)
+        index._mapped = self._mapped
+        index._mapped_count = self._mapped_count
+        return index
+
+    @classmethod
+    def from_advisories(cls, advisories: list, digest: bytes = b""):
+        index = cls(digest=digest)
+        index.apply_update({"advisories": advisories})
+        return index
+
+    def apply_update(self, update: dict):
+        """
+        Apply an incremental feed update: add or replace the advisories in
+        "advisories" and drop every id listed in "withdrawn". Only the
+        packages touched by the update are re-sorted. The digest is left
+        alone so a saved cache (feed + updates) stays valid for the same feed.
+        """
+        withdrawn = set(update.get("withdrawn", []))
+        added = {}
+        for advisory in update.get("advisories", []):
+            if advisory.get("id") and advisory.get("package"):
+                added.setdefault(advisory["package"].lower(), []).append(advisory)
+
+        touched = set(added)
+        if withdrawn:
+            # Withdrawals name only the advisory id, so every package is checked.
+            for name in self.package_names():
+                if any(entry[2] in withdrawn for entry in self.ranges(name)):
+                    touched.add(name)
+
+        for name in touched:
+            replaced = withdrawn | {advisory["id"] for advisory in added.get(name, [])}
+            ranges = [entry for entry in self.ranges(name) if entry[2] not in replaced]
+            ranges.extend(_range_entry(advisory) for advisory in added.get(name, []))
+            ranges.sort(key=_range_sort_key)
+            self._packages[name] = ranges
+            self._views.pop(name, None)
+        return len(touched)
+
+    # --- lookups ---
+    def ranges(self, name: str) -> list:
+        ranges = self._packages.get(name)
+        if ranges is None and self._mapped is not None:
+            ranges = self._load_mapped(name)
+        return ranges or []
+
+    def _view(self, name: str, ecosystem: str) -> tuple:
+        """Ranges of `name` that apply to `ecosystem`, in that ecosystem's version order."""
+        views = self._views.setdefault(name, {})
+        view = views.get(ecosystem)
+        if view is None:
+            ranges = [entry for entry in self.ranges(name)
+                      if not ecosystem or not entry[3] or entry[3] == ecosystem]
+            keyed = sorted(((version_key(entry[0], ecosystem), entry) for entry in ranges), key=lambda k: k[0])
+            view = views[ecosystem] = (
+                [entry for _, entry in keyed],
+                [start for start, _ in keyed],
+                [version_key(entry[1], ecosystem) if entry[1] else None for _, entry in keyed],
+            )
+        return view
+
+    def lookup(self, name: str, version: str, ecosystem: str = None) -> list:
+        """Advisories whose affected range contains name/version."""
+        name = name.lower()
+        if not self.ranges(name):
+            return []
+
+        ecosystem = ecosystem or None
+        ranges, starts, fixed_keys = self._view(name, ecosystem)
+        installed = version_key(version, ecosystem)
+        matches = []
+        for i in range(bisect.bisect_right(starts, installed)):
+            introduced, fixed, advisory_id, advisory_ecosystem, severity, summary = ranges[i]
+            if fixed_keys[i] is not None and installed >= fixed_keys[i]:
+                continue
+            matches.append({
+                "id": advisory_id,
+                "package": name,
+                "installed_version": version,
+                "fixed_version": fixed or None,
+                "severity": severity,
+                "summary": summary,
+            })
+        return matches
+
+    def match_packages(self, packages: list) -> list:
+        matches = []
+        for package in packages:
+            matches.extend(self.lookup(package["name"], package["version"], package.get("ecosystem")))
+        return matches
+
+    # --- mmap cache ---
+    def save(self, path: str):
+        """
+        Write the index as: header, fixed-size entry table sorted by package
+        name, then a blob of names and JSON-encoded range lists.
+        """
+        names = sorted(self.package_names())
+        table = bytearray()
+        blob = bytearray()
+        blob_start = _HEADER.size + _ENTRY.size * len(names)
+        for name in names:
+            encoded_name = name.encode()
+            encoded_ranges = json.dumps(self.ranges(name), separators=(",", ":")).encode()
+            name_offset = blob_start + len(blob)
+            blob += encoded_name
+            table += _ENTRY.pack(name_offset, len(encoded_name), name_offset + len(encoded_name), len(encoded_ranges))
+            blob += encoded_ranges
+
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(_CACHE_MAGIC, self.digest.ljust(32, b"\0")[:32], len(names)))
+            f.write(table)
+            f.write(blob)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, digest: bytes = None):
+        """Map a cache file; returns None when it is missing, corrupt or stale."""
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        if len(mapped) < _HEADER.size:
+            return None
+        magic, cached_digest, count = _HEADER.unpack_from(mapped, 0)
+        if magic != _CACHE_MAGIC or (digest is not None and cached_digest != digest.ljust(32, b"\0")[:32]):
+            mapped.close()
+            return None
+
+        index = cls(digest=cached_digest)
+        index._mapped = mapped
+        index._mapped_count = count
+        return index
+
+    def _mapped_entry(self, i: int) -> tuple:
+        return _ENTRY.unpack_from(self._mapped, _HEADER.size + i * _ENTRY.size)
+
+    def _mapped_name(self, i: int) -> str:
+        name_offset, name_length, _, _ = self._mapped_entry(i)
+        return self._mapped[name_offset:name_offset + name_length].decode()
+
+    def _find_mapped(self, name: str) -> int:
+        lo, hi = 0, self._mapped_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            mid_name = self._mapped_name(mid)
+            if mid_name < name:
+                lo = mid + 1
+            elif mid_name > name:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _load_mapped(self, name: str) -> list:
+        i = self._find_mapped(name)
+        if i < 0:
+            return []
+        _, _, ranges_offset, ranges_length = self._mapped_entry(i)
+        ranges = [tuple(entry) for entry in json.loads(self._mapped[ranges_offset:ranges_offset + ranges_length])]
+        self._packages[name] = ranges
+        return ranges
+
+
+# -------------------------
+# Feed loading
+# -------------------------
+def _file_digest(path: str) -> bytes:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+def load_index(feed_path: str = FEED_PATH, cache_path: str = CACHE_PATH):
+    """
+    Load the advisory index, preferring the mmap cache when it was built from
+    the same feed file. Rebuilds and rewrites the cache otherwise.
+    """
+    if not feed_path or not os.path.exists(feed_path):
+        return None
+
+    digest = _file_digest(feed_path)
+    index = AdvisoryIndex.load(cache_path, digest)
+    if index is not None:
+        return index
+
+    with open(feed_path, encoding="utf-8") as f:
+        feed = json.load(f)
+    index = AdvisoryIndex.from_advisories(feed.get("advisories", []))
+    index.digest = digest
+    try:
+        index.save(cache_path)
+    except OSError:
+        pass
+    return index
+
+
+_index = None
+# Serializes the first load and feed updates; lookups use whichever index is current
+_index_lock = threading.Lock()
+
+
+def _load_locked():
+    global _index
+    if _index is None:
+        _index = load_index()
+    return _index
+
+
+def get_index():
+    if _index is None:
+        with _index_lock:
+            return _load_locked()
+    return _index
+
+
+def apply_feed_update(update_path: str, cache_path: str = CACHE_PATH) -> int:
+    """Apply an incremental feed file to a copy of the loaded index, then swap it in and refresh the cache."""
+    global _index
+    with open(update_path, encoding="utf-8") as f:
+        update = json.load(f)
+    with _index_lock:
+        current = _load_locked()
+        if current is None:
+            return 0
+        index = current.copy()
+        touched = index.apply_update(update)
+        if touched:
+            index.save(cache_path)
+            _index = index
+    return touched
+
+
+def find_vulnerable_packages(packages: list = None) -> list:
+    """Match the host (or the given) package list against the advisory feed."""
+    index = get_index()
+    if index is None:
+        return []
+    if packages is None:
+        packages = collect_host_packages()
+    return index.match_packages(packages)
@@ -1,22 +1,19 @@
-import boto3
+from backend.s3_collector import collect_s3_posture
+from backend.aws_scanner import get_session
+
 
 def check_s3_public_buckets():
-    s3 = boto3.client("s3")
     violations = []
-    response = s3.list_buckets()
 
-    for bucket in response["Buckets"]:
+    for bucket in collect_s3_posture(get_session()):
         bucket_name = bucket["Name"]
-        try:
-            acl = s3.get_bucket_acl(Bucket=bucket_name)
-            for grant in acl["Grants"]:
-                grantee = grant.get("Grantee", {})
-                if grantee.get("URI") == "http://acs.amazonaws.com/groups/global/AllUsers":
-                    violations.append({
-                        "bucket": bucket_name,
-                        "issue": "Public bucket detected"
-                    })
-        except Exception as e:
-            violations.append({"bucket": bucket_name, "error": str(e)})
+        if bucket["PublicAccess"]:
+            violations.append({
+                "bucket": bucket_name,
+                "region": bucket["Region"],
+                "issue": "Public bucket detected"
+            })
+        for check, error in bucket["Errors"].items():
+            violations.append({"bucket": bucket_name, "error": f"{check}: {error}"})
 
     return violations
@@ -1,5 +1,10 @@
 package cloudsec.ec2
 
+# Input fields read by this package (policy_evaluator sends only these)
+# cloudsec:input ec2.Reservations[].Instances[].InstanceId
+# cloudsec:input ec2.Reservations[].Instances[].Tags
+# cloudsec:input ec2.Exposure
+
 default deny = []
 
 deny contains msg if {
@@ -11,12 +16,8 @@ deny contains msg if {
 }
 
 deny contains msg if {
-    # Check security groups in EC2 instances
-    some reservation in input.ec2.Reservations
-    some instance in reservation.Instances
-    count(instance.SecurityGroups) > 0
-    some sg in instance.SecurityGroups
-    sg_id := sg.GroupId
-    sg_name := sg.GroupName
-    msg := sprintf("⚠️ EC2 instance %s has security group %s (%s)", [instance.InstanceId, sg_id, sg_name])
+    # Internet exposure, precomputed by the scanner (backend/ec2_exposure.py):
+    # public instances whose security groups open a sensitive port to 0.0.0.0/0 or ::/0
+    some e in input.ec2.Exposure
+    msg := sprintf("🚨 EC2 instance %s is open to %s on %s/%s via security group %s", [e.InstanceId, e.Cidr, e.Protocol, e.Ports, e.GroupId])
 }
@@ -1,10 +1,14 @@
 package cloudsec.s3
 
-default allow = true
+# Input fields read by this package (policy_evaluator sends only these)
+# cloudsec:input s3.s3_buckets[].Name
+# cloudsec:input s3.s3_buckets[].PublicAccess
 
-# Rule: Bucket must not be public
-violation[msg] {
-  some bucket
-  input.buckets[bucket].public == true
-  msg := sprintf("S3 Bucket %s is publicly accessible", [bucket])
+default deny = []
+
+deny contains msg if {
+    # Bucket reachable publicly through its ACL or bucket policy
+    some bucket in input.s3.s3_buckets
+    bucket.PublicAccess == true
+    msg := sprintf("S3 Bucket %s is publicly accessible", [bucket.Name])
 }
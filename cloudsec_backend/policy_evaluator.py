@@ -1,62 +1,318 @@
 import requests
 import json
-import logging
 import os
+import time
+import uuid
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+from backend.decision_cache import get_decision_cache
+from backend.log import get_logger
+from backend.metrics import track_call, record_bytes
+from backend.resilience import DependencyUnavailable, breaker, time_left
+
+logger = get_logger(__name__)
 
 # Get OPA URL from env (Docker will override it), default to localhost
 OPA_URL = os.getenv("OPA_URL", "http://localhost:8181/v1/data")
+# Defaults to the query API next to OPA_URL (.../v1/query)
+OPA_QUERY_URL = os.getenv("OPA_QUERY_URL")
+# Per-call caps; the request's remaining deadline can make them shorter
+OPA_TIMEOUT = float(os.getenv("OPA_TIMEOUT", "10"))
+OPA_PUSH_TIMEOUT = float(os.getenv("OPA_PUSH_TIMEOUT", "30"))
+POLICY_DIR = os.getenv("OPA_POLICY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "policies"))
+
+# Inputs at least this large (bytes) are pushed once to OPA's data API and
+# every policy is queried against that document. 0 disables the push.
+DATA_PUSH_BYTES = int(os.getenv("OPA_DATA_PUSH_BYTES", str(1024 * 1024)))
+DATA_PUSH_ROOT = "cloudsec_inventory"
+
+# Rego files declare the input fields they read with comment lines such as
+#   # cloudsec:input s3.s3_buckets[].Name
+# "[]" walks into a list; the last segment is kept whole.
+INPUT_DECLARATION = "# cloudsec:input "
 
-def evaluate_policy(scan_results: dict, policy_path: str):
-    """
-    scan_results: dict from scanner
-    policy_path: e.g. "cloudsec/s3/deny"
-    """
-    logger.info(f"🔍 Evaluating policy: {policy_path}")
-    logger.info(f"📊 Scan results keys: {list(scan_results.keys())}")
 
+# -------------------------
+# Input declarations
+# -------------------------
+_declarations = {}  # rego file -> (mtime, package, paths)
+
+
+def _read_rego(path):
+    package, paths = None, []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("package ") and package is None:
+                package = line.split()[1]
+            elif line.startswith(INPUT_DECLARATION):
+                paths.append(line[len(INPUT_DECLARATION):].strip())
+    return package, paths
+
+
+def _package_paths():
+    """package -> declared input paths, re-read only when a .rego file changes."""
+    packages = {}
     try:
-        # Prepare request payload
-        request_data = {"input": scan_results}
-        opa_endpoint = f"{OPA_URL}/{policy_path}"
+        entries = [e for e in os.scandir(POLICY_DIR) if e.name.endswith(".rego")]
+    except FileNotFoundError:
+        return packages
+    for entry in entries:
+        mtime = entry.stat().st_mtime
+        cached = _declarations.get(entry.path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, *_read_rego(entry.path))
+            _declarations[entry.path] = cached
+        _, package, paths = cached
+        if package and paths:
+            packages.setdefault(package, []).extend(paths)
+    return packages
+
+
+def _build_tree(paths):
+    """Declared paths -> {key: (is_list, subtree or None for "keep whole")}."""
+    tree = {}
+    for path in paths:
+        node = tree
+        segments = path.split(".")
+        for i, segment in enumerate(segments):
+            is_list = segment.endswith("[]")
+            key = segment[:-2] if is_list else segment
+            last = i == len(segments) - 1
+            current = node.get(key)
+            if last:
+                node[key] = (is_list, None)
+                break
+            if current is not None and current[1] is None:
+                break  # an ancestor is already kept whole
+            if current is None:
+                current = (is_list, {})
+                node[key] = current
+            node = current[1]
+    return tree
+
+
+def _project(value, tree):
+    if not isinstance(value, dict):
+        return value
+    out = {}
+    for key, (is_list, subtree) in tree.items():
+        if key not in value:
+            continue  # absent stays absent (policies test for missing fields)
+        item = value[key]
+        if subtree is None:
+            out[key] = item
+        elif is_list and isinstance(item, list):
+            out[key] = [_project(element, subtree) for element in item]
+        else:
+            out[key] = _project(item, subtree)
+    return out
 
-        logger.info(f"📤 Sending request to OPA: {opa_endpoint}")
-        logger.debug(f"📤 Request payload size: {len(json.dumps(request_data))} bytes")
 
-        response = requests.post(
-            opa_endpoint,
-            data=json.dumps(request_data),
-            headers={"Content-Type": "application/json"},
-            timeout=10
-        )
+def input_paths(policy_path: str):
+    """Declared input paths for a policy such as "cloudsec/s3/deny", or None if undeclared."""
+    dotted = policy_path.strip("/").replace("/", ".")
+    packages = _package_paths()
+    for package in sorted(packages, key=len, reverse=True):
+        if dotted == package or dotted.startswith(package + "."):
+            return packages[package]
+    return None
 
-        logger.info(f"📥 OPA response status: {response.status_code}")
+
+def project_input(scan_results: dict, policy_paths):
+    """Only the fields the given policies declare; the full input if any policy declares nothing."""
+    paths = []
+    for policy_path in policy_paths:
+        declared = input_paths(policy_path)
+        if declared is None:
+            return scan_results
+        paths.extend(declared)
+    return _project(scan_results, _build_tree(paths))
+
+
+# -------------------------
+# OPA calls
+# -------------------------
+def _unavailable(error):
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+def _post(url, payload, operation):
+    timeout = time_left(OPA_TIMEOUT, "opa")
+    record_bytes("opa", "sent", len(payload))
+    with breaker("opa").guard(_unavailable) as call:
+        with track_call("opa", operation):
+            response = requests.post(url, data=payload, headers={"Content-Type": "application/json"}, timeout=timeout)
+        if response.status_code >= 500:
+            call.failed()
+    record_bytes("opa", "received", len(response.content))
+    return response
+
+
+def _evaluate(policy_path, send):
+    """
+    Shared error handling; send() returns the OPA response and a result extractor.
+    Returns (violations, ok); failures come back as a one-message list with ok=False.
+    """
+    try:
+        response, extract = send()
 
         if response.status_code != 200:
-            logger.error(f"❌ OPA request failed: {response.status_code} - {response.text}")
-            return [f"OPA HTTP error {response.status_code}: {response.text}"]
+            logger.error("opa_request_failed", policy=policy_path, status=response.status_code, body=response.text)
+            return [f"OPA HTTP error {response.status_code}: {response.text}"], False
 
-        data = response.json()
-        result = data.get("result", [])
+        result = extract(response.json())
 
-        logger.info(f"✅ Policy evaluation result: {len(result)} violations found")
+        logger.info("policy_evaluated", policy=policy_path, violations=len(result))
         if result:
-            logger.info(f"🚨 Violations: {result}")
+            logger.debug("policy_violations", policy=policy_path, violations=result)
 
-        return result
+        return result, True
 
+    except DependencyUnavailable as e:
+        # Open breaker or spent deadline: fail fast, reported like any other OPA failure
+        logger.warning("opa_unavailable", policy=policy_path, error=str(e))
+        return [f"OPA unavailable: {e}"], False
     except requests.exceptions.ConnectionError as e:
-        logger.error(f"❌ Cannot connect to OPA at {OPA_URL}: {e}")
-        return [f"OPA connection error: Cannot reach OPA server at {OPA_URL}"]
+        logger.error("opa_connection_error", opa_url=OPA_URL, error=str(e))
+        return [f"OPA connection error: Cannot reach OPA server at {OPA_URL}"], False
     except requests.exceptions.Timeout as e:
-        logger.error(f"❌ OPA request timeout: {e}")
-        return [f"OPA timeout error: Request timed out"]
+        logger.error("opa_timeout", policy=policy_path, error=str(e))
+        return [f"OPA timeout error: Request timed out"], False
     except json.JSONDecodeError as e:
-        logger.error(f"❌ Invalid JSON response from OPA: {e}")
-        return [f"OPA JSON decode error: {e}"]
+        logger.error("opa_invalid_json", policy=policy_path, error=str(e))
+        return [f"OPA JSON decode error: {e}"], False
     except Exception as e:
-        logger.error(f"❌ Unexpected error in policy evaluation: {e}")
-        return [f"OPA evaluation error: {e}"]
+        logger.exception("policy_evaluation_error", policy=policy_path, error=str(e))
+        return [f"OPA evaluation error: {e}"], False
+
+
+def _evaluate_input(payload, policy_path):
+    opa_endpoint = f"{OPA_URL}/{policy_path}"
+    logger.debug("opa_request", endpoint=opa_endpoint, payload_bytes=len(payload))
+    return _evaluate(policy_path, lambda: (
+        _post(opa_endpoint, payload, policy_path),
+        lambda data: data.get("result", []),
+    ))
+
+
+def _evaluate_pushed(document_path, policy_path):
+    rule = "data." + policy_path.strip("/").replace("/", ".")
+    query = json.dumps({"query": f"x = {rule} with input as data.{document_path.replace('/', '.')}"})
+
+    def extract(data):
+        rows = data.get("result", [])
+        return rows[0].get("x", []) if rows else []
+
+    query_url = OPA_QUERY_URL or OPA_URL.rstrip("/").rsplit("/data", 1)[0] + "/query"
+    return _evaluate(policy_path, lambda: (_post(query_url, query, policy_path), extract))
+
+
+def _push_document(document_path, payload):
+    timeout = time_left(OPA_PUSH_TIMEOUT, "opa")
+    record_bytes("opa", "sent", len(payload))
+    with breaker("opa").guard(_unavailable) as call:
+        with track_call("opa", "data_put"):
+            response = requests.put(
+                f"{OPA_URL}/{document_path}", data=payload, headers={"Content-Type": "application/json"},
+                timeout=timeout
+            )
+        if response.status_code >= 500:
+            call.failed()
+    response.raise_for_status()
+
+
+def _delete_document(document_path):
+    try:
+        with track_call("opa", "data_delete"):
+            requests.delete(f"{OPA_URL}/{document_path}", timeout=10)
+    except requests.exceptions.RequestException as e:
+        logger.warning("opa_data_delete_failed", document=document_path, error=str(e))
+
+
+def _evaluate_pending(scan_results, pending):
+    """pending: {policy_path: input payload}; returns {policy_path: (violations, ok, eval_ms)}."""
+    total_bytes = sum(len(payload) for payload in pending.values())
+    if DATA_PUSH_BYTES and total_bytes >= DATA_PUSH_BYTES:
+        document = json.dumps(project_input(scan_results, list(pending)))
+        document_path = f"{DATA_PUSH_ROOT}/s{uuid.uuid4().hex}"
+        started = time.perf_counter()
+        try:
+            _push_document(document_path, document)
+        except (requests.exceptions.RequestException, DependencyUnavailable) as e:
+            logger.warning("opa_data_push_failed", document_bytes=len(document), error=str(e))
+        else:
+            logger.debug("opa_data_pushed", document=document_path, document_bytes=len(document))
+            try:
+                pushed = {path: _evaluate_pushed(document_path, path) for path in pending}
+            finally:
+                _delete_document(document_path)
+            # The push is shared, so each policy is charged an even share of the batch
+            share_ms = (time.perf_counter() - started) * 1000 / len(pending)
+            return {path: (result, ok, share_ms) for path, (result, ok) in pushed.items()}
+
+    evaluated = {}
+    for path, payload in pending.items():
+        started = time.perf_counter()
+        result, ok = _evaluate_input(payload, path)
+        evaluated[path] = (result, ok, (time.perf_counter() - started) * 1000)
+    return evaluated
+
+
+def _cache_lookup(cache, path, payload, stats):
+    """(key, cached violations); a cache that cannot answer is a miss, never an error."""
+    try:
+        key = cache.key(path, payload)
+        return key, cache.get(key, stats)
+    except Exception as e:
+        logger.warning("policy_cache_lookup_failed", policy=path, error=str(e))
+        return None, None
+
+
+def _cache_store(cache, key, path, result, eval_ms):
+    if key is None:
+        return
+    try:
+        cache.put(key, path, result, eval_ms)
+    except Exception as e:
+        logger.warning("policy_cache_store_failed", policy=path, error=str(e))
+
+
+def evaluate_policies(scan_results: dict, policy_paths, stats=None):
+    """
+    Evaluate several policies over one scan; returns {policy_path: violations}.
+
+    Each policy gets only the input fields its package declares. Decisions are
+    cached by (bundle revision, policy, projected input); pass a CacheStats as
+    `stats` to collect the hit rate and OPA time saved. Misses with large
+    inputs are pushed to OPA's data API once and every policy is queried
+    against that document.
+    """
+    logger.debug("policy_evaluation_started", policies=policy_paths, input_keys=lambda: list(scan_results.keys()))
+    cache = get_decision_cache(POLICY_DIR)
+
+    results, keys, pending = {}, {}, {}
+    for path in policy_paths:
+        # Sorted keys make the payload (and so the cache key) independent of dict order
+        payload = json.dumps({"input": project_input(scan_results, [path])}, sort_keys=True, separators=(",", ":"))
+        keys[path], cached = _cache_lookup(cache, path, payload, stats)
+        if cached is not None:
+            logger.debug("policy_decision_cached", policy=path, violations=len(cached))
+            results[path] = cached
+        else:
+            pending[path] = payload
+
+    if pending:
+        for path, (result, ok, eval_ms) in _evaluate_pending(scan_results, pending).items():
+            if ok:
+                _cache_store(cache, keys[path], path, result, eval_ms)
+            results[path] = result
+
+    return {path: results[path] for path in policy_paths}
+
+
+def evaluate_policy(scan_results: dict, policy_path: str):
+    """
+    scan_results: dict from scanner
+    policy_path: e.g. "cloudsec/s3/deny"
+    """
+    return evaluate_policies(scan_results, [policy_path])[policy_path]
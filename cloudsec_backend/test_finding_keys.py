@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Finding Key Check
+Flattens sample CSPM and CWPP scan documents with backend/findings.py and
+fails when two different findings share a key (they would merge into one
+row in scan_findings, the export, /results/diff and finding_lifecycle).
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.findings import finding_key, finding_rows, tenant_finding_key
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+# As returned by cwpp/runtime_scanner.py
+CWPP_DOCUMENT = {"findings": [
+    {"type": "OS Warning", "message": "Non-Linux system detected", "severity": "Info"},
+    {"type": "Open Port", "message": "Port 8888 is open to public", "severity": "High"},
+    {"type": "Package Vulnerability", "message": "CVE-2024-0001: openssl 3.0.1 is vulnerable", "severity": "High"},
+    {"type": "Package Vulnerability", "message": "CVE-2024-0002: openssl 3.0.1 is vulnerable", "severity": "High"},
+]}
+
+CSPM_DOCUMENT = {
+    "findings": [
+        {"service": "IAM", "resource": "alice", "issue": "MFA not enabled", "severity": "Medium"},
+        {"service": "S3", "resource": "logs", "issue": "Public bucket", "severity": "High"},
+    ],
+    "policy_violations": {"s3": ["Bucket logs is public"]},
+}
+
+
+def test_finding_keys_distinct():
+    for name, document in (("cwpp", CWPP_DOCUMENT), ("cspm", CSPM_DOCUMENT)):
+        rows = list(finding_rows(document))
+        keys = {finding_key(service, resource, issue) for _, service, resource, issue, _ in rows}
+        tenant_keys = {tenant_finding_key(USER_ID, None, service, resource, issue)
+                       for _, service, resource, issue, _ in rows}
+        assert len(keys) == len(rows), f"{name}: {len(rows)} findings share {len(keys)} keys"
+        assert len(tenant_keys) == len(rows), f"{name}: {len(rows)} findings share {len(tenant_keys)} tenant keys"
+        assert all(issue for _, _, _, issue, _ in rows), f"{name}: finding without an issue: {rows}"
+        print(f"✅ {name}: {len(rows)} findings, {len(keys)} keys")
+
+
+def test_tenant_keys_per_account():
+    a = tenant_finding_key(USER_ID, "account-a", "IAM", "admin", "MFA not enabled")
+    b = tenant_finding_key(USER_ID, "account-b", "IAM", "admin", "MFA not enabled")
+    assert a != b, "the same finding in two accounts shares a key"
+    print("✅ tenant keys differ per account")
+
+
+if __name__ == "__main__":
+    test_finding_keys_distinct()
+    test_tenant_keys_per_account()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+IAM Graph Check
+Runs backend/iam_graph.py over small GetAccountAuthorizationDetails pages
+and fails when a permissions boundary is applied wrongly: grants must be
+intersected with the boundary (keeping the narrower pattern), and a
+boundary policy missing from the account details must not hide a finding.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from backend.iam_graph import IamGraph, analyze, analyze_document
+
+ADMIN_ARN = "arn:aws:iam::aws:policy/AdministratorAccess"
+POWER_USER_ARN = "arn:aws:iam::aws:policy/PowerUserAccess"
+EC2_BOUNDARY_ARN = "arn:aws:iam::123456789012:policy/ec2-only"
+
+
+def allow(*actions, **extra):
+    return {"Version": "2012-10-17", "Statement": [{"Effect": "Allow", "Action": list(actions), "Resource": "*", **extra}]}
+
+
+def narrowed(grant, boundary):
+    effective = analyze_document(grant).effective(analyze_document(boundary))
+    return sorted(effective.admin), sorted(effective.wildcard)
+
+
+def test_boundary_intersection():
+    cases = [
+        (allow("*"), allow("ec2:*"), ([], ["ec2:*"])),                    # the boundary is narrower
+        (allow("ec2:*"), allow("*"), ([], ["ec2:*"])),                    # the grant is narrower
+        (allow("*"), allow("iam:*"), (["iam:*"], [])),                    # narrowed, still admin
+        (allow("ec2:*", "s3:*"), allow("ec2:*"), ([], ["ec2:*"])),        # disjoint grants are dropped
+        (allow("*"), allow("s3:GetObject"), ([], [])),                   # nothing flagged is left
+        (allow("*"), {"Statement": [{"Effect": "Allow", "NotAction": "iam:*", "Resource": "*"}]},
+         ([], ["notaction:iam:*"])),
+        ({"Statement": [{"Effect": "Allow", "NotAction": "iam:*", "Resource": "*"}]}, allow("ec2:*"),
+         ([], ["ec2:*"])),
+    ]
+    for grant, boundary, expected in cases:
+        got = narrowed(grant, boundary)
+        assert got == expected, f"{grant['Statement']} under {boundary['Statement']}: expected {expected}, got {got}"
+
+    deny = analyze_document({"Statement": [
+        {"Effect": "Allow", "Action": "*", "Resource": "*"},
+        {"Effect": "Deny", "Action": "ec2:*", "Resource": "*"},
+    ]})
+    effective = deny.effective(analyze_document(allow("ec2:*", "s3:*")))
+    assert sorted(effective.wildcard) == ["s3:*"] and not effective.admin, "a Deny must still cover narrowed grants"
+    print(f"✅ {len(cases) + 1} boundary intersections")
+
+
+def account(boundary_arn, policies):
+    return [{
+        "UserDetailList": [{
+            "UserName": "alice",
+            "Arn": "arn:aws:iam::123456789012:user/alice",
+            "AttachedManagedPolicies": [{"PolicyName": "AdministratorAccess", "PolicyArn": ADMIN_ARN}],
+            "PermissionsBoundary": {"PermissionsBoundaryType": "Policy", "PermissionsBoundaryArn": boundary_arn},
+        }],
+        "Policies": [
+            {"Arn": arn, "PolicyVersionList": [{"IsDefaultVersion": True, "Document": document}]}
+            for arn, document in policies.items()
+        ],
+    }]
+
+
+def test_boundary_resolution():
+    # Resolved boundary: AdministratorAccess narrowed to ec2:*
+    findings, _ = analyze(IamGraph.from_pages(account(
+        EC2_BOUNDARY_ARN, {ADMIN_ARN: allow("*"), EC2_BOUNDARY_ARN: allow("ec2:*")}
+    )))
+    assert len(findings) == 1 and findings[0]["actions"] == ["ec2:*"], f"resolved boundary: {findings}"
+    assert findings[0]["via"] == ["AdministratorAccess"], f"resolved boundary via: {findings[0]['via']}"
+    assert "boundary_unresolved" not in findings[0]
+
+    # Unresolved boundary (AWS managed, not in the account details): still reported, with a note
+    findings, _ = analyze(IamGraph.from_pages(account(POWER_USER_ARN, {ADMIN_ARN: allow("*")})))
+    assert len(findings) == 1, f"an unresolved boundary hid the finding: {findings}"
+    assert findings[0]["issue"] == "Admin-equivalent permissions"
+    assert findings[0]["boundary_unresolved"] == POWER_USER_ARN
+    print("✅ resolved and unresolved boundaries")
+
+
+if __name__ == "__main__":
+    test_boundary_intersection()
+    test_boundary_resolution()
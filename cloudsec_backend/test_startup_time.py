@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Startup Time Check
+Imports the app in a fresh interpreter under `python -X importtime`, with no
+Supabase/AWS/database settings, and fails when:
+  - the import fails (clients must not be built at import time),
+  - importing backend.main takes longer than STARTUP_BUDGET_MS,
+  - a library that services.py builds lazily is imported eagerly.
+"""
+
+import os
+import subprocess
+import sys
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "800"))
+RUNS = int(os.getenv("STARTUP_RUNS", "3"))
+
+# Only imported on first use (backend/services.py and the scanners)
+DEFERRED_MODULES = ["supabase", "boto3", "botocore.session", "botocore.config", "psycopg2.pool"]
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure_import():
+    """One cold import; returns (returncode, {module: (self_us, cumulative_us)}, stderr)."""
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(("SUPABASE_", "AWS_", "STEAMPIPE_"))}
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.main"],
+        cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True,
+    )
+    modules = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|").split("|")]
+        modules[name] = (int(self_us), int(cumulative_us))
+    return completed.returncode, modules, completed.stderr
+
+
+def test_startup_time():
+    print("🚀 Startup Time Check")
+    print("=" * 50)
+
+    timings = []
+    modules = {}
+    for _ in range(RUNS):
+        returncode, modules, stderr = measure_import()
+        last_line = stderr.strip().splitlines()[-1] if stderr.strip() else "(no output)"
+        assert returncode == 0, f"Importing backend.main failed without environment variables: {last_line}"
+        timings.append(modules["backend.main"][1] / 1000)
+
+    best = min(timings)
+    print(f"⏱️  import backend.main: best {best:.0f} ms of {RUNS} (budget {STARTUP_BUDGET_MS:.0f} ms)")
+
+    print("\n🐢 Slowest imports (cumulative):")
+    top_level = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[1:11]
+    for name, (_, cumulative_us) in top_level:
+        print(f"   {cumulative_us / 1000:8.1f} ms  {name}")
+
+    eager = [m for m in DEFERRED_MODULES if m in modules]
+    assert not eager, f"Imported at startup but should be deferred: {', '.join(eager)}"
+
+    assert best <= STARTUP_BUDGET_MS, f"Startup over budget by {best - STARTUP_BUDGET_MS:.0f} ms"
+
+
+if __name__ == "__main__":
+    try:
+        test_startup_time()
+    except AssertionError as e:
+        print(f"\n❌ {e}")
+        sys.exit(1)
+
+    print("\n✅ Startup within budget.")
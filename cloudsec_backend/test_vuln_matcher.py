@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Vulnerability Matcher Check
+Checks cwpp/vuln_matcher.py against range and boundary cases: version order
+per ecosystem (dpkg, rpm, PEP 440 for pip), introduced / fixed bounds, the
+bisect over several ranges, the mmap cache round-trip and feed updates.
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from cwpp import vuln_matcher
+from cwpp.vuln_matcher import AdvisoryIndex, apply_feed_update, load_index, version_key
+
+ADVISORIES = [
+    {"id": "PIP-1", "package": "django", "ecosystem": "pip", "introduced": "2.0", "fixed": "2.2.28", "severity": "High"},
+    {"id": "PIP-2", "package": "django", "ecosystem": "pip", "introduced": "3.0", "fixed": "3.2.1", "severity": "Medium"},
+    {"id": "PIP-3", "package": "requests", "ecosystem": "pip", "fixed": "2.0", "severity": "High"},
+    {"id": "DEB-1", "package": "openssl", "ecosystem": "dpkg", "fixed": "3.0.2-0ubuntu1.10", "severity": "Critical"},
+    {"id": "RPM-1", "package": "openssl", "ecosystem": "rpm", "introduced": "1:1.1.1", "fixed": "1:1.1.1k-7.el8",
+     "severity": "High"},
+    {"id": "ANY-1", "package": "curl", "introduced": "7.69.0", "fixed": "8.4.0", "severity": "Critical"},
+]
+
+
+def ids(index, name, version, ecosystem=None):
+    return sorted(m["id"] for m in index.lookup(name, version, ecosystem))
+
+
+def test_version_order():
+    ordered = {
+        "pip": ["1.0.dev1", "1.0a1", "1.0rc1", "1.0", "1.0.post1", "1.0.1", "1.10"],
+        "dpkg": ["1.0~rc1", "1.0", "1.0-1", "1.0-1ubuntu1", "1.0-2", "1.0a", "1.0+b1", "1.0.1", "1:0.1"],
+        "rpm": ["1.0~rc1", "1.0", "1.0^post1", "1.0a", "1.0.1", "1.0.1-1.el8", "1.0.1-2.el8", "1:0.1"],
+    }
+    for ecosystem, versions in ordered.items():
+        keys = [version_key(v, ecosystem) for v in versions]
+        for (a, ka), (b, kb) in zip(zip(versions, keys), zip(versions[1:], keys[1:])):
+            assert ka < kb, f"{ecosystem}: expected {a} < {b}"
+    # The dpkg revision is not part of the upstream version
+    assert version_key("1.0-1", "dpkg") != version_key("1.0.1", "dpkg"), "dpkg: 1.0-1 equals 1.0.1"
+    # Unknown ecosystems still keep pre-releases before the release
+    assert version_key("2.0rc1") < version_key("2.0"), "2.0rc1 sorts after 2.0"
+    print("✅ version order per ecosystem")
+
+
+def test_ranges():
+    index = AdvisoryIndex.from_advisories(ADVISORIES)
+    cases = [
+        ("django", "1.11", "pip", []),               # below every range
+        ("django", "2.0", "pip", ["PIP-1"]),          # introduced is inclusive
+        ("django", "2.2.28rc1", "pip", ["PIP-1"]),    # a pre-release of the fix is still vulnerable
+        ("django", "2.2.28", "pip", []),              # fixed is exclusive
+        ("django", "3.2.1.dev1", "pip", ["PIP-2"]),
+        ("django", "3.2.1", "pip", []),
+        ("requests", "2.0rc1", "pip", ["PIP-3"]),
+        ("requests", "2.0", "pip", []),
+        ("openssl", "3.0.2-0ubuntu1.9", "dpkg", ["DEB-1"]),
+        ("openssl", "3.0.2-0ubuntu1.10", "dpkg", []),
+        ("openssl", "3.0.2", "dpkg", ["DEB-1"]),       # no revision sorts before any revision
+        ("openssl", "1:1.1.1k-6.el8", "rpm", ["RPM-1"]),
+        ("openssl", "1:1.1.1k-7.el8", "rpm", []),
+        ("openssl", "1.1.1k-6.el8", "rpm", []),       # epoch 0 is below introduced 1:1.1.1
+        ("curl", "7.88.1-10", "dpkg", ["ANY-1"]),      # advisories without an ecosystem apply to all
+        ("curl", "8.4.0", "rpm", []),
+        ("curl", "8.4.0rc1", None, ["ANY-1"]),
+    ]
+    for name, version, ecosystem, expected in cases:
+        got = ids(index, name, version, ecosystem)
+        assert got == expected, f"{name} {version} ({ecosystem}): expected {expected}, got {got}"
+    print(f"✅ {len(cases)} range and boundary cases")
+
+
+def test_cache_and_updates():
+    with tempfile.TemporaryDirectory() as directory:
+        feed_path = os.path.join(directory, "feed.json")
+        cache_path = os.path.join(directory, "feed.json.idx")
+        update_path = os.path.join(directory, "update.json")
+        with open(feed_path, "w") as f:
+            json.dump({"advisories": ADVISORIES}, f)
+
+        built = load_index(feed_path, cache_path)
+        mapped = load_index(feed_path, cache_path)
+        assert mapped._mapped is not None, "the second load did not use the mmap cache"
+        assert mapped.package_names() == built.package_names()
+        for name in built.package_names():
+            assert mapped.ranges(name) == built.ranges(name), f"{name}: ranges differ after the cache round-trip"
+        assert ids(mapped, "django", "2.2.28rc1", "pip") == ["PIP-1"]
+
+        with open(update_path, "w") as f:
+            json.dump({
+                "advisories": [{"id": "PIP-4", "package": "django", "ecosystem": "pip", "introduced": "4.0",
+                                "fixed": "4.2.2", "severity": "High"}],
+                "withdrawn": ["PIP-2"],
+            }, f)
+        vuln_matcher._index = mapped
+        try:
+            assert apply_feed_update(update_path, cache_path) == 1
+            current = vuln_matcher.get_index()
+            assert current is not mapped, "the update was not swapped in"
+            assert ids(mapped, "django", "3.2.0", "pip") == ["PIP-2"], "the previous index was modified"
+            assert ids(current, "django", "3.2.0", "pip") == [], "withdrawn advisory still matches"
+            assert ids(current, "django", "4.2.2rc1", "pip") == ["PIP-4"]
+        finally:
+            vuln_matcher._index = None
+
+        reloaded = AdvisoryIndex.load(cache_path)
+        assert ids(reloaded, "django", "4.1", "pip") == ["PIP-4"], "the update was not saved to the cache"
+        assert ids(reloaded, "django", "2.1", "pip") == ["PIP-1"]
+    print("✅ mmap cache round-trip and feed updates")
+
+
+if __name__ == "__main__":
+    test_version_order()
+    test_ranges()
+    test_cache_and_updates()